@@ -0,0 +1,302 @@
+"""
+Этот модуль содержит JSON API рецептов для мобильного приложения и
+партнеров: выборку полей, курсорную пагинацию и потоковую выдачу.
+
+Параметр fields (через запятую, например fields=id,dish_name,image)
+определяет поля ответа, а по ним - столбцы таблицы recipe, которые
+выбираются из базы данных: отложенные столбцы ingredients и recipe читаются
+только если запрошены соответствующие поля. Столбцы id и created_at
+выбираются всегда - по ним строится курсор.
+
+Список рецептов упорядочен от новых к старым. Параметр limit задает
+количество рецептов (до API_MAX_PAGE_SIZE), after - курсор из поля
+next_cursor предыдущего ответа. Ответ списка формируется генератором:
+строки читаются из базы данных пачками по API_STREAM_BATCH и сразу
+отдаются клиенту, поэтому потребление памяти не зависит от limit. Курсор
+следующей страницы становится известен после последней записи и
+передается в конце ответа:
+
+    {"items": [...], "next_cursor": "..." | null}
+
+Анонимным клиентам доступны только поля карточек рецептов
+(API_PUBLIC_FIELDS), как и на HTML-страницах, где рецепт целиком
+показывается только после входа. Запрос остальных полей без входа получает
+ответ 403.
+
+Записи кодируются одним заранее созданным json.JSONEncoder без сортировки
+ключей и отступов, а не через jsonify для всего ответа.
+
+Функции модуля:
+
+parse_fields(value: str | None, default: tuple) -> tuple[str, ...]:
+Возвращает поля ответа из параметра fields.
+
+page_limit() -> int:
+Возвращает количество рецептов из параметра limit.
+
+stream_recipes(fields: tuple, limit: int, after: str | None, ...) -> Response:
+Возвращает потоковый ответ со страницей рецептов.
+
+recipe_response(recipe_id: int, fields: tuple) -> Response:
+Возвращает ответ с одним рецептом.
+
+category_validators(slug: str) -> tuple:
+Валидаторы ответа со списком рецептов категории.
+
+json_error(status: int, message: str) -> Response:
+Возвращает ответ с ошибкой в формате JSON.
+
+Переменные модуля:
+
+API_FIELDS:
+Поля ответа: столбцы модели Recipe и функции получения значения.
+
+API_PUBLIC_FIELDS:
+Поля, доступные без входа.
+
+API_LIST_FIELDS:
+Поля списка рецептов по умолчанию.
+"""
+import json
+from datetime import datetime
+from operator import attrgetter
+from typing import Any, Iterator
+
+from flask import Response, abort, request, stream_with_context
+from flask_login import current_user
+from sqlalchemy import select
+
+from app import app, db
+from business_logic import image_variants
+from cache import INDEX_CACHE_TAG
+from categories import categories_by_name, categories_by_slug
+from http_cache import feed_validators
+from ingredients import parse_ingredients_cached
+from models import Recipe
+from pagination import encode_cursor, keyset_after
+
+_encoder = json.JSONEncoder(
+    ensure_ascii=False, check_circular=False, separators=(',', ':')
+)
+
+
+def _category(row: Any) -> str | None:
+    category = categories_by_name.get(row.food_category)
+    return category and category.slug
+
+
+def _ingredients(row: Any) -> list[dict]:
+    return [item._asdict()
+            for item in parse_ingredients_cached(row.ingredients)]
+
+
+def _image(row: Any) -> str | None:
+    return row.file_path and f'/{row.file_path}'
+
+
+def _image_variants(row: Any) -> dict:
+    value = image_variants(row.image_variants)
+    return {
+        'placeholder': value['placeholder'],
+        'variants': [
+            {'width': width, 'webp': f'/{webp}', 'jpeg': f'/{jpeg}'}
+            for width, webp, jpeg in value['variants']
+        ],
+    }
+
+
+API_FIELDS = {
+    'id': (('id',), attrgetter('id')),
+    'dish_name': (('dish_name',), attrgetter('dish_name')),
+    'food_category': (('food_category',), attrgetter('food_category')),
+    'category': (('food_category',), _category),
+    'cooking_time': (('cooking_time',), attrgetter('cooking_time')),
+    'ingredients': (('ingredients',), _ingredients),
+    'recipe': (('recipe',), attrgetter('recipe')),
+    'image': (('file_path',), _image),
+    'image_variants': (('image_variants',), _image_variants),
+    'author': (('id_user',), attrgetter('id_user')),
+    'created_at': (('created_at',), lambda row: row.created_at.isoformat()),
+}
+API_PUBLIC_FIELDS = ('id', 'dish_name', 'food_category', 'category',
+                     'image', 'image_variants', 'created_at')
+API_LIST_FIELDS = ('id', 'dish_name', 'food_category', 'category', 'image',
+                   'created_at')
+
+
+def json_error(status: int, message: str) -> Response:
+    """
+    Возвращает ответ с ошибкой в формате JSON: {"error": message}.
+
+    :param status: код ответа
+    :type status: int
+    :param message: описание ошибки
+    :type message: str
+    :return: HTTP-ответ
+    :rtype: Response
+    """
+    return Response(
+        _encoder.encode({'error': message}),
+        status=status,
+        mimetype='application/json',
+    )
+
+
+def parse_fields(value: str | None, default: tuple) -> tuple[str, ...]:
+    """
+    Возвращает поля ответа из параметра fields в порядке запроса без
+    повторов. Для пустого параметра возвращает default. Запрос с
+    неизвестным полем прерывается ответом 400, запрос полей не из
+    API_PUBLIC_FIELDS без входа - ответом 403.
+
+    :param value: значение параметра fields
+    :type value: str | None
+    :param default: поля по умолчанию
+    :type default: tuple
+    :return: имена полей из API_FIELDS
+    :rtype: tuple[str, ...]
+    """
+    fields = tuple(dict.fromkeys(
+        name.strip() for name in (value or '').split(',') if name.strip()
+    )) or default
+    unknown = [name for name in fields if name not in API_FIELDS]
+    if unknown:
+        abort(json_error(400, f'Неизвестные поля: {", ".join(unknown)}. '
+                              f'Доступные: {", ".join(API_FIELDS)}'))
+    private = [name for name in fields if name not in API_PUBLIC_FIELDS]
+    if private and not current_user.is_authenticated:
+        # 401 приложение заменяет перенаправлением на страницу входа.
+        abort(json_error(403, f'Поля {", ".join(private)} доступны только '
+                              f'после входа'))
+    return fields
+
+
+def page_limit() -> int:
+    """
+    Возвращает количество рецептов из параметра limit запроса: по
+    умолчанию API_PAGE_SIZE, не больше API_MAX_PAGE_SIZE.
+
+    :return: количество рецептов
+    :rtype: int
+    """
+    limit = request.args.get('limit', type=int)
+    if limit is None:
+        return app.config['API_PAGE_SIZE']
+    return min(max(limit, 1), app.config['API_MAX_PAGE_SIZE'])
+
+
+def _columns(fields: tuple) -> list:
+    names = dict.fromkeys(('id', 'created_at'))
+    for field in fields:
+        names.update(dict.fromkeys(API_FIELDS[field][0]))
+    return [getattr(Recipe, name) for name in names]
+
+
+def _serializer(fields: tuple):
+    getters = [(name, API_FIELDS[name][1]) for name in fields]
+
+    def serialize(row: Any) -> str:
+        return _encoder.encode(
+            {name: getter(row) for name, getter in getters}
+        )
+    return serialize
+
+
+def stream_recipes(
+        fields: tuple,
+        limit: int,
+        after: str | None = None,
+        **filters,
+) -> Response:
+    """
+    Возвращает потоковый ответ со страницей рецептов от новых к старым.
+
+    Запрос выбирает только столбцы полей fields и одну запись сверх limit,
+    чтобы без COUNT(*) узнать, есть ли следующая страница. Строки читаются
+    пачками по API_STREAM_BATCH во время отдачи ответа.
+
+    :param fields: поля ответа из API_FIELDS
+    :type fields: tuple
+    :param limit: количество рецептов
+    :type limit: int
+    :param after: курсор последней записи предыдущей страницы
+    :type after: str | None
+    :param filters: условия для filter_by, например food_category
+    :type filters: dict
+    :return: HTTP-ответ application/json без Content-Length
+    :rtype: Response
+    """
+    query = keyset_after(
+        select(*_columns(fields)).filter_by(**filters),
+        Recipe.created_at,
+        Recipe.id,
+        after,
+    ).limit(limit + 1)
+    return Response(
+        stream_with_context(_generate(query, _serializer(fields), limit)),
+        mimetype='application/json',
+    )
+
+
+def _generate(query: Any, serialize, limit: int) -> Iterator[bytes]:
+    batch = app.config['API_STREAM_BATCH']
+    result = db.session.execute(
+        query.execution_options(yield_per=batch)
+    )
+    parts = ['{"items":[']
+    next_cursor = None
+    count = 0
+    last = None
+    try:
+        for row in result:
+            if count == limit:
+                next_cursor = encode_cursor(last.created_at, last.id)
+                break
+            parts.append(',' + serialize(row) if count else serialize(row))
+            count += 1
+            last = row
+            # Пачки строк отдаются целиком: мелкие части ухудшают сжатие
+            # потокового ответа (см. модуль compression).
+            if count % batch == 0:
+                yield ''.join(parts).encode()
+                parts = []
+    finally:
+        result.close()
+    parts.append(f'],"next_cursor":{_encoder.encode(next_cursor)}}}')
+    yield ''.join(parts).encode()
+
+
+def recipe_response(recipe_id: int, fields: tuple) -> Response:
+    """
+    Возвращает ответ с одним рецептом или ответ 404, если рецепта нет.
+
+    :param recipe_id: идентификатор рецепта
+    :type recipe_id: int
+    :param fields: поля ответа из API_FIELDS
+    :type fields: tuple
+    :return: HTTP-ответ
+    :rtype: Response
+    """
+    row = db.session.execute(
+        select(*_columns(fields)).where(Recipe.id == recipe_id)
+    ).first()
+    if row is None:
+        return json_error(404, 'Рецепт не найден')
+    return Response(_serializer(fields)(row), mimetype='application/json')
+
+
+def category_validators(slug: str) -> tuple[str, datetime | None]:
+    """
+    Вычисляет валидаторы списка рецептов категории по версии ее ленты:
+    в отличие от HTML-страниц, ответ API не содержит количества рецептов
+    других категорий. Для неизвестной категории используется версия
+    главной ленты.
+
+    :param slug: адрес категории из реестра categories
+    :type slug: str
+    :return: (etag, last_modified)
+    :rtype: tuple
+    """
+    category = categories_by_slug.get(slug)
+    tag = category.name if category is not None else INDEX_CACHE_TAG
+    return feed_validators(tag)()
@@ -2,6 +2,10 @@
 Модуль приложения Flask для создания блога.
 
 Модуль содержит объект приложения Flask, настройки базы данных и конфигурации.
+Любую настройку можно переопределить переменной окружения с префиксом FLASK_.
+Секретный ключ берется из FLASK_SECRET_KEY или из файла instance/secret_key,
+который создается при первом запуске, поэтому сессии действительны во всех
+процессах приложения и после перезапуска.
 Также включает настройки инструментов отладки, Toastr для вывода уведомлений,
 LoginManager для управления авторизацией и конфигурации для загрузки файлов.
 
@@ -14,39 +18,358 @@ LoginManager для управления авторизацией и конфи
         Объект LoginManager для управления авторизацией.
     toastr: Toastr
         Объект Toastr для вывода уведомлений.
-    toolbar: DebugToolbarExtension
-        Объект DebugToolbarExtension для настройки инструментов отладки.
+    toolbar: DebugToolbarExtension | None
+        Объект DebugToolbarExtension для настройки инструментов отладки,
+        None вне режима отладки.
+
+Функции:
+    load_secret_key(path: str) -> str
+        Возвращает постоянный секретный ключ, создавая файл при первом
+        запуске.
+    set_sqlite_pragmas(dbapi_connection, connection_record) -> None
+        Применяет SQLITE_PRAGMAS к новому соединению с базой данных.
+    create_bytecode_cache(directory: str) -> FileSystemBytecodeCache
+        Возвращает кэш скомпилированных шаблонов Jinja в каталоге.
 
 Константы:
+    SQLITE_PRAGMAS: dict
+        Настройки PRAGMA, применяемые к каждому соединению с SQLite.
     UPLOAD_FOLDER: str
         Директория для загрузки файлов.
+    UPLOAD_STORAGE: str
+        Хранилище загружаемых файлов: 'local' или 'memory' (для тестов).
     ALLOWED_EXTENSIONS: set
         Разрешенные типы файлов для загрузки.
+    ASSETS_FOLDER: str
+        Директория собранных статических файлов с отпечатками содержимого
+        в именах, см. модуль assets.
+    ASSETS_EXCLUDE: tuple
+        Поддиректории static, которые не собираются.
+    TEMPLATE_CACHE_DIR: str
+        Каталог кэша скомпилированных шаблонов Jinja (байт-код), общего
+        для процессов приложения; кэш включается настройкой
+        TEMPLATE_BYTECODE_CACHE.
+    COMPRESS_MIMETYPES: tuple
+        Типы содержимого ответов, сжимаемых gzip или brotli, см. модуль
+        compression.
+    COMPRESS_MIN_SIZE: int
+        Минимальный размер сжимаемого ответа в байтах.
+    COMPRESS_LEVEL: int
+        Уровень сжатия gzip от 1 до 9.
+    COMPRESS_BROTLI_QUALITY: int
+        Качество сжатия brotli от 0 до 11.
+    RECIPES_PER_PAGE: int
+        Количество рецептов на одной странице ленты по умолчанию.
+    MAX_RECIPES_PER_PAGE: int
+        Максимальный размер страницы, который можно запросить параметром
+        per_page.
+    API_PAGE_SIZE: int
+        Количество рецептов в ответе /api/ по умолчанию.
+    API_MAX_PAGE_SIZE: int
+        Максимальное количество рецептов, которое можно запросить
+        параметром limit.
+    API_STREAM_BATCH: int
+        Количество строк, которые читаются из базы данных и отдаются
+        клиенту за раз в потоковых ответах /api/.
+    IMAGE_VARIANT_WIDTHS: tuple
+        Ширины уменьшенных копий загруженных фотографий.
+    IMAGE_VARIANT_QUALITY: int
+        Качество сжатия уменьшенных копий.
+    JOB_WORKERS: int
+        Количество потоков-исполнителей фоновых задач в процессе.
+    JOB_POLL_INTERVAL: float
+        Интервал опроса очереди задач в секундах.
+    JOB_RETRY_DELAY: int
+        Задержка перед первым повтором упавшей задачи в секундах.
+    JOB_STALE_TIMEOUT: int
+        Время, через которое задача в состоянии running считается зависшей.
+    PAGE_CACHE_MAX_ENTRIES: int
+        Максимальное количество страниц в кэше страниц.
+    PAGE_CACHE_MAX_BYTES: int
+        Максимальный суммарный размер кэша страниц в байтах.
+    USER_CACHE_MAX_ENTRIES: int
+        Максимальное количество пользователей в кэше загрузчика
+        пользователей Flask-Login.
+    USER_CACHE_TTL: float
+        Время жизни записи кэша пользователей в секундах: через столько
+        изменения пользователя в другом процессе становятся видны.
+    PASSWORD_HASH_METHOD: str
+        Алгоритм и количество итераций хэширования паролей в формате
+        werkzeug.security.
+    PASSWORD_HASH_WORKERS: int
+        Количество процессов пула хэширования паролей, 0 - хэширование в
+        потоке запроса.
+    PASSWORD_HASH_QUEUE: int
+        Максимальное количество одновременных операций с паролями.
+    PASSWORD_HASH_TIMEOUT: int
+        Время ожидания свободного места в очереди хэширования в секундах.
+    RATELIMIT_POLICIES: dict
+        Правила ограничения частоты запросов по именам представлений,
+        см. модуль ratelimit. Хранилище корзин задается настройкой
+        RATELIMIT_BACKEND: 'memory' или 'sqlite' (общее для процессов).
+    RATELIMIT_EXEMPT: tuple
+        Представления, к которым не применяется правило '*'.
+    PROFILE_SAMPLE_RATE: float
+        Доля запросов, профилируемых cProfile, если включено профилирование
+        (PROFILE_ENABLED).
+    PROFILE_SLOW_THRESHOLD: float
+        Длительность запроса в секундах, начиная с которой сохраняются
+        его стеки.
+    PROFILE_MAX_FILES: int
+        Максимальное количество файлов в каталоге профилей PROFILE_DIR.
+    PROFILE_SAMPLER_INTERVAL: float
+        Интервал снятия стеков медленных запросов в секундах.
 """
 
-import uuid
+import os
+import secrets
+import sqlite3
 
 from flask import Flask
 from flask_debugtoolbar import DebugToolbarExtension
 from flask_login import LoginManager
 from flask_sqlalchemy import SQLAlchemy
 from flask_toastr import Toastr
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 app = Flask(__name__)
 
-app.config['SECRET_KEY'] = str(uuid.uuid4())
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
-db = SQLAlchemy(app)
 
-manager = LoginManager(app)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -16000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+app.config['SQLITE_PRAGMAS'] = SQLITE_PRAGMAS
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': 10,
+    'max_overflow': 20,
+    'pool_timeout': 30,
+}
 
-toastr = Toastr(app)
 app.config['TOASTR_SHOW_METHOD'] = 'show'
 app.config['TOASTR_TIMEOUT'] = 5000
 
 UPLOAD_FOLDER = 'static/uploads'
 ALLOWED_EXTENSIONS = ('png', 'jpg', 'jpeg', 'gif')
+UPLOAD_STORAGE = 'local'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['UPLOAD_STORAGE'] = UPLOAD_STORAGE
 app.config['MAX_CONTENT_LENGTH'] = 3 * 1024 * 1024
 
-toolbar = DebugToolbarExtension(app)
+ASSETS_FOLDER = 'static/build'
+ASSETS_EXCLUDE = ('uploads', 'build')
+app.config['ASSETS_FOLDER'] = ASSETS_FOLDER
+app.config['ASSETS_EXCLUDE'] = ASSETS_EXCLUDE
+app.config['ASSETS_BUILD_ON_START'] = True
+
+TEMPLATE_CACHE_DIR = os.path.join(app.instance_path, 'jinja_cache')
+app.config['TEMPLATE_BYTECODE_CACHE'] = True
+app.config['TEMPLATE_CACHE_DIR'] = TEMPLATE_CACHE_DIR
+
+COMPRESS_MIMETYPES = (
+    'text/html', 'text/css', 'text/plain', 'text/javascript',
+    'application/javascript', 'application/json', 'image/svg+xml',
+)
+COMPRESS_MIN_SIZE = 500
+COMPRESS_LEVEL = 6
+COMPRESS_BROTLI_QUALITY = 4
+app.config['COMPRESS_ENABLED'] = True
+app.config['COMPRESS_MIMETYPES'] = COMPRESS_MIMETYPES
+app.config['COMPRESS_MIN_SIZE'] = COMPRESS_MIN_SIZE
+app.config['COMPRESS_LEVEL'] = COMPRESS_LEVEL
+app.config['COMPRESS_BROTLI_QUALITY'] = COMPRESS_BROTLI_QUALITY
+
+IMAGE_VARIANT_WIDTHS = (320, 640, 1024)
+IMAGE_VARIANT_QUALITY = 75
+app.config['IMAGE_VARIANT_WIDTHS'] = IMAGE_VARIANT_WIDTHS
+app.config['IMAGE_VARIANT_QUALITY'] = IMAGE_VARIANT_QUALITY
+
+RECIPES_PER_PAGE = 24
+MAX_RECIPES_PER_PAGE = 100
+app.config['RECIPES_PER_PAGE'] = RECIPES_PER_PAGE
+app.config['MAX_RECIPES_PER_PAGE'] = MAX_RECIPES_PER_PAGE
+
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+API_STREAM_BATCH = 200
+app.config['API_PAGE_SIZE'] = API_PAGE_SIZE
+app.config['API_MAX_PAGE_SIZE'] = API_MAX_PAGE_SIZE
+app.config['API_STREAM_BATCH'] = API_STREAM_BATCH
+
+JOB_WORKERS = 2
+JOB_POLL_INTERVAL = 1.0
+JOB_RETRY_DELAY = 5
+JOB_STALE_TIMEOUT = 600
+app.config['JOB_WORKERS'] = JOB_WORKERS
+app.config['JOB_POLL_INTERVAL'] = JOB_POLL_INTERVAL
+app.config['JOB_RETRY_DELAY'] = JOB_RETRY_DELAY
+app.config['JOB_STALE_TIMEOUT'] = JOB_STALE_TIMEOUT
+
+PAGE_CACHE_MAX_ENTRIES = 512
+PAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+app.config['PAGE_CACHE_ENABLED'] = True
+app.config['PAGE_CACHE_MAX_ENTRIES'] = PAGE_CACHE_MAX_ENTRIES
+app.config['PAGE_CACHE_MAX_BYTES'] = PAGE_CACHE_MAX_BYTES
+
+USER_CACHE_MAX_ENTRIES = 10000
+USER_CACHE_TTL = 60
+app.config['USER_CACHE_MAX_ENTRIES'] = USER_CACHE_MAX_ENTRIES
+app.config['USER_CACHE_TTL'] = USER_CACHE_TTL
+
+PASSWORD_HASH_METHOD = 'pbkdf2:sha256:260000'
+PASSWORD_HASH_WORKERS = 2
+PASSWORD_HASH_QUEUE = 32
+PASSWORD_HASH_TIMEOUT = 5
+app.config['PASSWORD_HASH_METHOD'] = PASSWORD_HASH_METHOD
+app.config['PASSWORD_HASH_WORKERS'] = PASSWORD_HASH_WORKERS
+app.config['PASSWORD_HASH_QUEUE'] = PASSWORD_HASH_QUEUE
+app.config['PASSWORD_HASH_TIMEOUT'] = PASSWORD_HASH_TIMEOUT
+
+RATELIMIT_POLICIES = {
+    '*': [{'limit': 300, 'period': 60, 'scope': 'ip'}],
+    'input_user': [
+        {'limit': 10, 'period': 60, 'scope': 'ip', 'methods': ['POST']},
+    ],
+    'register': [
+        {'limit': 5, 'period': 3600, 'scope': 'ip', 'methods': ['POST']},
+    ],
+    'recipe_create': [
+        {'limit': 30, 'period': 3600, 'scope': 'user', 'methods': ['POST']},
+    ],
+    'search': [{'limit': 60, 'period': 60, 'scope': 'user'}],
+}
+RATELIMIT_EXEMPT = ('static', 'assets', 'metrics')
+app.config['RATELIMIT_ENABLED'] = True
+app.config['RATELIMIT_BACKEND'] = 'memory'
+app.config['RATELIMIT_SQLITE_PATH'] = os.path.join(
+    app.instance_path, 'ratelimit.db'
+)
+app.config['RATELIMIT_POLICIES'] = RATELIMIT_POLICIES
+app.config['RATELIMIT_EXEMPT'] = RATELIMIT_EXEMPT
+
+PROFILE_SAMPLE_RATE = 0.01
+PROFILE_SLOW_THRESHOLD = 1.0
+PROFILE_MAX_FILES = 200
+PROFILE_SAMPLER_INTERVAL = 0.01
+app.config['PROFILE_ENABLED'] = False
+app.config['PROFILE_DIR'] = os.path.join(app.instance_path, 'profiles')
+app.config['PROFILE_SAMPLE_RATE'] = PROFILE_SAMPLE_RATE
+app.config['PROFILE_SLOW_THRESHOLD'] = PROFILE_SLOW_THRESHOLD
+app.config['PROFILE_MAX_FILES'] = PROFILE_MAX_FILES
+app.config['PROFILE_SAMPLER_INTERVAL'] = PROFILE_SAMPLER_INTERVAL
+app.config['PROFILE_ADMINS'] = ()
+# Токен сборщика показателей /metrics (заголовок Authorization: Bearer).
+# Без токена показатели доступны только пользователям из PROFILE_ADMINS.
+app.config['METRICS_TOKEN'] = None
+
+# Переменные окружения FLASK_* переопределяют настройки выше, например
+# FLASK_SECRET_KEY или FLASK_SQLALCHEMY_DATABASE_URI.
+app.config.from_prefixed_env()
+
+# FLASK_PROFILE_ADMINS задается JSON-списком или логинами через запятую.
+# Строка приводится к множеству: иначе проверка "login in admins" искала бы
+# подстроку.
+_admins = app.config['PROFILE_ADMINS']
+if isinstance(_admins, str):
+    _admins = _admins.split(',')
+app.config['PROFILE_ADMINS'] = frozenset(
+    login.strip() for login in _admins if login.strip()
+)
+
+
+def load_secret_key(path: str) -> str:
+    """
+    Возвращает секретный ключ из файла path. Если файла нет, создает его
+    со случайным ключом. Файл создается атомарно, поэтому все процессы
+    приложения, запущенные одновременно, получают один и тот же ключ.
+
+    :param path: путь к файлу ключа
+    :type path: str
+    :return: секретный ключ
+    :rtype: str
+    """
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}'
+        with open(temp_path, 'w') as file:
+            file.write(secrets.token_hex(32))
+        os.chmod(temp_path, 0o600)
+        try:
+            os.link(temp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temp_path)
+    with open(path) as file:
+        return file.read().strip()
+
+
+if not app.config.get('SECRET_KEY'):
+    app.config['SECRET_KEY'] = load_secret_key(
+        os.path.join(app.instance_path, 'secret_key')
+    )
+
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """
+    Настраивает каждое новое соединение с SQLite: журнал WAL позволяет
+    читателям работать параллельно с записью, synchronous=NORMAL убирает
+    fsync при каждой фиксации транзакции, busy_timeout заставляет ждать
+    блокировку вместо ошибки "database is locked".
+
+    :param dbapi_connection: соединение sqlite3
+    :param connection_record: запись пула соединений
+    :return: None
+    """
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in app.config['SQLITE_PRAGMAS'].items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+    cursor.close()
+
+
+def create_bytecode_cache(directory: str) -> FileSystemBytecodeCache:
+    """
+    Возвращает кэш байт-кода шаблонов Jinja в каталоге directory. Новый
+    процесс приложения загружает из него уже скомпилированные шаблоны
+    вместо разбора исходного текста. Запись в кэше привязана к контрольной
+    сумме исходного текста шаблона, поэтому измененный шаблон
+    компилируется заново.
+
+    :param directory: каталог кэша
+    :type directory: str
+    :return: кэш байт-кода
+    :rtype: jinja2.FileSystemBytecodeCache
+    """
+    os.makedirs(directory, exist_ok=True)
+    return FileSystemBytecodeCache(directory)
+
+
+# Окружение Jinja создается при первом обращении к app.jinja_env
+# (Toastr ниже), поэтому кэш задается до этого.
+if app.config['TEMPLATE_BYTECODE_CACHE']:
+    app.jinja_options = {
+        **app.jinja_options,
+        'bytecode_cache': create_bytecode_cache(
+            app.config['TEMPLATE_CACHE_DIR']
+        ),
+    }
+
+db = SQLAlchemy(app)
+
+manager = LoginManager(app)
+
+toastr = Toastr(app)
+
+# Панель отладки добавляет работу к каждому ответу, поэтому подключается
+# только в режиме отладки (FLASK_DEBUG=1).
+toolbar = DebugToolbarExtension(app) if app.debug else None
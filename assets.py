@@ -0,0 +1,198 @@
+"""
+Этот модуль содержит сборку статических файлов с отпечатками содержимого
+в именах и их раздачу.
+
+Сборка копирует файлы каталога static (кроме ASSETS_EXCLUDE) в
+ASSETS_FOLDER под именами с первыми символами SHA-256 содержимого:
+img/backgraund_cooking.jpg -> img/backgraund_cooking.3f2a9c1b4d5e.jpg.
+Текстовые файлы (CSS, JS, SVG) дополнительно сжимаются заранее в .gz и,
+если установлен пакет brotli, в .br. Соответствие исходных и собранных
+имен записывается в manifest.json. Файл с уже существующим отпечатком не
+пересобирается, поэтому сборка при запуске приложения
+(ASSETS_BUILD_ON_START) сжимает только измененные файлы. Старые версии
+файлов не удаляются: страницы, отданные до обновления, продолжают
+ссылаться на них.
+
+Содержимое файла по собранному адресу никогда не меняется, поэтому
+/assets/ отдает его с заголовком Cache-Control: immutable и сроком
+кэширования один год. Сжатый вариант выбирается по Accept-Encoding.
+
+Функции модуля:
+
+build_assets(source: str, target: str, exclude: tuple) -> dict:
+Собирает статические файлы и возвращает манифест.
+
+asset_url(filename: str) -> str:
+Возвращает адрес статического файла с отпечатком (функция шаблонов).
+
+send_asset(filename: str) -> Response:
+Отдает собранный файл, сжатый по Accept-Encoding.
+
+Переменные модуля:
+
+manifest:
+Соответствие исходных имен файлов собранным.
+
+built_files:
+Собранные имена файлов, которые отдает send_asset.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+from flask import Response, abort, request, send_from_directory, url_for
+
+from app import app
+
+try:
+    import brotli
+except ImportError:  # .br не создаются, отдается gzip
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt')
+MANIFEST_NAME = 'manifest.json'
+FINGERPRINT_LENGTH = 12
+MAX_AGE = 365 * 24 * 3600
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    # Несколько процессов могут собирать файлы одновременно: файл
+    # появляется под итоговым именем только целиком.
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(data)
+    os.replace(temp_path, path)
+
+
+def _compress(path: str, data: bytes) -> None:
+    compressed = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressed['.br'] = brotli.compress(data, quality=11)
+    for suffix, content in compressed.items():
+        if len(content) < len(data):
+            _write_atomic(path + suffix, content)
+
+
+def build_assets(source: str, target: str, exclude: tuple = ()) -> dict:
+    """
+    Копирует файлы каталога source в target под именами с отпечатками
+    содержимого, сжимает текстовые файлы и записывает manifest.json.
+
+    :param source: каталог исходных статических файлов
+    :type source: str
+    :param target: каталог собранных файлов
+    :type target: str
+    :param exclude: поддиректории source, которые не собираются
+    :type exclude: tuple
+    :return: манифест {исходное имя: собранное имя}
+    :rtype: dict
+    """
+    result = {}
+    for root, dirs, files in os.walk(source):
+        relative_root = os.path.relpath(root, source)
+        dirs[:] = sorted(
+            name for name in dirs if not name.startswith('.')
+            and os.path.normpath(os.path.join(relative_root, name))
+            not in exclude
+        )
+        for name in sorted(files):
+            if name.startswith('.'):
+                continue
+            filename = os.path.normpath(
+                os.path.join(relative_root, name)
+            ).replace(os.sep, '/')
+            with open(os.path.join(root, name), 'rb') as file:
+                data = file.read()
+            stem, extension = os.path.splitext(filename)
+            digest = hashlib.sha256(data).hexdigest()[:FINGERPRINT_LENGTH]
+            built = f'{stem}.{digest}{extension}'
+            path = os.path.join(target, built)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if extension in COMPRESSIBLE_EXTENSIONS:
+                    _compress(path, data)
+                # Оригинал записывается последним: если он есть, сжатые
+                # варианты уже готовы.
+                _write_atomic(path, data)
+            result[filename] = built
+    os.makedirs(target, exist_ok=True)
+    _write_atomic(
+        os.path.join(target, MANIFEST_NAME),
+        json.dumps(result, indent=2, sort_keys=True).encode(),
+    )
+    return result
+
+
+def _load_manifest(target: str) -> dict:
+    try:
+        with open(os.path.join(target, MANIFEST_NAME)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+@app.template_global()
+def asset_url(filename: str) -> str:
+    """
+    Возвращает адрес собранного файла с отпечатком содержимого. В режиме
+    отладки и для файлов, которых нет в манифесте, возвращает обычный
+    адрес static, чтобы изменения были видны без сборки.
+
+    :param filename: путь файла относительно static
+    :type filename: str
+    :return: URL файла
+    :rtype: str
+    """
+    built = manifest.get(filename)
+    if built is None or app.debug:
+        return url_for('static', filename=filename)
+    return url_for('assets', filename=built)
+
+
+def send_asset(filename: str) -> Response:
+    """
+    Отдает собранный файл с заголовками бессрочного кэширования. Если
+    клиент принимает br или gzip и для файла есть сжатый вариант, отдается
+    он с заголовком Content-Encoding.
+
+    :param filename: собранное имя файла из манифеста
+    :type filename: str
+    :return: HTTP-ответ
+    :rtype: flask.wrappers.Response
+    """
+    if filename not in built_files:
+        abort(404)
+    folder = os.path.abspath(app.config['ASSETS_FOLDER'])
+    mimetype = mimetypes.guess_type(filename)[0] \
+        or 'application/octet-stream'
+    compressible = filename.endswith(COMPRESSIBLE_EXTENSIONS)
+    encoding = None
+    for name, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[name] \
+                and os.path.isfile(os.path.join(folder, filename + suffix)):
+            encoding = name
+            filename += suffix
+            break
+    response = send_from_directory(
+        folder, filename, mimetype=mimetype, max_age=MAX_AGE
+    )
+    if encoding is not None:
+        response.content_encoding = encoding
+    if compressible:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+if app.config['ASSETS_BUILD_ON_START']:
+    manifest = build_assets(
+        app.static_folder,
+        app.config['ASSETS_FOLDER'],
+        app.config['ASSETS_EXCLUDE'],
+    )
+else:
+    manifest = _load_manifest(app.config['ASSETS_FOLDER'])
+built_files = frozenset(manifest.values())
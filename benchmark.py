@@ -0,0 +1,878 @@
+"""
+Нагрузочный тест страниц приложения на синтетических данных.
+
+Скрипт создает отдельную базу данных instance/bench-<rows>.db и заполняет
+ее воспроизводимыми (по --seed) пользователями и рецептами с реалистичными
+строками ингредиентов и фотографиями, затем запрашивает каждую страницу
+приложения и выводит задержку p50/p95/p99, пропускную способность,
+количество SQL-запросов на запрос и пиковый объем памяти процесса.
+Результат записывается в JSON и может быть сравнен с результатом
+предыдущего запуска:
+
+    python benchmark.py --rows 1000 --output before.json
+    python benchmark.py --rows 1000 --output after.json --baseline before.json
+
+Типичные объемы данных: 1000, 100000 и 1000000 рецептов. База создается
+один раз и используется повторно, --regenerate создает ее заново.
+
+По умолчанию запросы выполняются тестовым клиентом Flask в текущем
+процессе. С параметром --url запросы отправляются по HTTP в --concurrency
+потоков на запущенный сервер, который должен использовать ту же базу:
+
+    FLASK_SQLALCHEMY_DATABASE_URI=sqlite:///bench-1000.db \\
+    FLASK_RATELIMIT_ENABLED=false gunicorn -c gunicorn.conf.py wsgi:app
+    python benchmark.py --rows 1000 --url http://127.0.0.1:8000
+
+С параметром --encoding запросы отправляются с заголовком Accept-Encoding
+(gzip или br). Для каждой страницы выводится размер ответа в байтах (для
+сжатых ответов - после сжатия) и, для тестового клиента, процессорное время
+на запрос; сравнение запусков с --encoding identity и --encoding br
+показывает выигрыш в трафике и стоимость сжатия:
+
+    python benchmark.py --encoding identity --output identity.json
+    python benchmark.py --encoding br --output br.json --baseline identity.json
+
+С параметром --ingredients вместо страниц измеряется рендеринг списка
+ингредиентов рецепта: прежний разбор строки в шаблоне через split и
+готовый список Recipe.ingredient_list.
+
+С параметром --templates измеряется прогрев процесса: загрузка всех
+шаблонов приложения в новое окружение Jinja с компиляцией исходного текста
+и из кэша байт-кода (TEMPLATE_CACHE_DIR), а также рендеринг страницы
+категории.
+
+Приложение импортируется после настройки переменных окружения FLASK_*,
+поэтому модули приложения импортируются внутри функций.
+
+Функции модуля:
+
+generate_data(rows: int, users: int, seed: int, images: int) -> None:
+Заполняет базу данных синтетическими пользователями и рецептами.
+
+benchmark_routes() -> list[tuple[str, str, bool]]:
+Возвращает проверяемые страницы.
+
+run_client(path: str, authenticated: bool, iterations: int,
+           warmup: int, encoding: str) -> dict:
+Измеряет страницу тестовым клиентом Flask.
+
+run_http(base_url: str, path: str, cookie: str | None, iterations: int,
+         concurrency: int, encoding: str) -> dict:
+Измеряет страницу по HTTP.
+
+run_mixed(base_url: str, path: str, duration: float, page_threads: int,
+          login_threads: int) -> dict:
+Измеряет пропускную способность страницы при одновременных входах.
+
+benchmark_ingredients(iterations: int, seed: int) -> dict:
+Измеряет рендеринг списка ингредиентов с разбором в шаблоне и без него.
+
+benchmark_templates(iterations: int) -> dict:
+Измеряет загрузку шаблонов с компиляцией и из кэша байт-кода и рендеринг
+страницы категории.
+
+compare(result: dict, baseline: dict, threshold: float) -> list[str]:
+Сравнивает результат с базовым и возвращает список ухудшений.
+"""
+import argparse
+import datetime
+import http.client
+import io
+import json
+import math
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+BENCHMARK_PASSWORD = 'benchmark'
+BENCHMARK_LOGIN = 'user0'
+BENCHMARK_EMAIL = f'{BENCHMARK_LOGIN}@example.com'
+
+DISHES = (
+    'борщ', 'суп', 'щи', 'солянка', 'рагу', 'плов', 'котлеты', 'пирог',
+    'салат', 'запеканка', 'блины', 'оладьи', 'вареники', 'пельмени',
+    'жаркое', 'гуляш', 'торт', 'кекс', 'варенье', 'соленья',
+)
+ADJECTIVES = (
+    'домашний', 'быстрый', 'бабушкин', 'праздничный', 'летний', 'зимний',
+    'сытный', 'легкий', 'пряный', 'овощной', 'мясной', 'грибной',
+)
+INGREDIENTS = (
+    ('Картофель', 'шт'), ('Лук репчатый', 'шт'), ('Морковь', 'шт'),
+    ('Свекла', 'шт'), ('Капуста белокочанная', 'г'), ('Говядина', 'г'),
+    ('Свинина', 'г'), ('Курица', 'г'), ('Фарш', 'г'), ('Грибы', 'г'),
+    ('Мука', 'г'), ('Сахар', 'г'), ('Соль', 'ч. л.'), ('Перец', 'ч. л.'),
+    ('Масло сливочное', 'г'), ('Масло растительное', 'ст. л.'),
+    ('Молоко', 'мл'), ('Кефир', 'мл'), ('Сметана', 'ст. л.'),
+    ('Яйцо', 'шт'), ('Чеснок', 'зубчик'), ('Томатная паста', 'ст. л.'),
+    ('Рис', 'г'), ('Гречка', 'г'), ('Сыр', 'г'), ('Творог', 'г'),
+    ('Яблоки', 'шт'), ('Ежевика', 'г'), ('Укроп', 'пучок'),
+    ('Петрушка', 'пучок'), ('Лавровый лист', 'шт'), ('Дрожжи', 'г'),
+)
+STEPS = (
+    'Овощи вымыть и очистить.',
+    'Лук мелко нарезать и обжарить до золотистого цвета.',
+    'Мясо нарезать кусочками и обжарить на сильном огне.',
+    'Залить водой, довести до кипения и снять пену.',
+    'Варить на медленном огне под крышкой 40 минут.',
+    'Добавить специи и соль по вкусу.',
+    'Замесить тесто и оставить на 30 минут.',
+    'Выпекать в разогретой до 180 градусов духовке.',
+    'Перед подачей посыпать зеленью.',
+    'Дать настояться 10 минут и подавать горячим.',
+)
+
+# Список ингредиентов open_recept.html до и после Recipe.ingredient_list.
+SPLIT_INGREDIENTS_TEMPLATE = (
+    "{% for ingredient in recept.ingredients.split(';') %}"
+    "<li>Ингридиент: {{ ingredient.split(',')[0] }} "
+    "Кол-во: {{ ingredient.split(',')[1] }} "
+    "Мера: {{ ingredient.split(',')[2] }}</li>"
+    "{% endfor %}"
+)
+LIST_INGREDIENTS_TEMPLATE = (
+    "{% for ingredient in recept.ingredient_list %}"
+    "<li>Ингридиент: {{ ingredient.name }} "
+    "Кол-во: {{ ingredient.quantity }} "
+    "Мера: {{ ingredient.measure }}</li>"
+    "{% endfor %}"
+)
+
+SEARCH_QUERY = 'картофель'
+INGREDIENT_QUERY = ('картофель', 'лук репчатый')
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss в Linux - в килобайтах.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _generate_images(count: int, rng: random.Random) -> list[tuple]:
+    from PIL import Image, ImageDraw
+
+    from app import app
+    from images import generate_variants_json
+    from storage import upload_storage
+
+    images = []
+    for _ in range(count):
+        image = Image.new('RGB', (1200, 900), tuple(
+            rng.randrange(256) for _ in range(3)
+        ))
+        draw = ImageDraw.Draw(image)
+        for _ in range(20):
+            x, y = rng.randrange(1100), rng.randrange(800)
+            draw.ellipse(
+                (x, y, x + rng.randrange(20, 300), y + rng.randrange(20, 300)),
+                fill=tuple(rng.randrange(256) for _ in range(3)),
+            )
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=85)
+        buffer.seek(0)
+        file_path = upload_storage.save(buffer, 'jpg')
+        images.append((file_path, generate_variants_json(
+            file_path,
+            upload_storage,
+            app.config['IMAGE_VARIANT_WIDTHS'],
+            app.config['IMAGE_VARIANT_QUALITY'],
+        )))
+    return images
+
+
+def generate_data(
+        rows: int,
+        users: int,
+        seed: int = 1,
+        images: int = 20,
+        batch_size: int = 10000,
+) -> None:
+    """
+    Заполняет базу данных синтетическими данными: users пользователей
+    (user0@example.com ... с паролем BENCHMARK_PASSWORD) и rows рецептов
+    со случайными категориями, датами за последний год, 3-10 ингредиентами
+    и одной из images сгенерированных фотографий с готовыми копиями.
+    Рецепты вставляются пачками в обход ORM, таблица ингредиентов
+    заполняется backfill_ingredients, поисковый индекс - триггерами,
+    количество рецептов в категориях - FeedVersion.recount.
+
+    :param rows: количество рецептов
+    :type rows: int
+    :param users: количество пользователей
+    :type users: int
+    :param seed: начальное значение генератора случайных чисел
+    :type seed: int
+    :param images: количество различных фотографий
+    :type images: int
+    :param batch_size: количество строк в одной транзакции
+    :type batch_size: int
+    :return: None
+    """
+    from app import db
+    from categories import CATEGORIES
+    from ingredients import join_ingredients
+    from models import FeedVersion, Recipe, User, backfill_ingredients
+    from passwords import hash_password
+
+    rng = random.Random(seed)
+    now = datetime.datetime.utcnow()
+    password = hash_password(BENCHMARK_PASSWORD)
+    for start in range(0, users, batch_size):
+        db.session.execute(User.__table__.insert(), [
+            {'login': f'user{number}', 'email': f'user{number}@example.com',
+             'password': password, 'created_at': now}
+            for number in range(start, min(start + batch_size, users))
+        ])
+        db.session.commit()
+    photos = _generate_images(images, rng)
+    for start in range(0, rows, batch_size):
+        values = []
+        for _ in range(start, min(start + batch_size, rows)):
+            file_path, variants = rng.choice(photos)
+            items = rng.sample(INGREDIENTS, rng.randint(3, 10))
+            values.append({
+                'id_user': rng.randint(1, users),
+                'dish_name': f'{rng.choice(ADJECTIVES).capitalize()} '
+                             f'{rng.choice(DISHES)}',
+                'food_category': rng.choice(CATEGORIES).name,
+                'cooking_time': f'{rng.randrange(10, 180, 5)} минут',
+                'ingredients': join_ingredients(
+                    (name, str(rng.randint(1, 500)), measure)
+                    for name, measure in items
+                ),
+                'recipe': ' '.join(rng.choices(STEPS, k=rng.randint(3, 8))),
+                'file_path': file_path,
+                'image_variants': variants,
+                'created_at': now - datetime.timedelta(
+                    seconds=rng.randrange(365 * 86400)
+                ),
+            })
+        db.session.execute(Recipe.__table__.insert(), values)
+        db.session.commit()
+        print(f'  рецептов: {start + len(values)}', file=sys.stderr)
+    backfill_ingredients(batch_size=batch_size)
+    FeedVersion.recount()
+
+
+def benchmark_routes() -> list[tuple[str, str, bool]]:
+    """
+    Возвращает проверяемые страницы: имя, путь с параметрами и признак
+    того, что страница требует авторизации. Идентификатор рецепта и курсор
+    второй страницы ленты берутся из базы данных.
+
+    :return: список (имя, путь, требуется авторизация)
+    :rtype: list[tuple[str, str, bool]]
+    """
+    from app import db
+    from categories import CATEGORIES
+    from models import Recipe
+
+    recipe_id = db.session.query(Recipe.id).order_by(
+        Recipe.id.desc()
+    ).limit(1).scalar() or 1
+    page = Recipe.feed()
+    second_page = f'/?{urlencode({"after": page.next_cursor})}' \
+        if page.next_cursor else '/'
+    ingredients = urlencode([('name', name) for name in INGREDIENT_QUERY])
+    return [
+        ('index', '/', False),
+        ('index_page_2', second_page, False),
+        *((f'category_{category.slug}', f'/category/{category.slug}/', False)
+          for category in CATEGORIES),
+        ('search', f'/search/?{urlencode({"q": SEARCH_QUERY})}', False),
+        ('by_ingredients', f'/by_ingredients/?{ingredients}', False),
+        ('register_form', '/register/', False),
+        ('input_user_form', '/input_user/', False),
+        ('api_recipes', '/api/recipes', False),
+        ('api_recipes_1000', '/api/recipes?limit=1000', False),
+        ('api_recipe', f'/api/recipes/{recipe_id // 2 or 1}', True),
+        ('jobs_stats', '/jobs/stats', True),
+        ('metrics', '/metrics', True),
+        ('open_recept', f'/open_recept/{recipe_id // 2 or 1}', True),
+        ('account_user', '/account_user/', True),
+        ('recipe_create_form', '/recipe_create/', True),
+    ]
+
+
+def _percentile(ordered: list[float], fraction: float) -> float:
+    index = max(0, math.ceil(fraction * len(ordered)) - 1)
+    return ordered[index]
+
+
+def _summary(
+        latencies: list[float], elapsed: float, statuses: Counter
+) -> dict:
+    ordered = sorted(latencies)
+    return {
+        'requests': len(ordered),
+        'p50_ms': round(_percentile(ordered, 0.50) * 1000, 3),
+        'p95_ms': round(_percentile(ordered, 0.95) * 1000, 3),
+        'p99_ms': round(_percentile(ordered, 0.99) * 1000, 3),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+        'throughput_rps': round(len(ordered) / elapsed, 1),
+        'status': {str(code): count for code, count in statuses.items()},
+    }
+
+
+_clients = {}
+_query_count = [0]
+
+
+def _count_query(conn, cursor, statement, parameters, context,
+                 executemany) -> None:
+    _query_count[0] += 1
+
+
+def _client(authenticated: bool):
+    from app import app
+
+    if authenticated not in _clients:
+        client = app.test_client()
+        if authenticated:
+            client.post('/input_user/', data={
+                'email': BENCHMARK_EMAIL, 'password': BENCHMARK_PASSWORD,
+            })
+        _clients[authenticated] = client
+    return _clients[authenticated]
+
+
+def run_client(
+        path: str,
+        authenticated: bool,
+        iterations: int,
+        warmup: int,
+        encoding: str = 'identity',
+) -> dict:
+    """
+    Выполняет warmup, затем iterations запросов страницы тестовым клиентом
+    Flask в текущем потоке и возвращает показатели, в том числе средний
+    размер ответа и процессорное время процесса на запрос.
+
+    :param path: путь страницы с параметрами
+    :type path: str
+    :param authenticated: запрашивать страницу от имени пользователя
+    :type authenticated: bool
+    :param iterations: количество измеряемых запросов
+    :type iterations: int
+    :param warmup: количество запросов прогрева
+    :type warmup: int
+    :param encoding: значение заголовка Accept-Encoding
+    :type encoding: str
+    :return: показатели страницы
+    :rtype: dict
+    """
+    client = _client(authenticated)
+    headers = {'Accept-Encoding': encoding}
+    for _ in range(warmup):
+        client.get(path, headers=headers).close()
+    latencies = []
+    statuses = Counter()
+    size = 0
+    queries_before = _query_count[0]
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        request_started = time.perf_counter()
+        response = client.get(path, headers=headers)
+        size += len(response.get_data())
+        latencies.append(time.perf_counter() - request_started)
+        statuses[response.status_code] += 1
+        response.close()
+    result = _summary(latencies, time.perf_counter() - started, statuses)
+    result['queries_per_request'] = round(
+        (_query_count[0] - queries_before) / iterations, 2
+    )
+    result['bytes_per_request'] = round(size / iterations)
+    result['cpu_ms_per_request'] = round(
+        (time.process_time() - cpu_started) / iterations * 1000, 3
+    )
+    return result
+
+
+def _http_login(base_url: str) -> str | None:
+    parts = urlsplit(base_url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port)
+    connection.request(
+        'POST', '/input_user/',
+        body=urlencode({
+            'email': BENCHMARK_EMAIL, 'password': BENCHMARK_PASSWORD,
+        }),
+        headers={'Content-Type': 'application/x-www-form-urlencoded'},
+    )
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    cookies = [value.split(';', 1)[0]
+               for name, value in response.getheaders()
+               if name.lower() == 'set-cookie']
+    return '; '.join(cookies) or None
+
+
+def run_http(
+        base_url: str,
+        path: str,
+        cookie: str | None,
+        iterations: int,
+        concurrency: int,
+        encoding: str = 'identity',
+) -> dict:
+    """
+    Выполняет iterations запросов страницы по HTTP в concurrency потоках,
+    каждый поток использует одно соединение keep-alive. Процессорное время
+    сервера не измеряется.
+
+    :param base_url: адрес сервера, например http://127.0.0.1:8000
+    :type base_url: str
+    :param path: путь страницы с параметрами
+    :type path: str
+    :param cookie: заголовок Cookie авторизованного пользователя или None
+    :type cookie: str | None
+    :param iterations: общее количество запросов
+    :type iterations: int
+    :param concurrency: количество потоков
+    :type concurrency: int
+    :param encoding: значение заголовка Accept-Encoding
+    :type encoding: str
+    :return: показатели страницы
+    :rtype: dict
+    """
+    parts = urlsplit(base_url)
+    headers = {'Accept-Encoding': encoding}
+    if cookie:
+        headers['Cookie'] = cookie
+
+    def worker(count: int) -> tuple[list[float], Counter, int]:
+        connection = http.client.HTTPConnection(
+            parts.hostname, parts.port, timeout=60
+        )
+        latencies = []
+        statuses = Counter()
+        size = 0
+        for _ in range(count):
+            request_started = time.perf_counter()
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            size += len(response.read())
+            latencies.append(time.perf_counter() - request_started)
+            statuses[response.status] += 1
+        connection.close()
+        return latencies, statuses, size
+
+    counts = [iterations // concurrency] * concurrency
+    for number in range(iterations % concurrency):
+        counts[number] += 1
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, counts))
+    elapsed = time.perf_counter() - started
+    latencies = [value for part, _, _ in results for value in part]
+    statuses = sum((part for _, part, _ in results), Counter())
+    result = _summary(latencies, elapsed, statuses)
+    result['queries_per_request'] = None
+    result['bytes_per_request'] = round(
+        sum(size for _, _, size in results) / iterations
+    )
+    result['cpu_ms_per_request'] = None
+    return result
+
+
+def _http_loop(
+        base_url: str, method: str, path: str, body: str | None,
+        deadline: float,
+) -> tuple[list[float], Counter]:
+    parts = urlsplit(base_url)
+    connection = http.client.HTTPConnection(
+        parts.hostname, parts.port, timeout=60
+    )
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'} \
+        if body else {}
+    latencies = []
+    statuses = Counter()
+    while time.perf_counter() < deadline:
+        request_started = time.perf_counter()
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - request_started)
+        statuses[response.status] += 1
+    connection.close()
+    return latencies, statuses
+
+
+def _run_phase(
+        base_url: str, duration: float, loops: list[tuple]
+) -> list[dict]:
+    deadline = time.perf_counter() + duration
+    with ThreadPoolExecutor(max_workers=len(loops)) as executor:
+        futures = [
+            executor.submit(_http_loop, base_url, *loop, deadline)
+            for loop in loops
+        ]
+        results = [future.result() for future in futures]
+    groups = {}
+    for loop, (latencies, statuses) in zip(loops, results):
+        group = groups.setdefault(loop[:2], ([], Counter()))
+        group[0].extend(latencies)
+        group[1].update(statuses)
+    return [_summary(latencies, duration, statuses)
+            for latencies, statuses in groups.values() if latencies]
+
+
+def run_mixed(
+        base_url: str,
+        path: str,
+        duration: float = 10.0,
+        page_threads: int = 8,
+        login_threads: int = 8,
+) -> dict:
+    """
+    Измеряет по HTTP, как входы пользователей (хэширование паролей)
+    влияют на отдачу страниц: сначала duration секунд запрашивается только
+    страница path, затем столько же - страница и одновременно вход
+    пользователя в login_threads потоках.
+
+    :param base_url: адрес сервера
+    :type base_url: str
+    :param path: путь страницы
+    :type path: str
+    :param duration: длительность каждой фазы в секундах
+    :type duration: float
+    :param page_threads: количество потоков, запрашивающих страницу
+    :type page_threads: int
+    :param login_threads: количество потоков, выполняющих вход
+    :type login_threads: int
+    :return: показатели страницы без входов, страницы со входами и входов
+    :rtype: dict
+    """
+    login = ('POST', '/input_user/', urlencode({
+        'email': BENCHMARK_EMAIL, 'password': BENCHMARK_PASSWORD,
+    }))
+    page = ('GET', path, None)
+    page_only, = _run_phase(base_url, duration, [page] * page_threads)
+    page_mixed, logins = _run_phase(
+        base_url, duration, [page] * page_threads + [login] * login_threads
+    )
+    return {
+        'page_only': page_only,
+        'page_with_logins': page_mixed,
+        'logins': logins,
+    }
+
+
+def benchmark_ingredients(iterations: int, seed: int = 1) -> dict:
+    """
+    Рендерит список ингредиентов рецепта из 10 ингредиентов iterations раз
+    шаблоном с разбором строки через split и шаблоном с
+    Recipe.ingredient_list и возвращает задержки рендеринга.
+
+    :param iterations: количество рендерингов каждого шаблона
+    :type iterations: int
+    :param seed: начальное значение генератора случайных чисел
+    :type seed: int
+    :return: показатели по шаблонам split и ingredient_list
+    :rtype: dict
+    """
+    from app import app
+    from ingredients import join_ingredients
+    from models import Recipe
+
+    rng = random.Random(seed)
+    recipe = Recipe(ingredients=join_ingredients(
+        (name, str(rng.randint(1, 500)), measure)
+        for name, measure in rng.sample(INGREDIENTS, 10)
+    ))
+    results = {}
+    for name, source in (('split', SPLIT_INGREDIENTS_TEMPLATE),
+                         ('ingredient_list', LIST_INGREDIENTS_TEMPLATE)):
+        template = app.jinja_env.from_string(source)
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(iterations):
+            render_started = time.perf_counter()
+            template.render(recept=recipe)
+            latencies.append(time.perf_counter() - render_started)
+        results[name] = _summary(
+            latencies, time.perf_counter() - started, Counter()
+        )
+        del results[name]['status']
+    return results
+
+
+def _load_templates(bytecode_cache) -> None:
+    from app import app
+
+    environment = app.create_jinja_environment()
+    environment.bytecode_cache = bytecode_cache
+    environment.filters.update(app.jinja_env.filters)
+    for name in app.jinja_loader.list_templates():
+        environment.get_template(name)
+
+
+def benchmark_templates(iterations: int) -> dict:
+    """
+    Измеряет прогрев нового процесса: загрузку всех шаблонов приложения в
+    новое окружение Jinja без кэша (компиляция исходного текста) и из
+    заполненного кэша байт-кода, а также рендеринг страницы категории из
+    RECIPES_PER_PAGE рецептов уже загруженным шаблоном. Вызывается в
+    контексте приложения.
+
+    :param iterations: количество загрузок и рендерингов
+    :type iterations: int
+    :return: показатели compile, bytecode и render
+    :rtype: dict
+    """
+    import tempfile
+
+    from flask import render_template
+
+    from app import app, create_bytecode_cache
+    from categories import CATEGORIES
+    from models import Recipe
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        bytecode_cache = create_bytecode_cache(directory)
+        _load_templates(bytecode_cache)
+        for name, cache in (('compile', None), ('bytecode', bytecode_cache)):
+            latencies = []
+            started = time.perf_counter()
+            for _ in range(iterations):
+                load_started = time.perf_counter()
+                _load_templates(cache)
+                latencies.append(time.perf_counter() - load_started)
+            results[name] = _summary(
+                latencies, time.perf_counter() - started, Counter()
+            )
+    page = Recipe.feed(food_category=CATEGORIES[0].name)
+    latencies = []
+    with app.test_request_context('/'):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            render_started = time.perf_counter()
+            render_template(
+                'category_recipes.html', category=CATEGORIES[0],
+                recipe_count=len(page.items), receipts=page.items,
+                page=page,
+            )
+            latencies.append(time.perf_counter() - render_started)
+    results['render'] = _summary(
+        latencies, time.perf_counter() - started, Counter()
+    )
+    for summary in results.values():
+        del summary['status']
+    return results
+
+
+def compare(result: dict, baseline: dict, threshold: float = 0.2) -> list[str]:
+    """
+    Выводит таблицу изменения показателей по сравнению с базовым запуском и
+    возвращает страницы, у которых p95 или количество запросов к базе
+    выросли больше чем на threshold.
+
+    :param result: результат текущего запуска
+    :type result: dict
+    :param baseline: результат базового запуска
+    :type baseline: dict
+    :param threshold: допустимый относительный рост
+    :type threshold: float
+    :return: описания ухудшений
+    :rtype: list[str]
+    """
+    regressions = []
+    print(f'{"страница":<20} {"p50 мс":>18} {"p95 мс":>18} {"запросов":>12} '
+          f'{"байт":>22} {"CPU мс":>18}')
+    for name, current in result['routes'].items():
+        previous = baseline.get('routes', {}).get(name)
+        if previous is None:
+            continue
+        cells = []
+        for key in ('p50_ms', 'p95_ms', 'queries_per_request',
+                    'bytes_per_request', 'cpu_ms_per_request'):
+            old, new = previous.get(key), current.get(key)
+            if old is None or new is None:
+                cells.append('-')
+                continue
+            change = (new - old) / old if old else 0.0
+            cells.append(f'{old:g}->{new:g} ({change:+.0%})')
+            if key in ('p95_ms', 'queries_per_request') \
+                    and change > threshold:
+                regressions.append(f'{name}: {key} {old:g} -> {new:g}')
+        print(f'{name:<20} {cells[0]:>18} {cells[1]:>18} {cells[2]:>12} '
+              f'{cells[3]:>22} {cells[4]:>18}')
+    return regressions
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _remove_database(path: str) -> None:
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=1000,
+                        help='количество рецептов')
+    parser.add_argument('--users', type=int,
+                        help='количество пользователей (по умолчанию rows/10)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--images', type=int, default=20,
+                        help='количество различных фотографий')
+    parser.add_argument('--regenerate', action='store_true',
+                        help='создать базу данных заново')
+    parser.add_argument('--iterations', type=int, default=200,
+                        help='количество запросов каждой страницы')
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--routes', help='имена страниц через запятую')
+    parser.add_argument('--no-page-cache', action='store_true',
+                        help='отключить кэш страниц для анонимных запросов')
+    parser.add_argument('--url', help='адрес сервера для HTTP-нагрузки')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--mixed', type=float, metavar='SECONDS',
+                        help='с --url: измерить главную страницу без '
+                             'входов и со входами пользователей')
+    parser.add_argument('--encoding', default='identity',
+                        choices=('identity', 'gzip', 'br'),
+                        help='значение заголовка Accept-Encoding')
+    parser.add_argument('--templates', action='store_true',
+                        help='измерить только загрузку и рендеринг шаблонов')
+    parser.add_argument('--ingredients', action='store_true',
+                        help='измерить только рендеринг ингредиентов')
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--baseline', help='JSON базового запуска')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='допустимый рост p95 и числа запросов')
+    args = parser.parse_args()
+
+    database = f'bench-{args.rows}.db'
+    if args.regenerate:
+        _remove_database(os.path.join('instance', database))
+    os.environ['FLASK_SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database}'
+    os.environ['FLASK_UPLOAD_FOLDER'] = 'static/uploads/bench'
+    os.environ['FLASK_RATELIMIT_ENABLED'] = 'false'
+    os.environ['FLASK_PROFILE_ADMINS'] = json.dumps([BENCHMARK_LOGIN])
+    if args.no_page_cache:
+        os.environ['FLASK_PAGE_CACHE_ENABLED'] = 'false'
+
+    if args.ingredients:
+        for name, summary in benchmark_ingredients(
+                args.iterations, args.seed
+        ).items():
+            print(f'{name:<20} p50 {summary["p50_ms"] * 1000:>8.1f} мкс  '
+                  f'p95 {summary["p95_ms"] * 1000:>8.1f} мкс  '
+                  f'{summary["throughput_rps"]:>10} в секунду')
+        return
+
+    import controller  # noqa: F401 (регистрирует представления)
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    from app import app, db
+    from models import Recipe
+
+    with app.app_context():
+        existing = db.session.query(Recipe.id).count()
+        if existing == 0:
+            users = args.users or max(1, args.rows // 10)
+            print(f'Генерация данных: {args.rows} рецептов, '
+                  f'{users} пользователей', file=sys.stderr)
+            started = time.perf_counter()
+            generate_data(args.rows, users, args.seed, args.images)
+            print(f'  готово за {time.perf_counter() - started:.1f} с',
+                  file=sys.stderr)
+        elif existing != args.rows:
+            print(f'В базе {existing} рецептов, а не {args.rows}; '
+                  f'используйте --regenerate', file=sys.stderr)
+        if args.templates:
+            for name, summary in benchmark_templates(
+                    args.iterations
+            ).items():
+                print(f'{name:<20} p50 {summary["p50_ms"]:>8} мс  '
+                      f'p95 {summary["p95_ms"]:>8} мс')
+            return
+        routes = benchmark_routes()
+
+    if args.routes:
+        selected = set(args.routes.split(','))
+        routes = [route for route in routes if route[0] in selected]
+    event.listen(Engine, 'before_cursor_execute', _count_query)
+    cookie = _http_login(args.url) if args.url else None
+    results = {}
+    for name, path, authenticated in routes:
+        if args.url:
+            results[name] = run_http(
+                args.url, path, cookie if authenticated else None,
+                args.iterations, args.concurrency, args.encoding,
+            )
+        else:
+            results[name] = run_client(
+                path, authenticated, args.iterations, args.warmup,
+                args.encoding,
+            )
+        print(f'{name:<20} p50 {results[name]["p50_ms"]:>8} мс  '
+              f'p95 {results[name]["p95_ms"]:>8} мс  '
+              f'p99 {results[name]["p99_ms"]:>8} мс  '
+              f'{results[name]["throughput_rps"]:>8} rps  '
+              f'запросов {results[name]["queries_per_request"]}  '
+              f'байт {results[name]["bytes_per_request"]:>7}  '
+              f'CPU {results[name]["cpu_ms_per_request"]} мс')
+
+    mixed = None
+    if args.url and args.mixed:
+        mixed = run_mixed(
+            args.url, '/', args.mixed, args.concurrency, args.concurrency
+        )
+        for phase, summary in mixed.items():
+            print(f'{phase:<20} p50 {summary["p50_ms"]:>8} мс  '
+                  f'p95 {summary["p95_ms"]:>8} мс  '
+                  f'{summary["throughput_rps"]:>8} rps')
+
+    result = {
+        'meta': {
+            'rows': args.rows,
+            'seed': args.seed,
+            'iterations': args.iterations,
+            'mode': 'http' if args.url else 'client',
+            'concurrency': args.concurrency if args.url else 1,
+            'page_cache': not args.no_page_cache,
+            'encoding': args.encoding,
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'time': datetime.datetime.utcnow().isoformat(),
+        },
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'routes': results,
+        'mixed': mixed,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(result, file, ensure_ascii=False, indent=2)
+    print(f'Пиковый объем памяти: {result["peak_rss_mb"]} МБ')
+    print(f'Результат записан в {args.output}')
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(result, json.load(file), args.threshold)
+        if regressions:
+            print('Ухудшения:')
+            for line in regressions:
+                print(f'  {line}')
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,51 +4,160 @@
 
 Функции модуля:
 
+validate_user_format(login, email, password) -> str | None:
+Проверяет формат регистрационных данных без обращения к базе данных.
+
+validate_new_users(users: list[dict]) -> list[str | None]:
+Проверяет данные новых пользователей, занятость - одним запросом.
+
 check_new_user(login: str, email: str, password: str) -> bool:
 Проверяет данные пользователя перед регистрацией.
 
+register_user(login: str, email: str, password: str) -> User | None:
+Создает пользователя, обрабатывая нарушение уникальности.
+
 allowed_file(filename: str) -> bool:
 Проверяет расширение загружаемого файла и сравнивает его со списком
 разрешенных расширений.
 
+is_admin() -> bool:
+Проверяет, что текущий пользователь перечислен в PROFILE_ADMINS.
+
+feed_cursor_args() -> dict:
+Извлекает из запроса курсоры и размер страницы ленты рецептов.
+
+feed_page_url(**cursor) -> str:
+Строит ссылку на соседнюю страницу текущей ленты (функция шаблонов).
+
+image_variants(value: str | None) -> dict:
+Разбирает JSON уменьшенных копий фотографии (фильтр шаблонов).
+
+process_recipe_image(recipe_id: int) -> None:
+Фоновая задача: создает уменьшенные копии фотографии рецепта.
+
 Переменные модуля:
 
 ALLOWED_EXTENSIONS:
 Список разрешенных расширений файлов.
+
+LOGIN_RE, EMAIL_RE, PASSWORD_RE:
+Скомпилированные регулярные выражения формата логина, почты и пароля.
+
+USER_FORMAT_RULES:
+Проверки формата в порядке выполнения: поле, выражение, сообщение.
 """
 
+import json
 import re
+from functools import lru_cache
+from typing import Any
+from urllib.parse import urlencode
+
+from flask import flash, request, url_for
+from flask_login import current_user
+from sqlalchemy import or_, select
+from sqlalchemy.exc import IntegrityError
+
+from images import generate_variants_json
+from jobs import handler
+from models import User, Recipe
+from passwords import hash_password
+from storage import upload_storage
+from app import app, db, ALLOWED_EXTENSIONS
+
+# Логин: от 5 до 25 латинских букв, цифр и символов ! и ?, без пробелов.
+LOGIN_RE = re.compile(r'^[a-zA-Z!?\d]{5,25}$')
+# Почта: буквы, цифры, дефисы и точки до '@', затем домены, разделенные
+# точками, и домен верхнего уровня из двух-четырех символов ('.ru').
+EMAIL_RE = re.compile(r'^[-\w\.]+@([-\w]+\.)+[-\w]{2,4}$')
+# Пароль: от 5 до 36 латинских букв, цифр и символов ! и ?.
+PASSWORD_RE = re.compile(r'^[a-zA-Z!?\d]{5,36}$')
+
+USER_FORMAT_RULES = (
+    ('login', LOGIN_RE,
+     'Логин должен состоять из 5-25 латинских букв, цифр и символов!'),
+    ('email', EMAIL_RE, 'Вы ввели неверный формат почты!'),
+    ('password', PASSWORD_RE,
+     'Пароль должен состоять из 5-36 латинских букв, цифр и символов'),
+)
+LOGIN_TAKEN_MESSAGE = 'Такой пользователь уже существует'
+EMAIL_TAKEN_MESSAGE = 'Пользователь с таким E-mail уже есть'
+USER_TAKEN_MESSAGE = 'Пользователь с таким логином или E-mail уже есть'
+
+
+def validate_user_format(login: Any, email: Any, password: Any) -> str | None:
+    """
+    Проверяет формат логина, почты и пароля регулярными выражениями
+    USER_FORMAT_RULES, не обращаясь к базе данных.
+
+    :param login: логин пользователя
+    :type login: Any
+    :param email: электронная почта пользователя
+    :type email: Any
+    :param password: пароль пользователя
+    :type password: Any
+    :return: сообщение об ошибке или None, если формат верный
+    :rtype: str | None
+    """
+    values = {'login': login, 'email': email, 'password': password}
+    for field, pattern, message in USER_FORMAT_RULES:
+        value = values[field]
+        if not isinstance(value, str) or pattern.match(value) is None:
+            return message
+    return None
+
 
-from flask import flash
-from models import User
-from app import ALLOWED_EXTENSIONS
+def validate_new_users(users: list[dict]) -> list[str | None]:
+    """
+    Проверяет данные новых пользователей: сначала формат каждой записи,
+    затем одним запросом login IN (...) OR email IN (...) - занятость
+    логинов и почт записей с верным форматом. Повтор логина или почты
+    внутри списка тоже считается ошибкой.
+
+    Функция используется и при регистрации (список из одной записи), и при
+    массовом импорте пользователей.
+
+    :param users: словари с ключами login, email и password
+    :type users: list[dict]
+    :return: для каждой записи сообщение об ошибке или None
+    :rtype: list[str | None]
+    """
+    errors = [
+        validate_user_format(
+            user.get('login'), user.get('email'), user.get('password')
+        )
+        for user in users
+    ]
+    valid = [user for user, error in zip(users, errors) if error is None]
+    if not valid:
+        return errors
+    rows = db.session.execute(
+        select(User.login, User.email).where(or_(
+            User.login.in_({user['login'] for user in valid}),
+            User.email.in_({user['email'] for user in valid}),
+        ))
+    ).all()
+    logins = {row.login for row in rows}
+    emails = {row.email for row in rows}
+    for index, user in enumerate(users):
+        if errors[index] is not None:
+            continue
+        if user['login'] in logins:
+            errors[index] = LOGIN_TAKEN_MESSAGE
+        elif user['email'] in emails:
+            errors[index] = EMAIL_TAKEN_MESSAGE
+        logins.add(user['login'])
+        emails.add(user['email'])
+    return errors
 
 
 def check_new_user(login: str, email: str, password: str) -> bool:
     """
-    Проверяет данные нового пользователя перед регистрацией.
-
-    pattern_login - Эта регулярка проверяет,
-    соответствует ли строка следующим условиям:
-    Длина строки от 5 до 25 символов.
-    Строка может содержать только латинские буквы в верхнем и нижнем регистре,
-    цифры, а также символы !, ?,.
-    Строка не должна содержать пробелы или другие специальные символы.
-
-    pattern_email - Она проверяет наличие символа '@' в строке
-    и наличие хотя бы одного символа до и после символа '@'.
-    Допустимыми символами являются буквы, цифры, дефисы и точки.
-    За символом '@' должна следовать доменная часть email-адреса,
-    состоящая из букв, цифр, дефисов и точек, где точка не может быть первым
-    или последним символом, и между точками должен быть хотя бы один символ.
-    В конце доменной части должен быть указан домен верхнего уровня
-    из двух-четырех символов, например '.com' или '.ru'.
-
-    pattern_password - Проверяет, что строка содержит от 5 до 36 символов,
-    состоящих из букв (в любом регистре), цифр и знаков !, ? или _.
-    То есть, данное регулярное выражение подходит для проверки корректности
-    пароля, который должен содержать только разрешенные символы и быть длиной
-    не менее 5 и не более 36 символов.
+    Проверяет данные нового пользователя перед регистрацией с помощью
+    validate_new_users и выводит уведомление об ошибке.
+
+    Занятость логина и почты окончательно проверяется уникальными
+    индексами при вставке, см. register_user.
 
     :param login: логин пользователя.
     :type login: str
@@ -59,56 +168,42 @@ def check_new_user(login: str, email: str, password: str) -> bool:
     :return: результат проверки.
     :rtype: bool
     """
-    pattern_login = r'^[a-zA-Z!?\d]{5,25}$'  # Регулярки объясняются в доке
-    pattern_email = r'^[-\w\.]+@([-\w]+\.)+[-\w]{2,4}$'
-    pattern_password = r'^[a-zA-Z!?\d]{5,36}$'
-    if User.query.filter_by(login=login).first():
-        flash(
-            {
-                'title': 'Ошибка!',
-                'message': 'Такой пользователь уже существует',
-            },
-            category='error',
-        )
-        return False
-    elif User.query.filter_by(email=email).first():
-        flash(
-            {
-                'title': 'Ошибка!',
-                'message': 'Пользователь с таким E-mail уже есть',
-            },
-            category='error',
-        )
-        return False
-    elif re.match(pattern_login, login) is None:
-        flash(
-            {
-                'title': 'Ошибка!',
-                'message': 'Логин должен состоять из 5-25 латинских букв, '
-                           'цифр и символов!',
-            },
-            category='error',
-        )
+    error = validate_new_users(
+        [{'login': login, 'email': email, 'password': password}]
+    )[0]
+    if error is not None:
+        flash({'title': 'Ошибка!', 'message': error}, category='error')
         return False
-    elif re.match(pattern_email, email) is None:
-        flash(
-            {
-                'title': 'Ошибка!',
-                'message': 'Вы ввели неверный формат почты!',
-            },
-            category='error',
+    return True
+
+
+def register_user(login: str, email: str, password: str) -> User | None:
+    """
+    Создает пользователя с хэшем пароля. Если логин или почту успели
+    занять между проверкой и вставкой, уникальный индекс возбуждает
+    IntegrityError: транзакция откатывается и выводится уведомление об
+    ошибке.
+
+    :param login: логин пользователя
+    :type login: str
+    :param email: электронная почта пользователя
+    :type email: str
+    :param password: пароль пользователя
+    :type password: str
+    :return: созданный пользователь или None
+    :rtype: User | None
+    """
+    try:
+        user = User.create(
+            login=login, email=email, password=hash_password(password)
         )
-        return False
-    elif re.match(pattern_password, password) is None:
+    except IntegrityError:
+        db.session.rollback()
         flash(
-            {
-                'title': 'Ошибка!',
-                'message': 'Пароль должен состоять из 5-36 латинских букв, '
-                           'цифр и символов',
-            },
+            {'title': 'Ошибка!', 'message': USER_TAKEN_MESSAGE},
             category='error',
         )
-        return False
+        return None
     flash(
         {
             'title': 'Успешно!',
@@ -116,7 +211,7 @@ def check_new_user(login: str, email: str, password: str) -> bool:
         },
         category='success',
     )
-    return True
+    return user
 
 
 def allowed_file(filename: str) -> bool:
@@ -131,3 +226,101 @@ def allowed_file(filename: str) -> bool:
     """
     filename_split = filename.rsplit('.', 1)[1].lower()
     return '.' in filename and filename_split in ALLOWED_EXTENSIONS
+
+
+def is_admin() -> bool:
+    """
+    Проверяет, что текущий пользователь вошел и его логин перечислен в
+    настройке PROFILE_ADMINS (мониторинг очереди, профили запросов).
+
+    :return: True, если пользователь - администратор
+    :rtype: bool
+    """
+    return current_user.is_authenticated \
+        and current_user.login in app.config['PROFILE_ADMINS']
+
+
+def feed_cursor_args() -> dict:
+    """
+    Извлекает из параметров запроса курсоры ленты рецептов и размер
+    страницы в виде аргументов для Recipe.feed.
+
+    Размер страницы ограничивается значением MAX_RECIPES_PER_PAGE.
+
+    :return: словарь с ключами after, before и per_page
+    :rtype: dict
+    """
+    per_page = request.args.get('per_page', type=int)
+    if per_page is not None:
+        per_page = min(max(per_page, 1), app.config['MAX_RECIPES_PER_PAGE'])
+    return {
+        'after': request.args.get('after'),
+        'before': request.args.get('before'),
+        'per_page': per_page,
+    }
+
+
+@app.template_global()
+def feed_page_url(**cursor) -> str:
+    """
+    Строит ссылку на соседнюю страницу текущей ленты: сохраняет параметры
+    текущего запроса и заменяет курсор на переданный.
+
+    :param cursor: after=<курсор> или before=<курсор>
+    :type cursor: dict
+    :return: URL соседней страницы
+    :rtype: str
+    """
+    args = request.args.copy()
+    args.pop('after', None)
+    args.pop('before', None)
+    args.update(cursor)
+    # Параметры запроса не передаются в url_for: иначе slug, _external,
+    # _anchor и подобные параметры меняли бы сам адрес.
+    return f'{url_for(request.endpoint, **request.view_args)}?' \
+        f'{urlencode(args.to_dict(flat=False), doseq=True)}'
+
+
+@app.template_filter('image_variants')
+@lru_cache(maxsize=4096)
+def image_variants(value: str | None) -> dict:
+    """
+    Разбирает JSON из Recipe.image_variants для шаблона card_image.html.
+    Результат кэшируется, так как одни и те же карточки показываются
+    многократно.
+
+    :param value: JSON уменьшенных копий или None
+    :type value: str | None
+    :return: словарь с ключами placeholder и variants
+    :rtype: dict
+    """
+    if not value:
+        return {'placeholder': None, 'variants': []}
+    return json.loads(value)
+
+
+@handler('image_variants')
+def process_recipe_image(recipe_id: int) -> None:
+    """
+    Фоновая задача: создает уменьшенные копии и заглушку фотографии рецепта
+    и сохраняет их описание в Recipe.image_variants. Если копии того же
+    файла уже созданы для другого рецепта, они переиспользуются. Сохранение
+    рецепта сбрасывает кэш страниц его лент, и карточки начинают
+    использовать копии.
+
+    :param recipe_id: идентификатор рецепта
+    :type recipe_id: int
+    :return: None
+    """
+    recipe = db.session.get(Recipe, recipe_id)
+    if recipe is None:
+        return
+    recipe.image_variants = Recipe.known_image_variants(
+        recipe.file_path
+    ) or generate_variants_json(
+        recipe.file_path,
+        upload_storage,
+        app.config['IMAGE_VARIANT_WIDTHS'],
+        app.config['IMAGE_VARIANT_QUALITY'],
+    )
+    recipe.save()
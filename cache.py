@@ -0,0 +1,257 @@
+"""
+Этот модуль содержит кэш отрендеренных страниц для анонимных посетителей.
+
+Главная страница и страницы категорий одинаковы для всех анонимных
+посетителей и меняются только при записи рецепта, поэтому их HTML хранится
+в памяти процесса в LRU-кэше с ограничением по количеству записей и
+суммарному размеру. Каждая запись помечается тегами (лента главной страницы,
+категория рецепта), и Recipe.save сбрасывает записи с тегами затронутых лент.
+Страницы категорий показывают в боковой панели количество рецептов всех
+категорий, поэтому кэшируются с тегом главной ленты.
+
+Ключ записи включает версию ленты из таблицы feed_version, поэтому запись
+чужого процесса тоже делает закэшированную страницу недействительной.
+Авторизованные пользователи видят другую шапку сайта, поэтому для них кэш
+не используется. Он также не используется, если в сессии есть
+непоказанные уведомления toastr.
+
+Классы модуля:
+
+LRUCache:
+Потокобезопасный LRU-кэш с тегами, временем жизни записей и счетчиками
+попаданий.
+
+Функции модуля:
+
+cached_page(tag: str) -> Callable:
+Декоратор представления, кэширующий страницу для анонимных посетителей.
+
+Переменные модуля:
+
+INDEX_CACHE_TAG:
+Тег ленты главной страницы.
+
+page_cache:
+Кэш страниц приложения.
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Hashable
+
+from flask import Response, request, session
+from flask_login import current_user
+
+from app import app
+
+INDEX_CACHE_TAG = 'index'
+
+
+class LRUCache:
+    """
+    Потокобезопасный LRU-кэш. Самые давно использованные записи вытесняются,
+    когда превышено количество записей max_entries или суммарный размер
+    max_bytes. Если задан ttl, запись устаревает через ttl секунд после
+    сохранения.
+
+    :param max_entries: максимальное количество записей
+    :type max_entries: int
+    :param max_bytes: максимальный суммарный размер записей или None
+    :type max_bytes: int | None
+    :param ttl: время жизни записи в секундах или None
+    :type ttl: float | None
+    """
+
+    def __init__(
+            self,
+            max_entries: int,
+            max_bytes: int | None = None,
+            ttl: float | None = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Возвращает значение по ключу и отмечает запись как недавно
+        использованную.
+
+        :param key: ключ записи
+        :type key: Hashable
+        :return: значение или None, если записи нет
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[3] is not None \
+                    and entry[3] <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(
+            self,
+            key: Hashable,
+            value: Any,
+            tags: tuple = (),
+            size: int = 0,
+    ) -> None:
+        """
+        Сохраняет значение и вытесняет старые записи, если кэш переполнен.
+        Значение больше max_bytes не сохраняется.
+
+        :param key: ключ записи
+        :type key: Hashable
+        :param value: значение
+        :param tags: теги записи для invalidate
+        :type tags: tuple
+        :param size: размер значения в байтах
+        :type size: int
+        """
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            expires = time.monotonic() + self.ttl \
+                if self.ttl is not None else None
+            self._entries[key] = (value, tags, size, expires)
+            self._bytes += size
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries or (
+                    self.max_bytes is not None
+                    and self._bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> bool:
+        """
+        Удаляет запись по ключу.
+
+        :param key: ключ записи
+        :type key: Hashable
+        :return: True, если запись была в кэше
+        :rtype: bool
+        """
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+
+    def invalidate(self, *tags: Hashable) -> int:
+        """
+        Удаляет все записи, помеченные любым из переданных тегов.
+
+        :param tags: теги
+        :type tags: tuple
+        :return: количество удаленных записей
+        :rtype: int
+        """
+        removed = 0
+        with self._lock:
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    removed += self._remove(key)
+        return removed
+
+    def clear(self) -> None:
+        """
+        Удаляет все записи кэша.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Возвращает счетчики кэша.
+
+        :return: словарь с ключами entries, bytes, hits, misses, evictions
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def _remove(self, key: Hashable) -> int:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return 0
+        _, tags, size, _ = entry
+        self._bytes -= size
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+        return 1
+
+
+page_cache = LRUCache(
+    app.config['PAGE_CACHE_MAX_ENTRIES'], app.config['PAGE_CACHE_MAX_BYTES']
+)
+
+
+def cached_page(tag: str) -> Callable:
+    """
+    Декоратор представления, которое возвращает одинаковую страницу всем
+    анонимным посетителям. Ключ записи состоит из версии ленты, имени
+    представления, аргументов URL и параметров запроса (курсоры страниц).
+    Ответ содержит заголовок X-Cache со значением HIT, MISS или BYPASS.
+
+    :param tag: тег ленты, при изменении которой страница устаревает
+    :type tag: str
+    :return: декоратор
+    :rtype: Callable
+    """
+    def decorator(view: Callable) -> Callable:
+        @wraps(view)
+        def wrapper(*args, **kwargs) -> Response | str:
+            if not app.config['PAGE_CACHE_ENABLED'] \
+                    or current_user.is_authenticated \
+                    or session.get('_flashes'):
+                response = app.make_response(view(*args, **kwargs))
+                response.headers['X-Cache'] = 'BYPASS'
+                return response
+            # Импорт здесь: models импортирует этот модуль.
+            from models import FeedVersion
+
+            key = (
+                FeedVersion.current(tag)[0],
+                request.endpoint,
+                tuple(sorted(request.view_args.items())),
+                tuple(sorted(request.args.items(multi=True))),
+            )
+            body = page_cache.get(key)
+            if body is not None:
+                return Response(body, headers={'X-Cache': 'HIT'})
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                body = response.get_data()
+                page_cache.set(key, body, tags=(tag,), size=len(body))
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
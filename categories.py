@@ -0,0 +1,104 @@
+"""
+Этот модуль содержит реестр категорий рецептов.
+
+Категория определяется названием, которое хранится в Recipe.food_category,
+и коротким адресом (slug) для страницы /category/<slug>/. Прежние адреса
+страниц категорий (/firs_recipe/ и другие) перенаправляют на новые.
+
+Количество рецептов в каждой категории хранится в столбце
+FeedVersion.recipe_count и увеличивается в той же транзакции, что и запись
+рецепта, поэтому боковая панель и страница категории показывают
+количество рецептов без COUNT(*) по таблице рецептов.
+
+Классы модуля:
+
+Category:
+Категория рецептов: адрес, название и прежний адрес страницы.
+
+Функции модуля:
+
+category_counts() -> dict[str, int]:
+Возвращает количество рецептов по названиям категорий.
+
+sidebar_categories() -> list[tuple[Category, int]]:
+Возвращает категории боковой панели с количеством рецептов (функция
+шаблонов).
+
+Переменные модуля:
+
+CATEGORIES:
+Категории в порядке боковой панели.
+
+categories_by_slug:
+Категории по адресам.
+
+categories_by_name:
+Категории по названиям.
+
+legacy_slugs:
+Адреса категорий по прежним адресам страниц.
+"""
+from typing import NamedTuple
+
+from flask import g
+
+from app import app
+from models import FeedVersion
+
+
+class Category(NamedTuple):
+    """
+    Категория рецептов.
+
+    :param slug: адрес страницы категории
+    :type slug: str
+    :param name: название категории, значение Recipe.food_category
+    :type name: str
+    :param legacy_path: прежний адрес страницы категории без косых черт
+    :type legacy_path: str
+    """
+    slug: str
+    name: str
+    legacy_path: str
+
+
+CATEGORIES = (
+    Category('first-courses', 'Рецепты первых блюд', 'firs_recipe'),
+    Category('second-courses', 'Рецепты вторых блюд', 'second_recipe'),
+    Category('snacks', 'Рецепты закусок', 'snake'),
+    Category('dough', 'Рецепты изделий из теста', 'dough_recipes'),
+    Category('sweets', 'Рецепты сладостей', 'sweet_recipes'),
+    Category('preserves', 'Рецепты заготовок', 'blank_recipes'),
+)
+categories_by_slug = {category.slug: category for category in CATEGORIES}
+categories_by_name = {category.name: category for category in CATEGORIES}
+legacy_slugs = {category.legacy_path: category.slug
+                for category in CATEGORIES}
+
+
+def category_counts() -> dict[str, int]:
+    """
+    Возвращает количество рецептов по названиям категорий одним запросом
+    по первичному ключу feed_version. Результат запоминается до конца
+    запроса.
+
+    :return: словарь название категории -> количество рецептов
+    :rtype: dict[str, int]
+    """
+    if 'category_counts' not in g:
+        g.category_counts = FeedVersion.recipe_counts(categories_by_name)
+    return g.category_counts
+
+
+@app.template_global()
+def sidebar_categories() -> list[tuple[Category, int]]:
+    """
+    Возвращает категории в порядке боковой панели вместе с количеством
+    рецептов.
+
+    :return: список (категория, количество рецептов)
+    :rtype: list[tuple[Category, int]]
+    """
+    counts = category_counts()
+    return [(category, counts.get(category.name, 0))
+            for category in CATEGORIES]
@@ -0,0 +1,500 @@
+"""
+Этот модуль содержит консольные команды приложения для обслуживания базы
+данных. Команды регистрируются в app.cli и запускаются через flask:
+
+    flask --app controller upgrade-db
+    flask --app controller build-assets
+    flask --app controller compile-templates
+    flask --app controller explain-feeds
+    flask --app controller rebuild-search
+    flask --app controller backfill-ingredients
+    flask --app controller generate-variants
+    flask --app controller run-jobs
+    flask --app controller import-users users.csv
+    flask --app controller recipes export recipes.jsonl --images export/
+    flask --app controller recipes import recipes.jsonl --images export/
+
+Функции модуля:
+
+upgrade_db() -> None:
+Добавляет в существующую базу данных недостающие столбцы и индексы и
+пересчитывает количество рецептов в лентах.
+
+build_assets_command() -> None:
+Собирает статические файлы с отпечатками содержимого.
+
+compile_templates() -> None:
+Компилирует шаблоны приложения в кэш байт-кода.
+
+explain_feeds() -> None:
+Выводит планы выполнения запросов лент рецептов и завершается с ошибкой,
+если какой-либо из них читает таблицу целиком.
+
+explain_feed_queries() -> dict:
+Возвращает планы выполнения запросов лент рецептов.
+
+rebuild_search() -> None:
+Перестраивает полнотекстовый индекс рецептов.
+
+backfill_ingredients_command(batch_size: int) -> None:
+Заполняет таблицу ингредиентов для рецептов, созданных до ее появления.
+
+generate_variants(workers: int, force: bool) -> None:
+Создает уменьшенные копии фотографий уже загруженных рецептов.
+
+run_jobs(workers: int) -> None:
+Запускает отдельный процесс-исполнитель фоновых задач.
+
+import_users(file: TextIO, batch_size: int) -> None:
+Импортирует пользователей из CSV-файла.
+
+export_recipes(file: TextIO, file_format: str | None, images: str | None,
+               batch_size: int) -> None:
+Выгружает рецепты в JSONL или CSV.
+
+import_recipes(file: TextIO, file_format: str | None, images: str | None,
+               link: bool, batch_size: int) -> None:
+Загружает рецепты из JSONL или CSV пачками.
+
+Переменные модуля:
+
+RECIPE_FIELDS:
+Поля записи рецепта в файлах импорта и экспорта.
+"""
+import csv
+import datetime
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from typing import Iterator, TextIO
+
+import click
+from sqlalchemy import event, select
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db
+from assets import build_assets
+from business_logic import validate_new_users
+from categories import categories_by_name
+from images import generate_variants_json
+from jobs import requeue_stale, start_workers
+from models import (
+    FeedVersion, Recipe, User, backfill_ingredients, upgrade_schema,
+)
+from passwords import hash_password
+from pagination import encode_cursor
+from search import rebuild_search_index
+from storage import upload_storage
+
+RECIPE_FIELDS = (
+    'dish_name', 'food_category', 'cooking_time', 'ingredients', 'recipe',
+    'image', 'author', 'created_at',
+)
+
+
+def explain_feed_queries() -> dict[str, list[str]]:
+    """
+    Выполняет запросы лент рецептов и возвращает для каждого из них
+    результат EXPLAIN QUERY PLAN.
+
+    Запросы перехватываются на уровне движка SQLAlchemy, поэтому проверяются
+    ровно те SQL-выражения, которые выполняют представления.
+
+    :return: словарь {название ленты: строки плана выполнения}
+    :rtype: dict[str, list[str]]
+    """
+    cursor = encode_cursor(datetime.datetime.utcnow(), 2 ** 31)
+    feeds = {
+        'index': {},
+        'index_after': {'after': cursor},
+        'index_before': {'before': cursor},
+        'category': {'food_category': 'Рецепты первых блюд'},
+        'category_after': {
+            'food_category': 'Рецепты первых блюд', 'after': cursor
+        },
+        'account': {'id_user': 1},
+        'account_after': {'id_user': 1, 'after': cursor},
+    }
+    plans = {}
+    for name, kwargs in feeds.items():
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, many):
+            statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            Recipe.feed(**kwargs)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+        with db.engine.connect() as connection:
+            plans[name] = [
+                row[-1]
+                for statement, parameters in statements
+                for row in connection.exec_driver_sql(
+                    f'EXPLAIN QUERY PLAN {statement}', parameters
+                )
+            ]
+    return plans
+
+
+@app.cli.command('upgrade-db')
+def upgrade_db() -> None:
+    """
+    Добавляет в существующую базу данных недостающие столбцы и индексы и
+    пересчитывает количество рецептов в лентах (FeedVersion.recipe_count).
+    Команду можно запускать повторно.
+    """
+    changes = upgrade_schema()
+    for change in changes:
+        click.echo(f'+ {change}')
+    FeedVersion.recount()
+    click.echo('Схема базы данных актуальна.')
+
+
+@app.cli.command('build-assets')
+def build_assets_command() -> None:
+    """
+    Собирает статические файлы в ASSETS_FOLDER: копии с отпечатками
+    содержимого в именах, сжатые варианты и manifest.json. Запускается при
+    развертывании, если сборка при запуске приложения отключена
+    (ASSETS_BUILD_ON_START).
+    """
+    manifest = build_assets(
+        app.static_folder,
+        app.config['ASSETS_FOLDER'],
+        app.config['ASSETS_EXCLUDE'],
+    )
+    click.echo(f'Собрано файлов: {len(manifest)}')
+
+
+@app.cli.command('compile-templates')
+def compile_templates() -> None:
+    """
+    Компилирует все шаблоны приложения и сохраняет байт-код в
+    TEMPLATE_CACHE_DIR. Запускается при развертывании, чтобы первые
+    запросы новых процессов не тратили время на компиляцию шаблонов.
+    """
+    if app.jinja_env.bytecode_cache is None:
+        raise click.ClickException(
+            'Кэш байт-кода шаблонов выключен (TEMPLATE_BYTECODE_CACHE).'
+        )
+    names = app.jinja_loader.list_templates()
+    started = time.perf_counter()
+    for name in names:
+        app.jinja_env.get_template(name)
+    click.echo(f'Скомпилировано шаблонов: {len(names)} за '
+               f'{time.perf_counter() - started:.2f} с')
+
+
+@app.cli.command('explain-feeds')
+def explain_feeds() -> None:
+    """
+    Выводит планы выполнения запросов лент рецептов. Завершается с ненулевым
+    кодом, если запрос читает таблицу recipe без индекса или сортирует
+    результат во временном B-дереве.
+    """
+    failed = False
+    for name, plan in explain_feed_queries().items():
+        click.echo(name)
+        for line in plan:
+            bad = line == 'SCAN recipe' or 'TEMP B-TREE' in line
+            failed = failed or bad
+            click.echo(f'  {"!" if bad else " "} {line}')
+    if failed:
+        raise SystemExit(1)
+
+
+@app.cli.command('rebuild-search')
+def rebuild_search() -> None:
+    """
+    Перестраивает полнотекстовый индекс рецептов recipe_fts по таблице
+    recipe. Нужна после восстановления базы из резервной копии или ручного
+    изменения данных в обход SQLite.
+    """
+    count = rebuild_search_index()
+    click.echo(f'Проиндексировано рецептов: {count}')
+
+
+@app.cli.command('backfill-ingredients')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Количество рецептов в одной транзакции.')
+def backfill_ingredients_command(batch_size: int) -> None:
+    """
+    Разбирает строки Recipe.ingredients рецептов, у которых еще нет записей
+    в таблице recipe_ingredient, и заполняет ее. Команду можно запускать
+    повторно.
+    """
+    count = backfill_ingredients(batch_size=batch_size)
+    click.echo(f'Обработано рецептов: {count}')
+
+
+@app.cli.command('generate-variants')
+@click.option('--workers', default=os.cpu_count(), show_default=True,
+              help='Количество процессов обработки.')
+@click.option('--force', is_flag=True,
+              help='Пересоздать копии и для рецептов, у которых они есть.')
+def generate_variants(workers: int, force: bool) -> None:
+    """
+    Создает уменьшенные копии и заглушки фотографий уже загруженных рецептов
+    в пуле процессов и сохраняет их описание в Recipe.image_variants.
+    Каждый файл обрабатывается один раз для всех рецептов, которые на него
+    ссылаются.
+    """
+    query = db.session.query(Recipe.file_path).distinct()
+    if not force:
+        query = query.filter(Recipe.image_variants.is_(None))
+    paths = [path for path, in query.all()
+             if path and upload_storage.exists(path)]
+    process = partial(
+        generate_variants_json,
+        storage=upload_storage,
+        widths=app.config['IMAGE_VARIANT_WIDTHS'],
+        quality=app.config['IMAGE_VARIANT_QUALITY'],
+    )
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [(path, executor.submit(process, path)) for path in paths]
+        for file_path, future in futures:
+            try:
+                variants = future.result()
+            except OSError as error:
+                click.echo(f'! {file_path}: {error}')
+                continue
+            db.session.query(Recipe).filter_by(file_path=file_path).update(
+                {'image_variants': variants}
+            )
+            done += 1
+            if done % 100 == 0:
+                db.session.commit()
+    db.session.commit()
+    click.echo(f'Обработано фотографий: {done} из {len(paths)}')
+
+
+@app.cli.command('run-jobs')
+@click.option('--workers', default=app.config['JOB_WORKERS'],
+              show_default=True, help='Количество потоков-исполнителей.')
+def run_jobs(workers: int) -> None:
+    """
+    Выполняет фоновые задачи в отдельном процессе до остановки по Ctrl+C.
+    Перед запуском возвращает в очередь зависшие задачи.
+    """
+    requeue_stale(app.config['JOB_STALE_TIMEOUT'])
+    stop = threading.Event()
+    threads = start_workers(workers, stop)
+    click.echo(f'Исполнителей запущено: {len(threads)}')
+    try:
+        stop.wait()
+    except KeyboardInterrupt:
+        stop.set()
+
+
+@app.cli.command('import-users')
+@click.argument('file', type=click.File(encoding='utf-8'))
+@click.option('--batch-size', default=500, show_default=True,
+              help='Количество пользователей в одной транзакции.')
+def import_users(file: TextIO, batch_size: int) -> None:
+    """
+    Импортирует пользователей из CSV-файла со столбцами login, email и
+    password. Записи проверяются теми же правилами, что и при регистрации:
+    сначала формат, затем занятость логинов и почт одним запросом на
+    пачку. Ошибочные записи пропускаются с сообщением, остальные
+    сохраняются с хэшами паролей.
+    """
+    rows = enumerate(csv.DictReader(file), start=1)
+    imported = rejected = 0
+    while batch := [row for _, row in zip(range(batch_size), rows)]:
+        errors = validate_new_users([user for _, user in batch])
+        users = []
+        for (number, row), error in zip(batch, errors):
+            if error is not None:
+                click.echo(f'! запись {number}: {error}')
+                rejected += 1
+                continue
+            users.append(User(
+                login=row['login'], email=row['email'],
+                password=hash_password(row['password']),
+            ))
+        db.session.add_all(users)
+        try:
+            db.session.commit()
+        except IntegrityError as error:
+            # Логин или почту заняли параллельно с импортом.
+            db.session.rollback()
+            raise click.ClickException(
+                f'Записи {batch[0][0]}-{batch[-1][0]} не сохранены: '
+                f'{error.orig}'
+            )
+        imported += len(users)
+    click.echo(f'Импортировано: {imported}, пропущено: {rejected}')
+
+
+def _file_format(file: TextIO, file_format: str | None) -> str:
+    if file_format:
+        return file_format
+    return 'csv' if getattr(file, 'name', '').endswith('.csv') else 'jsonl'
+
+
+def _read_records(file: TextIO, file_format: str) -> Iterator[dict]:
+    if file_format == 'csv':
+        yield from csv.DictReader(file)
+        return
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+@app.cli.group('recipes')
+def recipes_group() -> None:
+    """
+    Импорт и экспорт рецептов в JSONL (по объекту JSON в строке) или CSV
+    с полями RECIPE_FIELDS. Файлы читаются и пишутся потоково, память не
+    зависит от количества рецептов.
+    """
+
+
+@recipes_group.command('export')
+@click.argument('file', type=click.File('w', encoding='utf-8', lazy=False))
+@click.option('--format', 'file_format', type=click.Choice(['jsonl', 'csv']),
+              help='Формат файла, по умолчанию по расширению.')
+@click.option('--images', type=click.Path(file_okay=False),
+              help='Каталог, в который копируются фотографии рецептов.')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Количество рецептов, читаемых из базы за раз.')
+def export_recipes(
+        file: TextIO,
+        file_format: str | None,
+        images: str | None,
+        batch_size: int,
+) -> None:
+    """
+    Выгружает рецепты в FILE ('-' - стандартный вывод). Автор записывается
+    логином. С --images фотографии копируются в каталог с путями
+    относительно UPLOAD_FOLDER, и поле image содержит такой путь; без
+    него - путь к файлу как есть.
+    """
+    file_format = _file_format(file, file_format)
+    query = select(
+        Recipe.dish_name, Recipe.food_category, Recipe.cooking_time,
+        Recipe.ingredients, Recipe.recipe, Recipe.file_path,
+        User.login, Recipe.created_at,
+    ).outerjoin(User, Recipe.id_user == User.id).order_by(Recipe.id)
+    writer = None
+    if file_format == 'csv':
+        writer = csv.DictWriter(file, RECIPE_FIELDS)
+        writer.writeheader()
+    count = 0
+    for row in db.session.execute(
+            query.execution_options(yield_per=batch_size)
+    ):
+        image = row.file_path
+        if image and images:
+            image = os.path.relpath(image, app.config['UPLOAD_FOLDER'])
+            target = os.path.join(images, image)
+            if os.path.isfile(row.file_path) \
+                    and not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(row.file_path, target)
+        record = {
+            'dish_name': row.dish_name,
+            'food_category': row.food_category,
+            'cooking_time': row.cooking_time,
+            'ingredients': row.ingredients,
+            'recipe': row.recipe,
+            'image': image,
+            'author': row.login,
+            'created_at': row.created_at and row.created_at.isoformat(),
+        }
+        if writer is not None:
+            writer.writerow(record)
+        else:
+            file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        count += 1
+    click.echo(f'Выгружено рецептов: {count}', err=True)
+
+
+@recipes_group.command('import')
+@click.argument('file', type=click.File(encoding='utf-8'))
+@click.option('--format', 'file_format', type=click.Choice(['jsonl', 'csv']),
+              help='Формат файла, по умолчанию по расширению.')
+@click.option('--images', type=click.Path(exists=True, file_okay=False),
+              help='Каталог фотографий, пути image отсчитываются от него.')
+@click.option('--link', is_flag=True,
+              help='Создавать жесткие ссылки на фотографии вместо копий.')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Количество рецептов в одной транзакции.')
+def import_recipes(
+        file: TextIO,
+        file_format: str | None,
+        images: str | None,
+        link: bool,
+        batch_size: int,
+) -> None:
+    """
+    Загружает рецепты из FILE ('-' - стандартный ввод) через
+    Recipe.bulk_create. Записи без категории или с категорией не из
+    реестра categories пропускаются. Автор ищется по логину, неизвестный
+    автор оставляется пустым. С --images фотографии сохраняются в хранилище
+    загрузок (одинаковые файлы - один раз), без него поле image
+    записывается в Recipe.file_path как есть. Уменьшенные копии берутся у
+    рецептов с тем же файлом; для остальных нужно запустить
+    generate-variants.
+    """
+    file_format = _file_format(file, file_format)
+    store_image = lru_cache(maxsize=4096)(
+        partial(upload_storage.save_file, link=link)
+    )
+    known_variants = lru_cache(maxsize=4096)(Recipe.known_image_variants)
+
+    skipped = 0
+
+    @lru_cache(maxsize=4096)
+    def author_id(login: str) -> int | None:
+        return db.session.query(User.id).filter_by(login=login).scalar()
+
+    def rows() -> Iterator[dict]:
+        nonlocal skipped
+        for number, record in enumerate(
+                _read_records(file, file_format), start=1
+        ):
+            food_category = record.get('food_category')
+            if food_category not in categories_by_name:
+                click.echo(
+                    f'! запись {number}: неизвестная категория '
+                    f'{food_category!r}', err=True
+                )
+                skipped += 1
+                continue
+            file_path = record.get('image') or None
+            if file_path and images:
+                try:
+                    file_path = store_image(os.path.join(images, file_path))
+                except OSError as error:
+                    click.echo(f'! запись {number}: {error}', err=True)
+                    file_path = None
+            created_at = record.get('created_at')
+            yield {
+                'id_user': author_id(record['author'])
+                if record.get('author') else None,
+                'dish_name': record.get('dish_name'),
+                'food_category': food_category,
+                'cooking_time': record.get('cooking_time'),
+                'ingredients': record.get('ingredients'),
+                'recipe': record.get('recipe'),
+                'file_path': file_path,
+                'image_variants': known_variants(file_path)
+                if file_path else None,
+                'created_at': datetime.datetime.fromisoformat(created_at)
+                if created_at else None,
+            }
+
+    started = time.perf_counter()
+    count = Recipe.bulk_create(rows(), batch_size=batch_size)
+    click.echo(
+        f'Загружено рецептов: {count}, пропущено: {skipped} '
+        f'за {time.perf_counter() - started:.1f} с'
+    )
@@ -0,0 +1,190 @@
+"""
+Этот модуль содержит сжатие ответов приложения gzip и brotli.
+
+CompressionMiddleware оборачивает WSGI-приложение и сжимает ответы 200 с
+типом содержимого из COMPRESS_MIMETYPES, если клиент принимает br (при
+установленном пакете brotli) или gzip. Не сжимаются:
+
+* ответы с заголовком Content-Encoding (заранее сжатые файлы /assets/);
+* ответы с Cache-Control: no-transform;
+* ответы с известной длиной меньше COMPRESS_MIN_SIZE байт;
+* ответы на запросы HEAD.
+
+Ответ с известной длиной сжимается целиком и отдается с новым
+Content-Length. Потоковый ответ (без Content-Length) сжимается по частям:
+после каждой части сжатые данные сбрасываются клиенту, поэтому поток не
+задерживается до конца ответа.
+
+Сжатые байты отличаются от исходных, поэтому сильный ETag сжатого ответа
+заменяется слабым (W/"..."): conditional() сравнивает ETag слабо, и
+условный запрос с ним по-прежнему получает 304. Ко всем ответам со
+сжимаемым типом добавляется Vary: Accept-Encoding, чтобы промежуточные
+кэши не отдали сжатый ответ клиенту без поддержки сжатия.
+
+Уровни сжатия задаются настройками COMPRESS_LEVEL (gzip) и
+COMPRESS_BROTLI_QUALITY (brotli), сжатие выключается настройкой
+COMPRESS_ENABLED.
+
+Классы модуля:
+
+CompressionMiddleware:
+WSGI-обертка, сжимающая ответы приложения.
+"""
+import zlib
+from typing import Callable, Iterable, Iterator
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header, parse_options_header
+
+from app import app
+
+try:
+    import brotli
+except ImportError:  # ответы сжимаются только gzip
+    brotli = None
+
+
+class _GzipEncoder:
+    def __init__(self, level: int):
+        # wbits 31 - формат gzip с заголовком и контрольной суммой.
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(
+            mode=brotli.MODE_TEXT, quality=quality
+        )
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    WSGI-обертка, сжимающая ответы gzip или brotli по Accept-Encoding.
+
+    :param wsgi_app: оборачиваемое WSGI-приложение
+    :type wsgi_app: Callable
+    :param mimetypes: сжимаемые типы содержимого
+    :type mimetypes: tuple
+    :param min_size: минимальный размер сжимаемого ответа в байтах
+    :type min_size: int
+    :param level: уровень сжатия gzip от 1 до 9
+    :type level: int
+    :param brotli_quality: качество сжатия brotli от 0 до 11
+    :type brotli_quality: int
+    """
+
+    def __init__(
+            self,
+            wsgi_app: Callable,
+            mimetypes: tuple,
+            min_size: int = 500,
+            level: int = 6,
+            brotli_quality: int = 4,
+    ):
+        self.wsgi_app = wsgi_app
+        self.mimetypes = frozenset(mimetypes)
+        self.min_size = min_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+
+    def __call__(self, environ: dict, start_response: Callable) -> Iterable:
+        if environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.wsgi_app(environ, start_response)
+        captured = []
+
+        # Flask вызывает start_response до возврата тела ответа, поэтому
+        # настоящий start_response вызывается после выбора сжатия: для
+        # ответа с известной длиной - уже с новым Content-Length.
+        def capture(status: str, headers: list, exc_info=None) -> None:
+            captured[:] = [status, headers, exc_info]
+
+        app_iter = self.wsgi_app(environ, capture)
+        status, header_list, exc_info = captured
+        headers = Headers(header_list)
+        encoding = self._encoding(environ, status, headers)
+        if encoding is None:
+            start_response(status, headers.to_wsgi_list(), exc_info)
+            return app_iter
+        encoder = _BrotliEncoder(self.brotli_quality) if encoding == 'br' \
+            else _GzipEncoder(self.level)
+        headers['Content-Encoding'] = encoding
+        etag = headers.get('ETag')
+        if etag is not None and not etag.startswith('W/'):
+            headers['ETag'] = f'W/{etag}'
+        if 'Content-Length' not in headers:
+            start_response(status, headers.to_wsgi_list(), exc_info)
+            return self._stream(app_iter, encoder)
+        try:
+            body = b''.join(encoder.compress(chunk) for chunk in app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+        body += encoder.finish()
+        headers['Content-Length'] = str(len(body))
+        start_response(status, headers.to_wsgi_list(), exc_info)
+        return [body]
+
+    def _encoding(
+            self, environ: dict, status: str, headers: Headers
+    ) -> str | None:
+        if not status.startswith('200') or 'Content-Encoding' in headers:
+            return None
+        mimetype, _ = parse_options_header(headers.get('Content-Type'))
+        if mimetype not in self.mimetypes:
+            return None
+        vary = headers.get('Vary')
+        if vary is None:
+            headers['Vary'] = 'Accept-Encoding'
+        elif 'accept-encoding' not in vary.lower():
+            headers['Vary'] = f'{vary}, Accept-Encoding'
+        if 'no-transform' in headers.get('Cache-Control', ''):
+            return None
+        length = headers.get('Content-Length', type=int)
+        if length is not None and length < self.min_size:
+            return None
+        accept = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING'))
+        if brotli is not None and accept.quality('br'):
+            return 'br'
+        if accept.quality('gzip'):
+            return 'gzip'
+        return None
+
+    @staticmethod
+    def _stream(app_iter: Iterable, encoder) -> Iterator[bytes]:
+        try:
+            for chunk in app_iter:
+                data = encoder.compress(chunk) + encoder.flush()
+                if data:
+                    yield data
+            yield encoder.finish()
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+
+if app.config['COMPRESS_ENABLED']:
+    app.wsgi_app = CompressionMiddleware(
+        app.wsgi_app,
+        app.config['COMPRESS_MIMETYPES'],
+        min_size=app.config['COMPRESS_MIN_SIZE'],
+        level=app.config['COMPRESS_LEVEL'],
+        brotli_quality=app.config['COMPRESS_BROTLI_QUALITY'],
+    )
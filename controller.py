@@ -2,33 +2,110 @@
 Этот модуль содержит набор функций, которые используются для реализации
 функциональности веб-приложения.
 """
-import os
-from datetime import datetime
-
-from flask import request, redirect, render_template, flash, url_for, Response
+from flask import (
+    request, redirect, render_template, flash, url_for, Response, abort,
+    jsonify, send_from_directory,
+)
 from flask_login import login_required, login_user, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
+from sqlalchemy.orm import undefer_group
 
+from api import (
+    API_FIELDS, API_LIST_FIELDS, category_validators, json_error, page_limit,
+    parse_fields, recipe_response, stream_recipes,
+)
 from app import app
+from assets import send_asset
+from cache import INDEX_CACHE_TAG, cached_page
+from categories import (
+    categories_by_name, categories_by_slug, category_counts, legacy_slugs,
+)
+from http_cache import conditional, feed_validators, recipe_validators
+from images import is_image
+from ingredients import join_ingredients
+from jobs import enqueue, job_status, queue_stats
+from metrics import has_metrics_token, render_metrics
 from models import User, Recipe
-from business_logic import check_new_user, allowed_file
+from pagination import Page
+from passwords import authenticate
+from profiling import list_profiles
+from ratelimit import check_rate_limit  # noqa: F401
+from search import search_recipes
+from storage import upload_storage
+from business_logic import (
+    allowed_file, check_new_user, feed_cursor_args, is_admin, register_user,
+)
+import commands  # noqa: F401 (регистрирует консольные команды)
+import compression  # noqa: F401 (сжимает ответы приложения)
+import errors  # noqa: F401 (регистрирует обработчики ошибок)
 
 
 @app.route('/')
 @app.route('/index/')
+@conditional(feed_validators(INDEX_CACHE_TAG))
+@cached_page(INDEX_CACHE_TAG)
 def index() -> Response | str:
     """
     Views для главной страницы.
 
     GET запрос:
-    Возвращает главную страницу приложения,
-    на которой отображаются все рецепты.
+    Возвращает главную страницу приложения со страницей ленты всех
+    рецептов. Соседние страницы выбираются параметрами after и before.
+
+    :return: шаблон index.html с переданной страницей рецептов.
+    """
+    page = Recipe.feed(**feed_cursor_args())
+    return render_template(
+        'index.html', receipts=page.items, page=page
+    )
+
+
+@app.route('/search/')
+def search() -> Response | str:
+    """
+    Views для страницы полнотекстового поиска рецептов.
+
+    GET запрос:
+    Извлекает из запроса строку поиска q и номер страницы page.
+    Возвращает страницу с карточками найденных рецептов, упорядоченными
+    по релевантности.
+
+    :return: render_template(search_results.html, receipts=receipts,
+             query=query, page=page, has_next=has_next)
+    """
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    receipts, has_next = search_recipes(
+        query, page=page, per_page=app.config['RECIPES_PER_PAGE']
+    )
+    return render_template(
+        'search_results.html',
+        receipts=receipts,
+        query=query,
+        page=page,
+        has_next=has_next,
+    )
+
+
+@app.route('/by_ingredients/')
+def by_ingredients() -> Response | str:
+    """
+    Views для страницы рецептов, содержащих заданные ингредиенты.
+
+    GET запрос:
+    Извлекает из запроса список ингредиентов name (параметр можно
+    повторять) и возвращает страницу ленты рецептов, в которых есть все
+    перечисленные ингредиенты.
 
-    :return: шаблон index.html с переданным списком рецептов.
+    :return: render_template(ingredient_recipes.html, receipts=page.items,
+             page=page, names=names)
     """
-    receipts = Recipe.query.all()
-    return render_template('index.html', receipts=receipts)
+    names = [name for name in request.args.getlist('name') if name.strip()]
+    page = Page([], None, None)
+    if names:
+        page = Recipe.feed(ingredient_names=names, **feed_cursor_args())
+    return render_template(
+        'ingredient_recipes.html', receipts=page.items, page=page, names=names
+    )
 
 
 @app.route('/register/', methods=['GET', 'POST'])
@@ -41,10 +118,10 @@ def register() -> Response | str:
 
     POST запрос:
     Извлекает из запроса login, email и password.
-    Проверяет, что пользователь с таким логином и email еще не зарегистрирован
-    в базе данных. Если проверка прошла успешно, то создает нового пользователя
-    и перенаправляет его на страницу входа. В противном случае пользователю
-    выводится сообщение об ошибке.
+    Проверяет формат данных и то, что пользователь с таким логином и email
+    еще не зарегистрирован в базе данных. Если проверка прошла успешно, то
+    создает нового пользователя и перенаправляет его на страницу входа. В
+    противном случае пользователю выводится сообщение об ошибке.
 
     :return: render_template(register.html) в случае GET запроса,
              redirect(url_for('input_user')) в случае успешной регистрации,
@@ -55,10 +132,8 @@ def register() -> Response | str:
     login = request.form.get('login', '_')
     email = request.form.get('email')
     password = request.form.get('password', '_')
-    if check_new_user(login=login, email=email, password=password):
-        forms = dict(request.form)
-        forms['password'] = generate_password_hash(password)
-        User.create(**forms)
+    if check_new_user(login=login, email=email, password=password) \
+            and register_user(login, email, password) is not None:
         return redirect(url_for('input_user'))
     return render_template('register.html')
 
@@ -75,6 +150,8 @@ def input_user() -> Response | str:
     Извлекает из запроса email и password.
     Если пользователь с такими данными найден в базе данных,
     то он аутентифицируется и перенаправляется на страницу аккаунта.
+    Пароль проверяется в пуле процессов (модуль passwords), хэш с
+    устаревшими параметрами пересчитывается.
     В противном случае пользователю выводится сообщение об ошибке.
 
     :return: render_template(input_user.html) в случае GET запроса,
@@ -86,7 +163,7 @@ def input_user() -> Response | str:
     email = request.form.get('email', '_')
     password = request.form.get('password', '_')
     user = User.query.filter_by(email=email).first()
-    if user and check_password_hash(user.password, password):
+    if user and authenticate(user, password):
         login_user(user)
         flash(
             {'title': 'Успешно!', 'message': 'Добро пожаловать'},
@@ -111,18 +188,22 @@ def account_user() -> Response:
     Извлекает из базы данных рецепты пользователя с помощью его id.
 
     GET запрос:
-    Возвращает страницу аккаунта пользователя, на которой отображены его
-    рецепты. Если пользователь не аутентифицирован, перенаправляет на страницу
-    входа.
+    Возвращает страницу аккаунта пользователя, на которой отображена
+    страница ленты его рецептов. Если пользователь не аутентифицирован,
+    перенаправляет на страницу входа.
 
-    :return: render_template(account_user.html, recept_user=recept_user)
+    :return: render_template(account_user.html, recept_user=page.items,
+             page=page)
     """
-    recept_user = Recipe.query.filter_by(id_user=current_user.id).all()
-    return render_template('account_user.html', recept_user=recept_user)
+    page = Recipe.feed(id_user=current_user.id, **feed_cursor_args())
+    return render_template(
+        'account_user.html', recept_user=page.items, page=page
+    )
 
 
 @app.route('/open_recept/<int:recept_id>')
 @login_required
+@conditional(recipe_validators)
 def open_recept(recept_id: int) -> Response:
     """
     Views для страницы отображения выбранного рецепта.
@@ -139,92 +220,65 @@ def open_recept(recept_id: int) -> Response:
     :return: render_template(open_recept.html, recept=recept) в случае
             успешного отображения рецепта
     """
-    recept = Recipe.query.filter_by(id=recept_id).first()
+    recept = Recipe.query.options(undefer_group('body')).filter_by(
+        id=recept_id
+    ).first_or_404()
     return render_template('open_recept.html', recept=recept)
 
 
-@app.route('/firs_recipe/')
-def firs_recipe() -> Response:
-    """
-    Views для страницы с рецептами первых блюд.
-
-    Возвращает страницу со списком всех рецептов первых блюд.
-
-    :return: render_template(first_course_recipes.html, receipts=receipts)
-    """
-    receipts = Recipe.query.filter_by(
-        food_category='Рецепты первых блюд'
-    ).all()
-    return render_template('first_course_recipes.html', receipts=receipts)
-
-
-@app.route('/second_recipe/')
-def second_recipe() -> Response:
-    """
-    Views для страницы с рецептами вторых блюд.
-
-    Возвращает страницу со списком всех рецептов вторых блюд.
-
-    :return: render_template('second_course_recipes.html', receipts=receipts)
-    """
-    receipts = Recipe.query.filter_by(
-        food_category='Рецепты вторых блюд'
-    ).all()
-    return render_template('second_course_recipes.html', receipts=receipts)
-
-
-@app.route('/snake/')
-def snake() -> Response:
-    """
-    Views для страницы с рецептами закусок.
-
-    Возвращает страницу со списком всех рецептов закусок.
-
-    :return: return render_template('snack_recipes.html', receipts=receipts)
+@app.route('/category/<slug>/')
+@conditional(feed_validators(INDEX_CACHE_TAG))
+@cached_page(INDEX_CACHE_TAG)
+def category(slug: str) -> Response:
     """
-    receipts = Recipe.query.filter_by(food_category='Рецепты закусок').all()
-    return render_template('snack_recipes.html', receipts=receipts)
+    Views для страницы категории рецептов.
 
+    GET запрос:
+    Возвращает страницу ленты рецептов категории с адресом slug и
+    количеством рецептов в ней. Соседние страницы выбираются параметрами
+    after и before. Боковая панель показывает количество рецептов всех
+    категорий, которое меняется при записи любого рецепта, поэтому
+    страница проверяется и кэшируется по версии главной ленты.
 
-@app.route('/dough_recipes/')
-def dough_recipes() -> Response:
-    """
-    Views для страницы с рецептами изделий из текста.
-
-    Возвращает страницу со списком всех рецептов изделий из теста.
-
-    :return: render_template('dough_recipes.html', receipts=receipts)
-    """
-    receipts = Recipe.query.filter_by(
-        food_category='Рецепты изделий из теста'
-    ).all()
-    return render_template('dough_recipes.html', receipts=receipts)
-
+    :param slug: адрес категории из реестра categories
+    :type slug: str
 
-@app.route('/sweet_recipes/')
-def sweet_recipes() -> Response:
+    :return: render_template(category_recipes.html, category=category,
+             recipe_count=recipe_count, receipts=page.items, page=page)
     """
-    Views для страницы с рецептами сладостей.
+    food_category = categories_by_slug.get(slug)
+    if food_category is None:
+        abort(404)
+    page = Recipe.feed(
+        food_category=food_category.name, **feed_cursor_args()
+    )
+    return render_template(
+        'category_recipes.html',
+        category=food_category,
+        recipe_count=category_counts().get(food_category.name, 0),
+        receipts=page.items,
+        page=page,
+    )
 
-    Возвращает страницу со списком всех рецептов сладостей.
 
-    :return: render_template('sweet_recipes.html', receipts=receipts)
+@app.route(f'/<any({", ".join(legacy_slugs)}):legacy_path>/')
+def legacy_category(legacy_path: str) -> Response:
     """
-    receipts = Recipe.query.filter_by(food_category='Рецепты сладостей').all()
-    return render_template('sweet_recipes.html', receipts=receipts)
-
+    Views для прежних адресов страниц категорий (/firs_recipe/ и другие).
 
-@app.route('/blank_recipes/')
-def blank_recipes() -> Response:
-    """
-    Views для страницы с рецептами заготовок.
+    Перенаправляет на страницу категории /category/<slug>/. Строка запроса
+    передается без изменений: повторяющиеся параметры сохраняются, а
+    параметры вроде slug или _external не попадают в url_for.
 
-    Возвращает страницу со списком всех рецептов сладостей.
+    :param legacy_path: прежний адрес страницы категории
+    :type legacy_path: str
 
-    :return: render_template('snack_recipes.html', receipts=receipts)
+    :return: redirect(url_for('category', slug=slug), 301)
     """
-    receipts = Recipe.query.filter_by(food_category='Рецепты заготовок').all()
-    return render_template('snack_recipes.html', receipts=receipts)
+    target = url_for('category', slug=legacy_slugs[legacy_path])
+    if request.query_string:
+        target = f'{target}?{request.query_string.decode()}'
+    return redirect(target, code=301)
 
 
 @app.route('/recipe_create/', methods=['GET', 'POST'])
@@ -240,8 +294,11 @@ def recipe_create() -> Response | str:
     Извлекает из запроса параметры, необходимые для создания рецепта:
     название блюда, id пользователя, категория блюда, время приготовления,
     список ингредиентов, список их количества и список мер,
-    описание приготовления и изображение. Затем создает объект Recipe в базе
-    данных и перенаправляет пользователя на страницу его аккаунта.
+    описание приготовления и изображение. Сохраняет изображение в хранилище
+    (одинаковые изображения хранятся один раз), создает объект Recipe в базе
+    данных, ставит в очередь фоновую задачу создания уменьшенных копий
+    изображения, если их еще нет, и перенаправляет пользователя на страницу
+    его аккаунта.
 
     :return: render_template('recipe_creation.html') в случае GET запроса,
              redirect(url_for('account_user')) в случае успешного создания рецепта,
@@ -258,25 +315,25 @@ def recipe_create() -> Response | str:
     measure_list = request.form.getlist('measure')
     recipe_step = request.form.get('recipe')
     file = request.files['file']
+    if food_category not in categories_by_name:
+        flash({'title': 'Ошибка!', 'message': 'Неизвестная категория'})
+        return redirect('recipe_creation')
     if file.filename == '':
         flash({'title': 'Ошибка!', 'message': 'Вы не выбрали файл'})
         return redirect('recipe_creation')
     if not (file and allowed_file(file.filename)):
         flash({'title': 'Ошибка!', 'message': 'Неверный файл'})
         return redirect('recipe_creation')
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    filename = secure_filename(f'{timestamp}_{file.filename}')
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(file_path)
-    ingredients_str = ';'.join(
-        [
-            f'{ing},{qty},{meas}'
-            for ing, qty, meas in zip(
-                ingredient_list, quantity_list, measure_list
-            )
-        ]
+    if not is_image(file.stream):
+        flash({'title': 'Ошибка!', 'message': 'Файл не является изображением'})
+        return redirect('recipe_creation')
+    file_path = upload_storage.save(
+        file.stream, file.filename.rsplit('.', 1)[1]
+    )
+    ingredients_str = join_ingredients(
+        zip(ingredient_list, quantity_list, measure_list)
     )
-    Recipe.create(
+    recipe = Recipe.create(
         dish_name=dish_name,
         id_user=id_user,
         food_category=food_category,
@@ -284,10 +341,182 @@ def recipe_create() -> Response | str:
         ingredients=ingredients_str,
         recipe=recipe_step,
         file_path=file_path,
+        image_variants=Recipe.known_image_variants(file_path),
     )
+    if recipe.image_variants is None:
+        enqueue('image_variants', recipe_id=recipe.id)
     return redirect(url_for('account_user'))
 
 
+@app.route('/api/recipes')
+@conditional(feed_validators(INDEX_CACHE_TAG))
+def api_recipes() -> Response:
+    """
+    Views для JSON API списка рецептов от новых к старым.
+
+    Параметры запроса: fields - поля рецептов через запятую (по умолчанию
+    API_LIST_FIELDS), limit - количество рецептов, after - курсор из поля
+    next_cursor предыдущего ответа. Ответ отдается потоком.
+
+    :return: JSON {"items": [...], "next_cursor": ...} или ошибка 400 при
+             неизвестном поле.
+    """
+    fields = parse_fields(request.args.get('fields'), API_LIST_FIELDS)
+    return stream_recipes(fields, page_limit(), request.args.get('after'))
+
+
+@app.route('/api/recipes/<int:recept_id>')
+@conditional(recipe_validators)
+def api_recipe(recept_id: int) -> Response:
+    """
+    Views для JSON API одного рецепта.
+
+    :param recept_id: идентификатор рецепта
+    :type recept_id: int
+
+    :return: JSON с полями рецепта из параметра fields (по умолчанию все
+             поля) или ошибка 404, если рецепта нет. Без входа доступны
+             только поля API_PUBLIC_FIELDS, как и страница рецепта
+             open_recept доступна только после входа.
+    """
+    fields = parse_fields(request.args.get('fields'), tuple(API_FIELDS))
+    return recipe_response(recept_id, fields)
+
+
+@app.route('/api/categories/<slug>/recipes')
+@conditional(category_validators)
+def api_category_recipes(slug: str) -> Response:
+    """
+    Views для JSON API списка рецептов категории. Параметры запроса те же,
+    что у /api/recipes.
+
+    :param slug: адрес категории из реестра categories
+    :type slug: str
+
+    :return: JSON {"items": [...], "next_cursor": ...} или ошибка 404,
+             если категории нет.
+    """
+    food_category = categories_by_slug.get(slug)
+    if food_category is None:
+        return json_error(404, 'Категория не найдена')
+    fields = parse_fields(request.args.get('fields'), API_LIST_FIELDS)
+    return stream_recipes(
+        fields, page_limit(), request.args.get('after'),
+        food_category=food_category.name,
+    )
+
+
+@app.route('/api/users/<int:user_id>/recipes')
+@conditional(feed_validators(INDEX_CACHE_TAG))
+def api_user_recipes(user_id: int) -> Response:
+    """
+    Views для JSON API списка рецептов пользователя. Параметры запроса те
+    же, что у /api/recipes.
+
+    :param user_id: идентификатор пользователя
+    :type user_id: int
+
+    :return: JSON {"items": [...], "next_cursor": ...}
+    """
+    fields = parse_fields(request.args.get('fields'), API_LIST_FIELDS)
+    return stream_recipes(
+        fields, page_limit(), request.args.get('after'), id_user=user_id
+    )
+
+
+@app.route('/jobs/<int:job_id>')
+@login_required
+def job(job_id: int) -> Response:
+    """
+    Views для получения состояния фоновой задачи. Доступна пользователям,
+    логины которых перечислены в PROFILE_ADMINS: ответ содержит текст
+    ошибки задачи.
+
+    :param job_id: идентификатор задачи.
+    :type job_id: int
+
+    :return: JSON с полями задачи или ошибка 404, если задачи нет.
+    """
+    if not is_admin():
+        abort(403)
+    status = job_status(job_id)
+    if status is None:
+        abort(404)
+    return jsonify(status)
+
+
+@app.route('/jobs/stats')
+@login_required
+def jobs_stats() -> Response:
+    """
+    Views для мониторинга очереди фоновых задач: глубина очереди, задержка
+    выполнения и количество ошибок. Доступна пользователям, логины которых
+    перечислены в PROFILE_ADMINS.
+
+    :return: JSON с показателями очереди.
+    """
+    if not is_admin():
+        abort(403)
+    return jsonify(queue_stats())
+
+
+@app.route('/assets/<path:filename>')
+def assets(filename: str) -> Response:
+    """
+    Views для статических файлов с отпечатками содержимого в именах,
+    см. модуль assets. Файлы кэшируются браузером бессрочно.
+
+    :param filename: собранное имя файла.
+    :type filename: str
+    :return: файл, сжатый по Accept-Encoding, или 404.
+    """
+    return send_asset(filename)
+
+
+@app.route('/metrics')
+def metrics() -> Response:
+    """
+    Views для сбора показателей производительности в формате Prometheus.
+    Доступна сборщику с токеном METRICS_TOKEN и пользователям, логины
+    которых перечислены в PROFILE_ADMINS.
+
+    :return: текст показателей.
+    """
+    if not has_metrics_token() and not is_admin():
+        abort(403)
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/admin/profiles/')
+@login_required
+def profiles() -> Response:
+    """
+    Views для просмотра профилей медленных запросов. Доступна
+    пользователям, логины которых перечислены в PROFILE_ADMINS.
+
+    :return: JSON со списком профилей, самые медленные первыми.
+    """
+    if not is_admin():
+        abort(403)
+    return jsonify(list_profiles(app.config['PROFILE_DIR']))
+
+
+@app.route('/admin/profiles/<name>')
+@login_required
+def profile_file(name: str) -> Response:
+    """
+    Views для скачивания файла профиля (pstats или collapsed stacks).
+
+    :param name: имя файла профиля
+    :return: файл профиля.
+    """
+    if not is_admin():
+        abort(403)
+    return send_from_directory(
+        app.config['PROFILE_DIR'], name, as_attachment=True
+    )
+
+
 @app.route('/logout/')
 @login_required
 def logout() -> Response | str:
@@ -21,7 +21,7 @@ def error401(status) -> Response:
         {'title': 'Внимание!', 'message': 'Необходимо авторизоваться.'},
         category='info',
     )
-    return redirect(url_for('input_user')), 301
+    return redirect(url_for('input_user'))
 
 
 @app.errorhandler(404)
@@ -31,14 +31,18 @@ def error404(status) -> str:
     :param status: int(Код ошибки)
     :return: error404.html (Шаблон страницы ошибки)
     """
-    return render_template('errors/error404.html')
+    return render_template('errors/error404.html'), 404
 
 
 @app.errorhandler(429)
-def error429(status) -> str:
+def error429(status) -> Response:
     """
-    Функция отрабатывает ошибку HTTP 429.
-    :param status: int(Код ошибки)
+    Функция отрабатывает ошибку HTTP 429 и передает клиенту заголовок
+    Retry-After с временем ожидания.
+    :param status: TooManyRequests(Исключение)
     :return: error429.html (Шаблон страницы ошибки)
     """
-    return render_template('errors/error429.html')
+    return render_template('errors/error429.html'), 429, {
+        name: value for name, value in status.get_headers()
+        if name == 'Retry-After'
+    }
@@ -0,0 +1,69 @@
+"""
+Настройки gunicorn для рабочего запуска приложения:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Главный процесс один раз загружает приложение и создает N процессов-
+обработчиков (pre-fork), каждый с несколькими потоками. Количество
+процессов задается переменной окружения WEB_CONCURRENCY, потоков -
+WEB_THREADS. Секретный ключ общий для всех процессов (см. app.py),
+поэтому сессия, созданная одним процессом, действительна во всех.
+По той же причине ограничение частоты запросов по умолчанию хранит
+корзины в SQLite (RATELIMIT_BACKEND = 'sqlite').
+
+Соединения с базой данных, открытые главным процессом при загрузке,
+не переходят в дочерние процессы: каждый процесс после fork открывает
+свои. Потоки-исполнители фоновых задач запускаются в каждом
+процессе-обработчике; задачи забираются из очереди атомарно, поэтому
+одна задача выполняется только одним исполнителем.
+
+Функции модуля:
+
+when_ready(server) -> None:
+Возвращает в очередь задачи, зависшие после прошлого запуска.
+
+post_fork(server, worker) -> None:
+Сбрасывает унаследованный пул соединений с базой данных.
+
+post_worker_init(worker) -> None:
+Запускает потоки-исполнители фоновых задач.
+"""
+import multiprocessing
+import os
+
+# Корзины ограничения частоты запросов должны быть общими для процессов.
+os.environ.setdefault('FLASK_RATELIMIT_BACKEND', 'sqlite')
+
+bind = os.environ.get('BIND', '127.0.0.1:8000')
+workers = int(os.environ.get(
+    'WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1
+))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 4))
+preload_app = True
+max_requests = 10000
+max_requests_jitter = 1000
+timeout = 30
+keepalive = 5
+
+
+def when_ready(server) -> None:
+    from app import app
+    from jobs import requeue_stale
+
+    with app.app_context():
+        requeue_stale(app.config['JOB_STALE_TIMEOUT'])
+
+
+def post_fork(server, worker) -> None:
+    from app import app, db
+
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def post_worker_init(worker) -> None:
+    from app import app
+    from jobs import start_workers
+
+    start_workers(app.config['JOB_WORKERS'])
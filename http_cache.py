@@ -0,0 +1,140 @@
+"""
+Этот модуль содержит поддержку условных GET-запросов (ETag, Last-Modified
+и ответ 304 Not Modified) для лент и страниц рецептов.
+
+Валидаторы страницы вычисляются до вызова представления по версии ленты
+из таблицы feed_version, поэтому на повторный запрос с актуальным
+If-None-Match или If-Modified-Since приложение отвечает 304, не выполняя
+выборку рецептов и рендеринг шаблона.
+
+Функции модуля:
+
+conditional(validators: Callable) -> Callable:
+Декоратор представления, отвечающий 304 на запросы с актуальными
+валидаторами.
+
+feed_validators(tag: str) -> Callable:
+Возвращает функцию валидаторов для ленты с тегом tag.
+
+recipe_validators(recept_id: int) -> tuple | None:
+Валидаторы страницы рецепта.
+"""
+import hashlib
+from datetime import datetime
+from functools import wraps
+from typing import Callable
+
+from flask import Response, request, session
+from flask_login import current_user
+
+from app import app, db
+from cache import INDEX_CACHE_TAG
+from models import FeedVersion, Recipe
+
+
+def _variant() -> str:
+    """
+    Возвращает короткий хэш того, что кроме данных ленты влияет на HTML
+    страницы: адрес, параметры запроса и состояние авторизации (шапка сайта).
+    """
+    user = current_user.get_id() if current_user.is_authenticated else ''
+    raw = f'{request.full_path}|{user}'.encode()
+    return hashlib.blake2b(raw, digest_size=8).hexdigest()
+
+
+def feed_validators(tag: str) -> Callable:
+    """
+    Возвращает функцию, вычисляющую валидаторы страницы ленты с тегом tag
+    по версии ленты.
+
+    :param tag: тег ленты: INDEX_CACHE_TAG или название категории
+    :type tag: str
+    :return: функция, принимающая аргументы URL и возвращающая
+             (etag, last_modified)
+    :rtype: Callable
+    """
+    def validators(**view_args) -> tuple[str, datetime | None]:
+        version, updated_at = FeedVersion.current(tag)
+        return f'feed-{version}-{_variant()}', updated_at
+    return validators
+
+
+def recipe_validators(recept_id: int) -> tuple[str, datetime | None] | None:
+    """
+    Вычисляет валидаторы страницы рецепта по версии главной ленты: любая
+    запись рецепта, в том числе изменение этого рецепта, увеличивает
+    версию. Версия категории не подходит: боковая панель страницы
+    показывает количество рецептов всех категорий.
+
+    :param recept_id: идентификатор рецепта
+    :type recept_id: int
+    :return: (etag, last_modified) или None, если рецепта нет
+    :rtype: tuple | None
+    """
+    row = db.session.query(
+        Recipe.created_at, FeedVersion.version, FeedVersion.updated_at
+    ).outerjoin(
+        FeedVersion, FeedVersion.key == INDEX_CACHE_TAG
+    ).filter(Recipe.id == recept_id).first()
+    if row is None:
+        return None
+    created_at, version, updated_at = row
+    return (
+        f'recipe-{recept_id}-{version or 0}-{_variant()}',
+        max(filter(None, (created_at, updated_at)), default=None),
+    )
+
+
+def conditional(validators: Callable) -> Callable:
+    """
+    Декоратор представления для условных GET-запросов.
+
+    Перед вызовом представления вычисляет ETag и Last-Modified функцией
+    validators(**view_args). Если они совпадают с If-None-Match или
+    If-Modified-Since запроса, возвращает 304 без вызова представления.
+    Иначе добавляет валидаторы к ответу представления. ETag слабый: он
+    обозначает версию данных страницы, а не ее байты, и не меняется при
+    сжатии ответа. Страницы с непоказанными уведомлениями toastr не
+    кэшируются.
+
+    :param validators: функция, возвращающая (etag, last_modified) или None
+    :type validators: Callable
+    :return: декоратор
+    :rtype: Callable
+    """
+    def decorator(view: Callable) -> Callable:
+        @wraps(view)
+        def wrapper(*args, **kwargs) -> Response | str:
+            if session.get('_flashes'):
+                return view(*args, **kwargs)
+            result = validators(**kwargs)
+            if result is None:
+                return view(*args, **kwargs)
+            etag, last_modified = result
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                not_modified = (
+                    last_modified is not None
+                    and request.if_modified_since is not None
+                    and last_modified.replace(microsecond=0)
+                    <= request.if_modified_since.replace(tzinfo=None)
+                )
+            if not_modified:
+                response = Response(status=304)
+            else:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            if current_user.is_authenticated:
+                response.cache_control.private = True
+            else:
+                response.cache_control.public = True
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
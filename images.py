@@ -0,0 +1,141 @@
+"""
+Этот модуль содержит обработку загруженных фотографий рецептов.
+
+Для каждой фотографии создаются уменьшенные копии нескольких ширин
+в форматах WebP и JPEG и маленькая размытая заглушка, которая показывается,
+пока браузер загружает подходящую копию. Описание копий хранится в
+Recipe.image_variants в виде JSON:
+
+    {"placeholder": "data:image/jpeg;base64,...",
+     "variants": [[320, "static/uploads/ab/cd/abcd....webp",
+                   "static/uploads/12/34/1234....jpg"], ...]}
+
+Оригинал читается и копии сохраняются через хранилище загрузок (модуль
+storage), поэтому копии, как и оригиналы, адресуются по содержимому.
+
+Функции модуля:
+
+is_image(file: str | IO[bytes]) -> bool:
+Проверяет, что файл является изображением, которое можно обработать.
+
+generate_variants(file_path: str, storage, widths, quality) -> dict:
+Создает копии фотографии и заглушку.
+
+generate_variants_json(file_path: str, storage, widths, quality) -> str:
+То же, но возвращает JSON для Recipe.image_variants.
+"""
+import base64
+import io
+import json
+from typing import IO
+
+from PIL import Image, ImageFilter, ImageOps
+
+from storage import UploadStorage
+
+PLACEHOLDER_WIDTH = 16
+PLACEHOLDER_BLUR = 1
+
+
+def is_image(file: str | IO[bytes]) -> bool:
+    """
+    Быстро проверяет, что файл является изображением: читается только
+    заголовок файла, без декодирования пикселей. Позиция переданного потока
+    возвращается в начало.
+
+    :param file: путь к файлу или поток
+    :type file: str | IO[bytes]
+    :return: результат проверки
+    :rtype: bool
+    """
+    try:
+        with Image.open(file) as image:
+            image.verify()
+    except Exception:
+        return False
+    finally:
+        if not isinstance(file, str):
+            file.seek(0)
+    return True
+
+
+def _placeholder(image: Image.Image) -> str:
+    height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+    small = image.resize((PLACEHOLDER_WIDTH, height), Image.BILINEAR)
+    small = small.filter(ImageFilter.GaussianBlur(PLACEHOLDER_BLUR))
+    buffer = io.BytesIO()
+    small.save(buffer, 'JPEG', quality=40)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/jpeg;base64,{encoded}'
+
+
+def generate_variants(
+        file_path: str,
+        storage: UploadStorage,
+        widths: tuple = (320, 640, 1024),
+        quality: int = 75,
+) -> dict:
+    """
+    Создает копии фотографии ширинами из widths (не больше ширины
+    оригинала) в форматах WebP и JPEG и размытую заглушку.
+
+    :param file_path: путь к оригиналу в хранилище storage
+    :type file_path: str
+    :param storage: хранилище загрузок
+    :type storage: UploadStorage
+    :param widths: ширины копий
+    :type widths: tuple
+    :param quality: качество сжатия копий
+    :type quality: int
+    :return: описание копий для Recipe.image_variants
+    :rtype: dict
+    """
+    with storage.open(file_path) as file, Image.open(file) as original:
+        # Для JPEG декодируем сразу в уменьшенном масштабе, не меньше
+        # самой большой копии: это в разы быстрее полного декодирования.
+        original.draft('RGB', (max(widths), max(widths)))
+        image = ImageOps.exif_transpose(original).convert('RGB')
+    buckets = sorted({min(width, image.width) for width in widths})
+    variants = []
+    for width in buckets:
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS)
+        webp = io.BytesIO()
+        resized.save(webp, 'WEBP', quality=quality, method=4)
+        jpeg = io.BytesIO()
+        resized.save(jpeg, 'JPEG', quality=quality, optimize=True,
+                     progressive=True)
+        variants.append([
+            width,
+            storage.save(io.BytesIO(webp.getvalue()), 'webp'),
+            storage.save(io.BytesIO(jpeg.getvalue()), 'jpg'),
+        ])
+    return {'placeholder': _placeholder(image), 'variants': variants}
+
+
+def generate_variants_json(
+        file_path: str,
+        storage: UploadStorage,
+        widths: tuple = (320, 640, 1024),
+        quality: int = 75,
+) -> str:
+    """
+    Создает копии фотографии и возвращает их описание в JSON.
+    Функция объявлена на уровне модуля, чтобы ее можно было выполнять
+    в пуле процессов (с хранилищем на диске).
+
+    :param file_path: путь к оригиналу в хранилище storage
+    :type file_path: str
+    :param storage: хранилище загрузок
+    :type storage: UploadStorage
+    :param widths: ширины копий
+    :type widths: tuple
+    :param quality: качество сжатия копий
+    :type quality: int
+    :return: JSON для Recipe.image_variants
+    :rtype: str
+    """
+    return json.dumps(
+        generate_variants(file_path, storage, widths, quality),
+        separators=(',', ':'),
+    )
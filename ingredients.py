@@ -0,0 +1,118 @@
+"""
+Этот модуль содержит функции для разбора и нормализации списка
+ингредиентов рецепта.
+
+Ингредиенты хранятся в Recipe.ingredients строкой вида
+"название,количество,мера;название,количество,мера" и дублируются
+по одной записи на ингредиент в таблице recipe_ingredient.
+
+Классы модуля:
+
+Ingredient:
+Ингредиент рецепта: название, количество и мера.
+
+Функции модуля:
+
+parse_ingredients(text: str | None) -> list[Ingredient]:
+Разбирает строку ингредиентов.
+
+parse_ingredients_cached(text: str | None) -> tuple[Ingredient, ...]:
+Разбирает строку ингредиентов с кэшированием результата.
+
+join_ingredients(items) -> str:
+Собирает строку ингредиентов из списка.
+
+canonical_name(name: str) -> str:
+Приводит название ингредиента к каноническому виду для поиска.
+"""
+from functools import lru_cache
+from typing import Iterable, NamedTuple
+
+ITEM_SEPARATOR = ';'
+FIELD_SEPARATOR = ','
+PARSE_CACHE_SIZE = 4096
+
+
+class Ingredient(NamedTuple):
+    """
+    Ингредиент рецепта.
+
+    :param name: название ингредиента
+    :type name: str
+    :param quantity: количество
+    :type quantity: str
+    :param measure: мера
+    :type measure: str
+    """
+    name: str
+    quantity: str
+    measure: str
+
+
+def parse_ingredients(text: str | None) -> list[Ingredient]:
+    """
+    Разбирает строку ингредиентов. Название берется до первой запятой,
+    мера - после последней, а все между ними считается количеством, поэтому
+    дробное количество с запятой ("0,5") разбирается правильно. Пустые
+    элементы пропускаются, недостающие поля заполняются пустыми строками.
+
+    :param text: строка ингредиентов из Recipe.ingredients
+    :type text: str | None
+    :return: список ингредиентов
+    :rtype: list[Ingredient]
+    """
+    items = []
+    for chunk in (text or '').split(ITEM_SEPARATOR):
+        if not chunk.strip():
+            continue
+        name, _, rest = chunk.partition(FIELD_SEPARATOR)
+        quantity, _, measure = rest.rpartition(FIELD_SEPARATOR)
+        if not quantity:
+            quantity, measure = measure, ''
+        items.append(
+            Ingredient(name.strip(), quantity.strip(), measure.strip())
+        )
+    return items
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_ingredients_cached(text: str | None) -> tuple[Ingredient, ...]:
+    """
+    Разбирает строку ингредиентов, как parse_ingredients, и кэширует
+    результат по самой строке: повторные показы рецепта не разбирают ее
+    заново, а измененная строка разбирается как новая. Результат - кортеж,
+    чтобы закэшированное значение нельзя было изменить.
+
+    :param text: строка ингредиентов из Recipe.ingredients
+    :type text: str | None
+    :return: кортеж ингредиентов
+    :rtype: tuple[Ingredient, ...]
+    """
+    return tuple(parse_ingredients(text))
+
+
+def join_ingredients(items: Iterable[tuple[str, str, str]]) -> str:
+    """
+    Собирает строку ингредиентов для Recipe.ingredients.
+
+    :param items: тройки (название, количество, мера)
+    :type items: Iterable[tuple[str, str, str]]
+    :return: строка ингредиентов
+    :rtype: str
+    """
+    return ITEM_SEPARATOR.join(
+        FIELD_SEPARATOR.join(item) for item in items
+    )
+
+
+def canonical_name(name: str) -> str:
+    """
+    Приводит название ингредиента к каноническому виду: нижний регистр,
+    'ё' заменяется на 'е', лишние пробелы удаляются.
+
+    :param name: название ингредиента
+    :type name: str
+    :return: каноническое название
+    :rtype: str
+    """
+    return ' '.join(name.lower().replace('ё', 'е').split())
@@ -0,0 +1,256 @@
+"""
+Этот модуль содержит очередь фоновых задач приложения.
+
+Задачи хранятся в таблице job базы данных приложения, поэтому переживают
+перезапуск и доступны всем процессам. Каждый процесс может запустить
+несколько потоков-исполнителей: поток атомарно забирает одну задачу
+одним UPDATE ... RETURNING, вызывает обработчик ее типа и отмечает
+результат. Упавшая задача повторяется с экспоненциальной задержкой, пока
+не исчерпаны попытки.
+
+Функции модуля:
+
+handler(kind: str) -> Callable:
+Декоратор, регистрирующий обработчик задач типа kind.
+
+enqueue(kind: str, max_attempts: int, **payload) -> Job:
+Ставит задачу в очередь.
+
+run_next() -> bool:
+Выполняет одну готовую задачу в текущем потоке.
+
+start_workers(count: int) -> list[threading.Thread]:
+Запускает потоки-исполнители.
+
+requeue_stale(timeout: int) -> int:
+Возвращает в очередь задачи, зависшие в состоянии running.
+
+job_status(job_id: int) -> dict | None:
+Возвращает состояние задачи.
+
+queue_stats() -> dict:
+Возвращает глубину очереди, задержку и количество ошибок.
+"""
+import datetime
+import json
+import threading
+import traceback
+from typing import Callable
+
+from sqlalchemy import func
+
+from app import app, db
+from models import Job
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+HANDLERS = {}
+
+CLAIM_SQL = (
+    "UPDATE job SET status = 'running', started_at = :now, "
+    "attempts = attempts + 1 "
+    "WHERE id = (SELECT id FROM job WHERE status = 'queued' "
+    "AND run_after <= :now ORDER BY run_after, id LIMIT 1) "
+    "RETURNING id, kind, payload, attempts, max_attempts"
+)
+
+_wakeup = threading.Event()
+
+
+def handler(kind: str) -> Callable:
+    """
+    Декоратор, регистрирующий функцию обработчиком задач типа kind.
+    Обработчик вызывается в контексте приложения с аргументами из payload.
+
+    :param kind: тип задачи
+    :type kind: str
+    :return: декоратор
+    :rtype: Callable
+    """
+    def decorator(function: Callable) -> Callable:
+        HANDLERS[kind] = function
+        return function
+    return decorator
+
+
+def enqueue(kind: str, max_attempts: int = 3, **payload) -> Job:
+    """
+    Ставит задачу в очередь и будит потоки-исполнители текущего процесса.
+
+    :param kind: тип задачи
+    :type kind: str
+    :param max_attempts: максимальное количество попыток
+    :type max_attempts: int
+    :param payload: аргументы обработчика, должны сериализоваться в JSON
+    :type payload: dict
+    :return: созданная задача
+    :rtype: Job
+    """
+    job = Job.create(
+        kind=kind, payload=json.dumps(payload), max_attempts=max_attempts
+    )
+    _wakeup.set()
+    return job
+
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.utcnow()
+
+
+def run_next() -> bool:
+    """
+    Забирает одну готовую задачу и выполняет ее в текущем потоке.
+    Должна вызываться в контексте приложения.
+
+    :return: True, если задача была выполнена (успешно или нет)
+    :rtype: bool
+    """
+    row = db.session.execute(db.text(CLAIM_SQL), {'now': _utcnow()}).first()
+    db.session.commit()
+    if row is None:
+        return False
+    job_id, kind, payload, attempts, max_attempts = row
+    try:
+        HANDLERS[kind](**json.loads(payload))
+    except Exception:
+        db.session.rollback()
+        failed = attempts >= max_attempts
+        db.session.query(Job).filter_by(id=job_id).update({
+            'status': FAILED if failed else QUEUED,
+            'run_after': _utcnow() + datetime.timedelta(
+                seconds=app.config['JOB_RETRY_DELAY'] * 2 ** (attempts - 1)
+            ),
+            'finished_at': _utcnow() if failed else None,
+            'error': traceback.format_exc(limit=5),
+        })
+        app.logger.exception('Задача %s (%s) завершилась ошибкой',
+                             job_id, kind)
+    else:
+        db.session.query(Job).filter_by(id=job_id).update({
+            'status': DONE, 'finished_at': _utcnow(), 'error': None,
+        })
+    db.session.commit()
+    return True
+
+
+def _work_loop(stop: threading.Event) -> None:
+    while not stop.is_set():
+        with app.app_context():
+            try:
+                busy = run_next()
+            except Exception:
+                app.logger.exception('Ошибка исполнителя фоновых задач')
+                busy = False
+        if not busy:
+            _wakeup.wait(app.config['JOB_POLL_INTERVAL'])
+            _wakeup.clear()
+
+
+def start_workers(
+        count: int, stop: threading.Event | None = None
+) -> list[threading.Thread]:
+    """
+    Запускает потоки-исполнители задач. Потоки работают как демоны и
+    завершаются вместе с процессом или после установки события stop.
+
+    :param count: количество потоков
+    :type count: int
+    :param stop: событие остановки исполнителей
+    :type stop: threading.Event | None
+    :return: запущенные потоки
+    :rtype: list[threading.Thread]
+    """
+    stop = stop or threading.Event()
+    threads = []
+    for number in range(count):
+        thread = threading.Thread(
+            target=_work_loop, args=(stop,), name=f'job-worker-{number}',
+            daemon=True,
+        )
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+def requeue_stale(timeout: int) -> int:
+    """
+    Возвращает в очередь задачи, которые находятся в состоянии running
+    дольше timeout секунд (например, процесс-исполнитель был остановлен).
+
+    :param timeout: время в секундах
+    :type timeout: int
+    :return: количество возвращенных задач
+    :rtype: int
+    """
+    deadline = _utcnow() - datetime.timedelta(seconds=timeout)
+    count = db.session.query(Job).filter(
+        Job.status == RUNNING, Job.started_at < deadline
+    ).update({'status': QUEUED})
+    db.session.commit()
+    return count
+
+
+def job_status(job_id: int) -> dict | None:
+    """
+    Возвращает состояние задачи.
+
+    :param job_id: идентификатор задачи
+    :type job_id: int
+    :return: словарь с полями задачи или None, если задачи нет
+    :rtype: dict | None
+    """
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return None
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at and job.started_at.isoformat(),
+        'finished_at': job.finished_at and job.finished_at.isoformat(),
+        'error': job.error,
+    }
+
+
+def queue_stats(window: int = 3600) -> dict:
+    """
+    Возвращает показатели очереди для мониторинга: количество задач по
+    состояниям, количество готовых к выполнению задач, а также среднюю и
+    максимальную задержку от постановки до завершения задач, завершенных
+    за последние window секунд.
+
+    :param window: окно расчета задержки в секундах
+    :type window: int
+    :return: словарь показателей
+    :rtype: dict
+    """
+    counts = dict(db.session.query(Job.status, func.count()).group_by(
+        Job.status
+    ).all())
+    now = _utcnow()
+    ready = db.session.query(func.count()).select_from(Job).filter(
+        Job.status == QUEUED, Job.run_after <= now
+    ).scalar()
+    latency = (func.julianday(Job.finished_at)
+               - func.julianday(Job.created_at)) * 86400
+    average, maximum, recent_failed = db.session.query(
+        func.avg(latency),
+        func.max(latency),
+        func.sum(Job.status == FAILED),
+    ).filter(
+        Job.finished_at >= now - datetime.timedelta(seconds=window)
+    ).one()
+    return {
+        'depth': ready,
+        'by_status': {status: counts.get(status, 0)
+                      for status in (QUEUED, RUNNING, DONE, FAILED)},
+        'latency_avg_seconds': average or 0.0,
+        'latency_max_seconds': maximum or 0.0,
+        'failed_recent': recent_failed or 0,
+    }
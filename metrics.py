@@ -0,0 +1,383 @@
+"""
+Этот модуль содержит сбор показателей производительности приложения и их
+вывод в текстовом формате Prometheus.
+
+Для каждого запроса записываются время обработки, количество и суммарное
+время SQL-запросов (события движка SQLAlchemy), время рендеринга шаблонов
+(сигналы Flask) и размер ответа. Значения накапливаются в гистограммах с
+фиксированными границами по имени представления, поэтому запись одного
+значения - это поиск корзины и увеличение счетчика под блокировкой, и сбор
+можно не отключать под нагрузкой.
+
+Показатели хранятся в памяти процесса: при запуске в нескольких процессах
+каждый процесс отдает свои значения.
+
+Показатели раскрывают нагрузку по представлениям и состояние очереди
+задач, поэтому /metrics отдается только сборщику с токеном METRICS_TOKEN
+(заголовок Authorization: Bearer <токен>) или администратору из
+PROFILE_ADMINS.
+
+Классы модуля:
+
+Counter:
+Счетчик с метками.
+
+Histogram:
+Гистограмма с метками и фиксированными границами корзин.
+
+Функции модуля:
+
+render_metrics() -> str:
+Возвращает все показатели в текстовом формате Prometheus.
+
+has_metrics_token() -> bool:
+Проверяет токен сборщика показателей в заголовке Authorization.
+"""
+import bisect
+import hmac
+import threading
+import time
+
+from flask import g, has_request_context, request
+from flask.signals import before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import app
+from cache import page_cache
+from jobs import queue_stats
+from models import user_cache
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (
+    1024, 4096, 16384, 65536, 262144, 1048576, 4194304,
+)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+        '\n', r'\n'
+    )
+
+
+def _labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"'
+             for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """
+    Потокобезопасный счетчик с метками.
+
+    :param name: имя показателя
+    :type name: str
+    :param documentation: описание показателя
+    :type documentation: str
+    :param labels: имена меток
+    :type labels: tuple
+    """
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *label_values) -> None:
+        """
+        Увеличивает значение счетчика с метками label_values.
+
+        :param amount: величина увеличения
+        :type amount: float
+        :param label_values: значения меток в порядке labels
+        :type label_values: tuple
+        :return: None
+        """
+        with self._lock:
+            self._values[label_values] = \
+                self._values.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        """
+        Возвращает строки показателя в текстовом формате Prometheus.
+
+        :return: строки показателя
+        :rtype: list[str]
+        """
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} counter']
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in values:
+            lines.append(
+                f'{self.name}{_labels(self.labels, label_values)} {value}'
+            )
+        return lines
+
+
+class Histogram:
+    """
+    Потокобезопасная гистограмма с метками. Для каждого набора меток
+    хранятся количество значений в каждой корзине, их сумма и количество.
+
+    :param name: имя показателя
+    :type name: str
+    :param documentation: описание показателя
+    :type documentation: str
+    :param buckets: верхние границы корзин по возрастанию
+    :type buckets: tuple
+    :param labels: имена меток
+    :type labels: tuple
+    """
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            buckets: tuple,
+            labels: tuple = ('endpoint',),
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        """
+        Записывает значение в гистограмму с метками label_values.
+
+        :param value: значение
+        :type value: float
+        :param label_values: значения меток в порядке labels
+        :type label_values: tuple
+        :return: None
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [
+                    [0] * (len(self.buckets) + 1), 0.0, 0
+                ]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        """
+        Возвращает строки показателя в текстовом формате Prometheus:
+        накопленные значения корзин, сумму и количество.
+
+        :return: строки показателя
+        :rtype: list[str]
+        """
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(key, list(counts), total, count)
+                      for key, (counts, total, count) in self._series.items()]
+        for label_values, counts, total, count in series:
+            cumulative = 0
+            bounds = [*map(str, self.buckets), '+Inf']
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                labels = _labels(self.labels, label_values, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+REQUESTS = Counter(
+    'http_requests_total', 'Количество обработанных запросов.',
+    ('endpoint', 'method', 'status'),
+)
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Время обработки запроса.',
+    LATENCY_BUCKETS,
+)
+REQUEST_SQL_QUERIES = Histogram(
+    'http_request_sql_queries', 'Количество SQL-запросов на запрос.',
+    QUERY_COUNT_BUCKETS,
+)
+REQUEST_SQL_DURATION = Histogram(
+    'http_request_sql_duration_seconds',
+    'Суммарное время SQL-запросов на запрос.', LATENCY_BUCKETS,
+)
+REQUEST_TEMPLATE_DURATION = Histogram(
+    'http_request_template_duration_seconds',
+    'Суммарное время рендеринга шаблонов на запрос.', LATENCY_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes', 'Размер тела ответа.', SIZE_BUCKETS,
+)
+SQL_QUERIES = Counter(
+    'sql_queries_total',
+    'Количество SQL-запросов, включая фоновые задачи.',
+)
+SQL_DURATION = Counter(
+    'sql_query_duration_seconds_total',
+    'Суммарное время SQL-запросов, включая фоновые задачи.',
+)
+
+METRICS = (
+    REQUESTS, REQUEST_DURATION, REQUEST_SQL_QUERIES, REQUEST_SQL_DURATION,
+    REQUEST_TEMPLATE_DURATION, RESPONSE_SIZE, SQL_QUERIES, SQL_DURATION,
+)
+
+
+@app.before_request
+def start_request_metrics() -> None:
+    """
+    Запоминает время начала запроса и обнуляет счетчики SQL и шаблонов.
+
+    :return: None
+    """
+    g.metrics_started = time.perf_counter()
+    g.sql_queries = 0
+    g.sql_time = 0.0
+    g.template_time = 0.0
+
+
+@app.after_request
+def record_request_metrics(response):
+    """
+    Записывает показатели завершенного запроса.
+
+    :param response: HTTP-ответ
+    :type response: flask.wrappers.Response
+    :return: HTTP-ответ
+    :rtype: flask.wrappers.Response
+    """
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    REQUESTS.inc(1, endpoint, request.method, response.status_code)
+    REQUEST_DURATION.observe(time.perf_counter() - started, endpoint)
+    REQUEST_SQL_QUERIES.observe(g.sql_queries, endpoint)
+    REQUEST_SQL_DURATION.observe(g.sql_time, endpoint)
+    REQUEST_TEMPLATE_DURATION.observe(g.template_time, endpoint)
+    if response.content_length is not None:
+        RESPONSE_SIZE.observe(response.content_length, endpoint)
+    return response
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany) -> None:
+    conn.info.setdefault('metrics_query_started', []).append(
+        time.perf_counter()
+    )
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany) -> None:
+    elapsed = time.perf_counter() - conn.info['metrics_query_started'].pop()
+    SQL_QUERIES.inc()
+    SQL_DURATION.inc(elapsed)
+    if has_request_context() and 'metrics_started' in g:
+        g.sql_queries += 1
+        g.sql_time += elapsed
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context) -> None:
+    started = context.connection.info.get('metrics_query_started') \
+        if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+@before_render_template.connect_via(app)
+def _before_render_template(sender, template, context, **extra) -> None:
+    # Шаблоны могут рендериться вложенно (уведомления toastr), время
+    # считается по самому внешнему.
+    if 'metrics_started' in g:
+        if not g.get('template_depth'):
+            g.template_started = time.perf_counter()
+        g.template_depth = g.get('template_depth', 0) + 1
+
+
+@template_rendered.connect_via(app)
+def _template_rendered(sender, template, context, **extra) -> None:
+    if g.get('template_depth'):
+        g.template_depth -= 1
+        if not g.template_depth:
+            g.template_time += time.perf_counter() - g.template_started
+
+
+def _gauge(name: str, documentation: str, value: float,
+           labels: str = '') -> list[str]:
+    return [f'# HELP {name} {documentation}', f'# TYPE {name} gauge',
+            f'{name}{labels} {value}']
+
+
+def has_metrics_token() -> bool:
+    """
+    Проверяет, что запрос содержит заголовок Authorization: Bearer с
+    токеном METRICS_TOKEN. Без настроенного токена возвращает False.
+
+    :return: True, если токен совпадает
+    :rtype: bool
+    """
+    token = app.config['METRICS_TOKEN']
+    if not token:
+        return False
+    return hmac.compare_digest(
+        request.headers.get('Authorization', '').encode(),
+        f'Bearer {token}'.encode(),
+    )
+
+
+def render_metrics() -> str:
+    """
+    Возвращает показатели запросов, кэшей страниц и пользователей и
+    очереди фоновых задач
+    в текстовом формате Prometheus. Должна вызываться в контексте
+    приложения: показатели очереди читаются из базы данных.
+
+    :return: текст показателей
+    :rtype: str
+    """
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for prefix, title, lru_cache in (
+            ('page_cache', 'кэше страниц', page_cache),
+            ('user_cache', 'кэше пользователей', user_cache),
+    ):
+        stats = lru_cache.stats()
+        lines += _gauge(f'{prefix}_entries', f'Записей в {title}.',
+                        stats['entries'])
+        lines += _gauge(f'{prefix}_bytes', f'Размер записей в {title}.',
+                        stats['bytes'])
+        for name in ('hits', 'misses', 'evictions'):
+            lines += [f'# TYPE {prefix}_{name}_total counter',
+                      f'{prefix}_{name}_total {stats[name]}']
+    queue = queue_stats()
+    lines += _gauge('job_queue_depth', 'Задач, готовых к выполнению.',
+                    queue['depth'])
+    lines.append('# TYPE job_queue_jobs gauge')
+    for status, count in queue['by_status'].items():
+        lines.append(f'job_queue_jobs{{status="{status}"}} {count}')
+    lines += _gauge('job_latency_avg_seconds',
+                    'Средняя задержка выполнения задач за час.',
+                    queue['latency_avg_seconds'])
+    lines += _gauge('job_latency_max_seconds',
+                    'Максимальная задержка выполнения задач за час.',
+                    queue['latency_max_seconds'])
+    lines += _gauge('job_failed_recent', 'Задач, упавших за час.',
+                    queue['failed_recent'])
+    return '\n'.join(lines) + '\n'
@@ -4,10 +4,22 @@
 хранить информацию о пользователях и рецептах.
 """
 import datetime
+from collections import Counter
+from itertools import islice
+from typing import Any, Iterable
 
 from flask_login import UserMixin
+from sqlalchemy import event, func, inspect, intersect, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import deferred, make_transient_to_detached, validates
 
 from app import db, app, manager
+from cache import INDEX_CACHE_TAG, LRUCache, page_cache
+from ingredients import (
+    Ingredient, canonical_name, parse_ingredients, parse_ingredients_cached,
+)
+from pagination import Page, keyset_paginate
+from search import ensure_search_index
 
 
 class BaseModel:
@@ -18,7 +30,7 @@ class BaseModel:
     :type created_at: datetime
     """
     id = db.Column(db.Integer, primary_key=True)
-    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow())
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
 
     def save(self) -> None:
         """
@@ -38,10 +50,39 @@ class BaseModel:
         :type args: tuple
         :param kwargs: Аргументы ключевого слова для передачи конструктору модели.
         :type kwargs: dict
-        :return: None
+        :return: созданный объект
+        :rtype: BaseModel
+        """
+        instance = cls(*args, **kwargs)
+        instance.save()
+        return instance
+
+    @classmethod
+    def bulk_create(cls, rows: Iterable[dict], batch_size: int = 1000) -> int:
         """
-        new_user = cls(*args, **kwargs)
-        new_user.save()
+        Вставляет записи пачками в обход ORM, по одной транзакции на пачку:
+        save, валидаторы и события ORM не вызываются. Записи читаются из
+        rows по мере вставки, поэтому итератор может быть любой длины.
+        Все словари одной пачки должны иметь одинаковые ключи.
+
+        :param rows: словари значений столбцов
+        :type rows: Iterable[dict]
+        :param batch_size: количество записей в одной транзакции
+        :type batch_size: int
+        :return: количество вставленных записей
+        :rtype: int
+        """
+        rows = iter(rows)
+        total = 0
+        while batch := list(islice(rows, batch_size)):
+            cls._insert_batch(batch)
+            db.session.commit()
+            total += len(batch)
+        return total
+
+    @classmethod
+    def _insert_batch(cls, rows: list[dict]) -> None:
+        db.session.execute(cls.__table__.insert(), rows)
 
 
 class User(db.Model, BaseModel, UserMixin):
@@ -63,6 +104,22 @@ class User(db.Model, BaseModel, UserMixin):
     password = db.Column(db.String(100))
 
 
+# Загрузчик пользователей Flask-Login вызывается в каждом запросе
+# авторизованного пользователя, поэтому его записи кэшируются. Хэш пароля в
+# кэш не попадает: при обращении к нему выполняется отдельный запрос.
+USER_CACHE_COLUMNS = ('id', 'login', 'email', 'created_at')
+user_cache = LRUCache(
+    app.config['USER_CACHE_MAX_ENTRIES'], ttl=app.config['USER_CACHE_TTL']
+)
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_user_cache(mapper, connection, target: User) -> None:
+    # Изменения в других процессах становятся видны через USER_CACHE_TTL.
+    user_cache.delete(str(target.id))
+
+
 class Recipe(db.Model, BaseModel):
     """
     Модель рецепта.
@@ -73,35 +130,573 @@ class Recipe(db.Model, BaseModel):
     :type food_category: str
     :param file_path: путь к файлу с изображением блюда
     :type file_path: str
+    :param image_variants: JSON с уменьшенными копиями изображения и
+                           заглушкой, см. модуль images
+    :type image_variants: str
     :param cooking_time: время приготовления блюда
     :type cooking_time: str
     :param ingredients: ингредиенты блюда
     :type ingredients: str
     :param recipe: инструкции по приготовлению блюда
     :type recipe: str
+    :param ingredient_items: ингредиенты блюда по одной записи на ингредиент,
+                             заполняются автоматически при присваивании
+                             ingredients
+    :type ingredient_items: list[RecipeIngredient]
+
+    Столбцы ingredients и recipe входят в отложенную группу 'body' и
+    загружаются только при обращении к ним или с опцией undefer_group('body').
+    Для списков рецептов используется проекция Recipe.cards().
     """
 
+    CARD_COLUMNS = ('id', 'dish_name', 'food_category', 'file_path',
+                    'image_variants', 'created_at')
+
+    __table_args__ = (
+        db.Index('ix_recipe_created_at', 'created_at'),
+        db.Index(
+            'ix_recipe_food_category_created_at', 'food_category', 'created_at'
+        ),
+        db.Index('ix_recipe_id_user_created_at', 'id_user', 'created_at'),
+        db.Index('ix_recipe_file_path', 'file_path'),
+    )
+
     id_user = db.Column(db.Integer, db.ForeignKey('user.id'))
     dish_name = db.Column(db.String(100))
-    food_category = db.Column(db.String(100))
+    food_category = db.Column(db.String(100), index=True)
     file_path = db.Column(db.String(700))
+    image_variants = db.Column(db.Text())
     cooking_time = db.Column(db.String(100))
-    ingredients = db.Column(db.Text())
-    recipe = db.Column(db.Text())
+    ingredients = deferred(db.Column(db.Text()), group='body')
+    recipe = deferred(db.Column(db.Text()), group='body')
+    ingredient_items = db.relationship(
+        'RecipeIngredient',
+        order_by='RecipeIngredient.position',
+        cascade='all, delete-orphan',
+    )
+
+    def save(self) -> None:
+        """
+        Сохраняет рецепт в базе данных, в той же транзакции увеличивает
+        версии главной ленты и категории рецепта (прежней и новой, если
+        категория изменилась) и количество рецептов в них, затем сбрасывает
+        кэш страниц этих лент.
+
+        :return: None
+        """
+        state = inspect(self)
+        history = state.attrs.food_category.history
+        categories = set(filter(None, (self.food_category, *history.deleted)))
+        counts = Counter(history.added)
+        counts.subtract(history.deleted)
+        if not state.has_identity:
+            counts[INDEX_CACHE_TAG] += 1
+        FeedVersion.bump(INDEX_CACHE_TAG, *categories, counts=counts)
+        super().save()
+        page_cache.invalidate(INDEX_CACHE_TAG, *categories)
+
+    @classmethod
+    def bulk_create(cls, rows: Iterable[dict], batch_size: int = 1000) -> int:
+        """
+        Вставляет рецепты пачками, по одной транзакции на пачку. В той же
+        транзакции заполняются ингредиенты рецептов и увеличиваются версии
+        затронутых лент; после вставки кэш страниц сбрасывается целиком.
+        Поисковый индекс заполняется триггерами.
+
+        :param rows: словари значений столбцов рецепта; отсутствующие
+                     столбцы получают значения None, created_at - текущее
+                     время, идентификаторы назначаются заново
+        :type rows: Iterable[dict]
+        :param batch_size: количество рецептов в одной транзакции
+        :type batch_size: int
+        :return: количество вставленных рецептов
+        :rtype: int
+        """
+        total = super().bulk_create(rows, batch_size)
+        page_cache.clear()
+        return total
+
+    @classmethod
+    def _insert_batch(cls, rows: list[dict]) -> None:
+        counts = Counter(row.get('food_category') for row in rows)
+        counts[INDEX_CACHE_TAG] = len(rows)
+        # Рецепты без категории попадают только в главную ленту.
+        FeedVersion.bump(*filter(None, counts), counts=counts)
+        # После записи версий транзакция держит блокировку записи SQLite,
+        # поэтому идентификаторы рецептов можно назначить заранее и сразу
+        # вставить ингредиенты.
+        next_id = db.session.query(func.max(cls.id)).scalar() or 0
+        now = datetime.datetime.utcnow()
+        columns = [column.name for column in cls.__table__.columns]
+        recipes = []
+        ingredients = []
+        for row in rows:
+            next_id += 1
+            recipe = {column: row.get(column) for column in columns}
+            recipe['id'] = next_id
+            recipe['created_at'] = recipe['created_at'] or now
+            recipes.append(recipe)
+            ingredients.extend(
+                {
+                    'recipe_id': next_id,
+                    'position': position,
+                    'name': item.name,
+                    'canonical_name': canonical_name(item.name),
+                    'quantity': item.quantity,
+                    'measure': item.measure,
+                    'created_at': now,
+                }
+                for position, item in enumerate(
+                    parse_ingredients(recipe['ingredients'])
+                )
+            )
+        db.session.execute(cls.__table__.insert(), recipes)
+        if ingredients:
+            db.session.execute(
+                RecipeIngredient.__table__.insert(), ingredients
+            )
+
+    @property
+    def ingredient_list(self) -> tuple[Ingredient, ...]:
+        """
+        Ингредиенты рецепта тройками (название, количество, мера) для
+        шаблонов и API. Строка ingredients разбирается один раз, результат
+        кэшируется функцией parse_ingredients_cached.
+
+        :return: кортеж ингредиентов
+        :rtype: tuple[Ingredient, ...]
+        """
+        return parse_ingredients_cached(self.ingredients)
+
+    @validates('ingredients')
+    def _sync_ingredient_items(self, key: str, value: str | None) -> str:
+        """
+        Заполняет ingredient_items по строке ингредиентов при каждом
+        присваивании Recipe.ingredients.
+        """
+        self.ingredient_items = [
+            RecipeIngredient.from_parsed(position, item)
+            for position, item in enumerate(parse_ingredients(value))
+        ]
+        return value
+
+    @classmethod
+    def known_image_variants(cls, file_path: str) -> str | None:
+        """
+        Возвращает уменьшенные копии изображения, уже созданные для другого
+        рецепта с тем же файлом. Файлы хранятся по хэшу содержимого, поэтому
+        одинаковый путь означает одинаковое изображение.
+
+        :param file_path: путь к изображению
+        :type file_path: str
+        :return: JSON уменьшенных копий или None
+        :rtype: str | None
+        """
+        return db.session.query(cls.image_variants).filter(
+            cls.file_path == file_path, cls.image_variants.isnot(None)
+        ).limit(1).scalar()
+
+    @classmethod
+    def cards(cls, **filters) -> Any:
+        """
+        Возвращает запрос карточек рецептов: только столбцы CARD_COLUMNS
+        в виде именованных строк Row вместо полных объектов модели.
+
+        :param filters: условия для filter_by, например food_category
+        :type filters: dict
+        :return: запрос SQLAlchemy
+        :rtype: Query
+        """
+        columns = [getattr(cls, name) for name in cls.CARD_COLUMNS]
+        return db.session.query(*columns).filter_by(**filters)
+
+    @classmethod
+    def feed(
+            cls,
+            after: str | None = None,
+            before: str | None = None,
+            per_page: int | None = None,
+            ingredient_names: list[str] | None = None,
+            **filters,
+    ) -> Page:
+        """
+        Возвращает страницу ленты карточек рецептов от новых к старым.
+
+        :param after: курсор для перехода к более старым рецептам
+        :type after: str | None
+        :param before: курсор для перехода к более новым рецептам
+        :type before: str | None
+        :param per_page: размер страницы, по умолчанию RECIPES_PER_PAGE
+        :type per_page: int | None
+        :param ingredient_names: если задан, в ленту попадают только рецепты,
+                                 содержащие все перечисленные ингредиенты
+        :type ingredient_names: list[str] | None
+        :param filters: условия для filter_by, например food_category
+        :type filters: dict
+        :return: страница ленты
+        :rtype: Page
+        """
+        query = cls.cards(**filters)
+        if ingredient_names:
+            query = query.filter(
+                cls.id.in_(RecipeIngredient.recipe_ids(ingredient_names))
+            )
+        return keyset_paginate(
+            query,
+            cls.created_at,
+            cls.id,
+            per_page or app.config['RECIPES_PER_PAGE'],
+            after=after,
+            before=before,
+        )
+
+
+class RecipeIngredient(db.Model, BaseModel):
+    """
+    Модель ингредиента рецепта.
+
+    :param recipe_id: идентификатор рецепта
+    :type recipe_id: int
+    :param position: порядковый номер ингредиента в рецепте
+    :type position: int
+    :param name: название ингредиента, как его ввел автор
+    :type name: str
+    :param canonical_name: каноническое название для поиска
+    :type canonical_name: str
+    :param quantity: количество
+    :type quantity: str
+    :param measure: мера
+    :type measure: str
+    """
+
+    __table_args__ = (
+        db.Index(
+            'ix_recipe_ingredient_canonical_name_recipe_id',
+            'canonical_name',
+            'recipe_id',
+        ),
+        db.Index('ix_recipe_ingredient_recipe_id', 'recipe_id', 'position'),
+    )
+
+    recipe_id = db.Column(
+        db.Integer, db.ForeignKey('recipe.id'), nullable=False
+    )
+    position = db.Column(db.Integer, nullable=False, default=0)
+    name = db.Column(db.String(100))
+    canonical_name = db.Column(db.String(100))
+    quantity = db.Column(db.String(50))
+    measure = db.Column(db.String(50))
+
+    @classmethod
+    def from_parsed(cls, position: int, item: tuple) -> 'RecipeIngredient':
+        """
+        Создает ингредиент из тройки (название, количество, мера).
+
+        :param position: порядковый номер ингредиента в рецепте
+        :type position: int
+        :param item: тройка (название, количество, мера)
+        :type item: tuple
+        :return: новый объект ингредиента
+        :rtype: RecipeIngredient
+        """
+        name, quantity, measure = item
+        return cls(
+            position=position,
+            name=name,
+            canonical_name=canonical_name(name),
+            quantity=quantity,
+            measure=measure,
+        )
+
+    @classmethod
+    def recipe_ids(cls, names: list[str]) -> Any:
+        """
+        Возвращает подзапрос идентификаторов рецептов, содержащих все
+        перечисленные ингредиенты. Для каждого названия выбирается диапазон
+        индекса (canonical_name, recipe_id), и результаты пересекаются через
+        INTERSECT, без чтения таблицы recipe.
+
+        :param names: названия ингредиентов
+        :type names: list[str]
+        :return: подзапрос SQLAlchemy
+        :rtype: Select
+        """
+        selects = [
+            select(cls.recipe_id).where(
+                cls.canonical_name == canonical_name(name)
+            )
+            for name in names
+        ]
+        if len(selects) == 1:
+            return selects[0]
+        return intersect(*selects)
+
+
+class FeedVersion(db.Model):
+    """
+    Модель версии ленты рецептов. Версия увеличивается при каждой записи
+    рецепта в ленту и используется для ETag и Last-Modified страниц,
+    так что проверка актуальности страницы стоит одного запроса по
+    первичному ключу и одинакова во всех процессах приложения. В той же
+    записи хранится количество рецептов в ленте.
+
+    :param key: тег ленты: INDEX_CACHE_TAG или название категории
+    :type key: str
+    :param version: номер версии
+    :type version: int
+    :param updated_at: дата и время последнего изменения ленты
+    :type updated_at: datetime
+    :param recipe_count: количество рецептов в ленте
+    :type recipe_count: int
+    """
+
+    key = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False)
+    recipe_count = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def bump(cls, *keys: str, counts: dict | None = None) -> None:
+        """
+        Увеличивает версии лент в текущей транзакции сессии и изменяет
+        количество рецептов в них на величины из counts. Отсутствующие
+        записи создаются.
+
+        :param keys: теги лент
+        :type keys: tuple
+        :param counts: изменение количества рецептов по тегам лент
+        :type counts: dict | None
+        :return: None
+        """
+        now = datetime.datetime.utcnow().replace(microsecond=0)
+        counts = counts or {}
+        for key in keys:
+            delta = counts.get(key, 0)
+            statement = insert(cls).values(
+                key=key, version=1, updated_at=now, recipe_count=delta
+            )
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=[cls.key],
+                set_={
+                    'version': cls.version + 1,
+                    'updated_at': now,
+                    'recipe_count': cls.recipe_count + delta,
+                },
+            ))
+
+    @classmethod
+    def recipe_counts(cls, keys: Iterable[str]) -> dict[str, int]:
+        """
+        Возвращает количество рецептов в лентах.
+
+        :param keys: теги лент
+        :type keys: Iterable[str]
+        :return: словарь тег ленты -> количество рецептов; ленты, которые
+                 еще не менялись, отсутствуют
+        :rtype: dict[str, int]
+        """
+        return dict(db.session.query(cls.key, cls.recipe_count).filter(
+            cls.key.in_(list(keys))
+        ).all())
+
+    @classmethod
+    def recount(cls) -> dict[str, int]:
+        """
+        Пересчитывает количество рецептов во всех лентах по таблице
+        рецептов. Нужна для баз данных, созданных до появления столбца
+        recipe_count, и после вставки рецептов в обход Recipe.
+
+        :return: словарь тег ленты -> количество рецептов
+        :rtype: dict[str, int]
+        """
+        counts = dict(db.session.query(
+            Recipe.food_category, func.count()
+        ).group_by(Recipe.food_category).all())
+        total = sum(counts.values())
+        counts.pop(None, None)
+        counts[INDEX_CACHE_TAG] = total
+        now = datetime.datetime.utcnow().replace(microsecond=0)
+        db.session.query(cls).filter(cls.key.notin_(list(counts))).update(
+            {'recipe_count': 0}, synchronize_session=False
+        )
+        for key, count in counts.items():
+            statement = insert(cls).values(
+                key=key, version=1, updated_at=now, recipe_count=count
+            )
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=[cls.key], set_={'recipe_count': count},
+            ))
+        db.session.commit()
+        return counts
+
+    @classmethod
+    def current(cls, key: str) -> tuple[int, datetime.datetime | None]:
+        """
+        Возвращает текущую версию ленты.
+
+        :param key: тег ленты
+        :type key: str
+        :return: номер версии и дата изменения; (0, None), если лента еще
+                 не менялась
+        :rtype: tuple[int, datetime | None]
+        """
+        row = db.session.query(cls.version, cls.updated_at).filter_by(
+            key=key
+        ).first()
+        return tuple(row) if row else (0, None)
+
+
+class Job(db.Model, BaseModel):
+    """
+    Модель фоновой задачи, см. модуль jobs.
+
+    :param kind: тип задачи, по которому выбирается обработчик
+    :type kind: str
+    :param payload: аргументы обработчика в JSON
+    :type payload: str
+    :param status: состояние: queued, running, done или failed
+    :type status: str
+    :param attempts: количество выполненных попыток
+    :type attempts: int
+    :param max_attempts: максимальное количество попыток
+    :type max_attempts: int
+    :param run_after: время, раньше которого задачу не выполнять
+    :type run_after: datetime
+    :param started_at: время начала последней попытки
+    :type started_at: datetime
+    :param finished_at: время завершения задачи
+    :type finished_at: datetime
+    :param error: текст последней ошибки
+    :type error: str
+    """
+
+    __table_args__ = (
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+    )
+
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text(), nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(
+        db.DateTime, nullable=False, default=datetime.datetime.utcnow
+    )
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    error = db.Column(db.Text())
+
+
+def backfill_ingredients(batch_size: int = 1000) -> int:
+    """
+    Заполняет таблицу recipe_ingredient для рецептов, у которых еще нет
+    ни одной записи ингредиента, разбирая строку Recipe.ingredients.
+    Рецепты обрабатываются пачками, по одной транзакции на пачку.
+    Повторный запуск ничего не меняет.
+
+    :param batch_size: количество рецептов в одной транзакции
+    :type batch_size: int
+    :return: количество обработанных рецептов
+    :rtype: int
+    """
+    missing = select(Recipe.id, Recipe.ingredients).where(
+        ~select(RecipeIngredient.id).where(
+            RecipeIngredient.recipe_id == Recipe.id
+        ).exists()
+    ).order_by(Recipe.id)
+    last_id = 0
+    total = 0
+    while True:
+        rows = db.session.execute(
+            missing.where(Recipe.id > last_id).limit(batch_size)
+        ).all()
+        if not rows:
+            return total
+        values = [
+            {
+                'recipe_id': recipe_id,
+                'position': position,
+                'name': item.name,
+                'canonical_name': canonical_name(item.name),
+                'quantity': item.quantity,
+                'measure': item.measure,
+                'created_at': datetime.datetime.utcnow(),
+            }
+            for recipe_id, text in rows
+            for position, item in enumerate(parse_ingredients(text))
+        ]
+        if values:
+            db.session.execute(RecipeIngredient.__table__.insert(), values)
+        db.session.commit()
+        last_id = rows[-1].id
+        total += len(rows)
 
 
 @manager.user_loader
-def load_user(user_id: int) -> User | None:
+def load_user(user_id: str) -> User | None:
     """
-    Загружает пользователя из базы данных по заданному идентификатору.
+    Загружает пользователя по заданному идентификатору. Запись пользователя
+    без хэша пароля берется из user_cache и присоединяется к сессии без
+    запроса к базе данных; при промахе пользователь загружается из базы
+    данных и сохраняется в кэш.
 
-    :param user_id: идентификатор пользователя
-    :type user_id: int
+    :param user_id: идентификатор пользователя из сессии
+    :type user_id: str
     :return: объект пользователя, если пользователь существует, иначе None
     :rtype: User
     """
-    return User.query.get(user_id)
+    record = user_cache.get(user_id)
+    if record is not None:
+        user = User(**record)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+    try:
+        user = db.session.get(User, int(user_id))
+    except ValueError:
+        return None
+    if user is not None:
+        user_cache.set(user_id, {
+            column: getattr(user, column) for column in USER_CACHE_COLUMNS
+        })
+    return user
+
+
+def upgrade_schema() -> list[str]:
+    """
+    Приводит схему существующей базы данных к описанию моделей.
+
+    db.create_all() создает только отсутствующие таблицы, поэтому функция
+    дополнительно добавляет недостающие столбцы и индексы. Повторный запуск
+    ничего не меняет.
+
+    :return: список выполненных изменений
+    :rtype: list[str]
+    """
+    changes = []
+    db.create_all()
+    inspector = inspect(db.engine)
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            existing = {column['name']
+                        for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                connection.exec_driver_sql(
+                    f'ALTER TABLE {table.name} '
+                    f'ADD COLUMN {column.name} {column_type}'
+                )
+                changes.append(f'column {table.name}.{column.name}')
+            indexes = {index['name']
+                       for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(bind=connection)
+                    changes.append(f'index {index.name}')
+    return changes
 
 
 with app.app_context():
     db.create_all()
+    ensure_search_index()
@@ -0,0 +1,170 @@
+"""
+Этот модуль содержит функции для курсорной (keyset) пагинации лент рецептов.
+
+Вместо OFFSET страница выбирается условием по паре столбцов
+(created_at, id), поэтому стоимость выборки страницы не зависит от того,
+насколько далеко пользователь пролистал ленту и сколько всего записей
+в таблице.
+
+Классы модуля:
+
+Page:
+Страница ленты: записи и курсоры соседних страниц.
+
+Функции модуля:
+
+encode_cursor(created_at: datetime, row_id: int) -> str:
+Упаковывает ключ записи в строку для URL.
+
+decode_cursor(cursor: str | None) -> tuple | None:
+Распаковывает курсор, полученный из URL.
+
+keyset_paginate(query, created_at, row_id, ...) -> Page:
+Возвращает страницу запроса, упорядоченного от новых записей к старым.
+
+keyset_after(query, created_at, row_id, after) -> Any:
+Возвращает запрос записей старше курсора от новых к старым.
+"""
+import base64
+import binascii
+from datetime import datetime
+from typing import Any, NamedTuple
+
+from sqlalchemy import tuple_
+
+
+class Page(NamedTuple):
+    """
+    Страница ленты.
+
+    :param items: записи текущей страницы
+    :type items: list
+    :param next_cursor: курсор следующей (более старой) страницы или None
+    :type next_cursor: str | None
+    :param prev_cursor: курсор предыдущей (более новой) страницы или None
+    :type prev_cursor: str | None
+    """
+    items: list
+    next_cursor: str | None
+    prev_cursor: str | None
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """
+    Упаковывает ключ записи (created_at, id) в строку, безопасную для URL.
+
+    :param created_at: дата создания записи
+    :type created_at: datetime
+    :param row_id: идентификатор записи
+    :type row_id: int
+    :return: курсор
+    :rtype: str
+    """
+    raw = f'{created_at.isoformat()}|{row_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str | None) -> tuple[datetime, int] | None:
+    """
+    Распаковывает курсор, созданный функцией encode_cursor.
+    Для пустого или поврежденного курсора возвращает None, то есть первую
+    страницу ленты.
+
+    :param cursor: курсор из параметров запроса
+    :type cursor: str | None
+    :return: пара (created_at, id) или None
+    :rtype: tuple | None
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, row_id = raw.decode().split('|')
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def keyset_paginate(
+        query: Any,
+        created_at: Any,
+        row_id: Any,
+        per_page: int,
+        after: str | None = None,
+        before: str | None = None,
+) -> Page:
+    """
+    Возвращает страницу запроса, упорядоченного по (created_at, id)
+    от новых записей к старым.
+
+    Параметр after указывает курсор последней записи предыдущей страницы
+    (переход вперед), параметр before - курсор первой записи следующей
+    страницы (переход назад). Выбирается на одну запись больше, чем нужно,
+    чтобы без отдельного COUNT(*) узнать, есть ли еще записи.
+
+    :param query: запрос SQLAlchemy, возвращающий записи с атрибутами
+                  created_at и id
+    :param created_at: столбец даты создания
+    :param row_id: столбец идентификатора
+    :param per_page: размер страницы
+    :type per_page: int
+    :param after: курсор для перехода к более старым записям
+    :type after: str | None
+    :param before: курсор для перехода к более новым записям
+    :type before: str | None
+    :return: страница ленты
+    :rtype: Page
+    """
+    key = tuple_(created_at, row_id)
+    before_key = decode_cursor(before)
+    after_key = decode_cursor(after)
+    if before_key is not None:
+        rows = query.filter(key > before_key).order_by(
+            created_at.asc(), row_id.asc()
+        ).limit(per_page + 1).all()
+        has_prev = len(rows) > per_page
+        items = rows[:per_page][::-1]
+        has_next = True
+    else:
+        if after_key is not None:
+            query = query.filter(key < after_key)
+        rows = query.order_by(
+            created_at.desc(), row_id.desc()
+        ).limit(per_page + 1).all()
+        has_next = len(rows) > per_page
+        items = rows[:per_page]
+        has_prev = after_key is not None
+    if not items:
+        return Page(items, None, None)
+    next_cursor = None
+    prev_cursor = None
+    if has_next:
+        next_cursor = encode_cursor(items[-1].created_at, items[-1].id)
+    if has_prev:
+        prev_cursor = encode_cursor(items[0].created_at, items[0].id)
+    return Page(items, next_cursor, prev_cursor)
+
+
+def keyset_after(
+        query: Any,
+        created_at: Any,
+        row_id: Any,
+        after: str | None = None,
+) -> Any:
+    """
+    Возвращает запрос записей старше курсора after, упорядоченный по
+    (created_at, id) от новых записей к старым. В отличие от
+    keyset_paginate, записи не выбираются: вызывающий код сам ограничивает
+    и читает результат, например потоком.
+
+    :param query: запрос SQLAlchemy (Query или Select)
+    :param created_at: столбец даты создания
+    :param row_id: столбец идентификатора
+    :param after: курсор последней записи предыдущей страницы
+    :type after: str | None
+    :return: запрос SQLAlchemy
+    """
+    after_key = decode_cursor(after)
+    if after_key is not None:
+        query = query.filter(tuple_(created_at, row_id) < after_key)
+    return query.order_by(created_at.desc(), row_id.desc())
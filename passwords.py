@@ -0,0 +1,177 @@
+"""
+Этот модуль содержит хэширование и проверку паролей пользователей.
+
+PBKDF2 намеренно требует много процессорного времени (десятки
+миллисекунд на пароль), поэтому хэширование выполняется в отдельном пуле
+процессов из PASSWORD_HASH_WORKERS процессов: всплеск входов занимает
+не больше этого количества ядер и не отнимает процессорное время у
+потоков, отдающих страницы. Количество ожидающих операций ограничено
+PASSWORD_HASH_QUEUE, при переполнении очереди возбуждается PasswordPoolBusy.
+При PASSWORD_HASH_WORKERS = 0 хэширование выполняется в текущем потоке.
+
+Алгоритм и количество итераций задаются настройкой PASSWORD_HASH_METHOD в
+формате werkzeug.security, например 'pbkdf2:sha256:260000'. Хэши с другими
+параметрами при успешном входе пересчитываются по текущей настройке.
+
+Классы модуля:
+
+PasswordPoolBusy:
+Исключение: очередь пула хэширования переполнена.
+
+Функции модуля:
+
+hash_password(password: str) -> str:
+Возвращает хэш пароля по текущей настройке.
+
+verify_password(password_hash: str, password: str) -> bool:
+Проверяет пароль по хэшу.
+
+needs_rehash(password_hash: str) -> bool:
+Проверяет, посчитан ли хэш с устаревшими параметрами.
+
+authenticate(user: User, password: str) -> bool:
+Проверяет пароль пользователя и при необходимости обновляет его хэш.
+
+password_pool_busy(error: PasswordPoolBusy) -> Response:
+Отвечает 503, если очередь пула хэширования переполнена.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable
+
+from flask import Response
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from app import app
+from models import User
+
+# Процессы пула не создаются через fork многопоточного процесса
+# приложения: блокировки, захваченные другими потоками, скопировались бы
+# в дочерний процесс.
+START_METHOD = 'forkserver' \
+    if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+_pool = None
+_pool_pid = None
+_slots = None
+_lock = threading.Lock()
+
+
+class PasswordPoolBusy(Exception):
+    """
+    Исключение: в очереди пула хэширования уже PASSWORD_HASH_QUEUE операций.
+    """
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    # Пул создается при первом использовании в каждом процессе приложения:
+    # процессы пула не наследуются через fork (gunicorn с preload_app).
+    global _pool, _pool_pid, _slots
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(
+                max_workers=app.config['PASSWORD_HASH_WORKERS'],
+                mp_context=multiprocessing.get_context(START_METHOD),
+            )
+            _pool_pid = os.getpid()
+            atexit.register(_pool.shutdown)
+            _slots = threading.BoundedSemaphore(
+                app.config['PASSWORD_HASH_QUEUE']
+            )
+        return _pool
+
+
+def _run(function: Callable, *args) -> Any:
+    if not app.config['PASSWORD_HASH_WORKERS']:
+        return function(*args)
+    pool = _get_pool()
+    slots = _slots
+    if not slots.acquire(timeout=app.config['PASSWORD_HASH_TIMEOUT']):
+        raise PasswordPoolBusy()
+    try:
+        return pool.submit(function, *args).result()
+    finally:
+        slots.release()
+
+
+def hash_password(password: str) -> str:
+    """
+    Возвращает хэш пароля, посчитанный в пуле процессов по настройке
+    PASSWORD_HASH_METHOD.
+
+    :param password: пароль
+    :type password: str
+    :return: хэш пароля
+    :rtype: str
+    """
+    return _run(
+        generate_password_hash, password, app.config['PASSWORD_HASH_METHOD']
+    )
+
+
+def verify_password(password_hash: str, password: str) -> bool:
+    """
+    Проверяет пароль по хэшу в пуле процессов.
+
+    :param password_hash: сохраненный хэш пароля
+    :type password_hash: str
+    :param password: введенный пароль
+    :type password: str
+    :return: результат проверки
+    :rtype: bool
+    """
+    return _run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash: str) -> bool:
+    """
+    Проверяет, отличаются ли алгоритм или количество итераций хэша от
+    настройки PASSWORD_HASH_METHOD.
+
+    :param password_hash: сохраненный хэш пароля
+    :type password_hash: str
+    :return: True, если хэш нужно пересчитать
+    :rtype: bool
+    """
+    return password_hash.split('$', 1)[0] \
+        != app.config['PASSWORD_HASH_METHOD']
+
+
+def authenticate(user: User, password: str) -> bool:
+    """
+    Проверяет пароль пользователя. Если пароль верный, а хэш посчитан с
+    устаревшими параметрами, сохраняет новый хэш.
+
+    :param user: пользователь
+    :type user: User
+    :param password: введенный пароль
+    :type password: str
+    :return: результат проверки
+    :rtype: bool
+    """
+    if not verify_password(user.password, password):
+        return False
+    if needs_rehash(user.password):
+        user.password = hash_password(password)
+        user.save()
+    return True
+
+
+@app.errorhandler(PasswordPoolBusy)
+def password_pool_busy(error: PasswordPoolBusy) -> Response:
+    """
+    Отвечает 503 Service Unavailable, если пул хэширования не освободился
+    за PASSWORD_HASH_TIMEOUT секунд.
+
+    :param error: исключение
+    :type error: PasswordPoolBusy
+    :return: HTTP-ответ
+    :rtype: flask.wrappers.Response
+    """
+    return Response(
+        'Сервер перегружен, попробуйте войти через несколько секунд.',
+        status=503, headers={'Retry-After': '5'}, mimetype='text/plain',
+    )
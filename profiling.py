@@ -0,0 +1,273 @@
+"""
+Этот модуль содержит профилирование медленных запросов.
+
+ProfilerMiddleware оборачивает WSGI-приложение и сохраняет профили в
+каталог PROFILE_DIR двумя способами:
+
+* доля запросов PROFILE_SAMPLE_RATE выполняется под cProfile, профиль
+  сохраняется в формате pstats (файл .prof);
+* фоновый поток каждые PROFILE_SAMPLER_INTERVAL секунд снимает стеки
+  потоков, обрабатывающих запросы; если запрос выполнялся дольше
+  PROFILE_SLOW_THRESHOLD секунд, его стеки сохраняются в формате collapsed
+  stacks для flamegraph (файл .collapsed).
+
+Имя файла содержит время, имя представления и длительность запроса, в
+каталоге хранится не больше PROFILE_MAX_FILES файлов, старые удаляются.
+Профилирование включается настройкой PROFILE_ENABLED; если она выключена,
+приложение не оборачивается и профилирование ничего не стоит.
+
+Запрос, выбранный для cProfile, остается под профилировщиком, пока сервер
+не закроет ответ, поэтому в профиль попадает и генерация потоковых
+ответов; тело ответа при этом не буферизуется. Ответы остальных запросов
+возвращаются без изменений, и их длительность и стеки учитываются до
+возврата ответа приложением.
+
+Классы модуля:
+
+ProfilerMiddleware:
+WSGI-обертка, сохраняющая профили запросов.
+
+Функции модуля:
+
+list_profiles(directory: str, limit: int) -> list[dict]:
+Возвращает сохраненные профили, самые медленные первыми.
+"""
+import cProfile
+import itertools
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Iterable
+
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import Map
+
+from app import app
+
+PROFILE_NAME_RE = re.compile(
+    r'^(?P<time>\d{8}T\d{6})_(?P<endpoint>[\w.]+)_(?P<ms>\d+)ms_\d+_\d+'
+    r'\.(?P<kind>prof|collapsed)$'
+)
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return (f'{code.co_name} '
+            f'({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+
+
+class _ProfiledIterator:
+    # Тело ответа отдается по частям, как есть; finish вызывается, когда
+    # сервер закрывает ответ.
+    def __init__(self, app_iter: Iterable, finish: Callable):
+        self._app_iter = app_iter
+        self._finish = finish
+
+    def __iter__(self):
+        return iter(self._app_iter)
+
+    def close(self) -> None:
+        try:
+            if hasattr(self._app_iter, 'close'):
+                self._app_iter.close()
+        finally:
+            self._finish()
+
+
+class ProfilerMiddleware:
+    """
+    WSGI-обертка, сохраняющая профили выборочных и медленных запросов.
+
+    :param wsgi_app: оборачиваемое WSGI-приложение
+    :type wsgi_app: Callable
+    :param url_map: карта URL приложения для определения представления
+    :type url_map: werkzeug.routing.Map
+    :param directory: каталог профилей
+    :type directory: str
+    :param sample_rate: доля запросов, профилируемых cProfile
+    :type sample_rate: float
+    :param slow_threshold: длительность в секундах, начиная с которой
+                           сохраняются стеки запроса; 0 отключает сэмплер
+    :type slow_threshold: float
+    :param max_files: максимальное количество файлов в каталоге
+    :type max_files: int
+    :param interval: интервал снятия стеков в секундах
+    :type interval: float
+    """
+
+    def __init__(
+            self,
+            wsgi_app: Callable,
+            url_map: Map,
+            directory: str,
+            sample_rate: float = 0.01,
+            slow_threshold: float = 1.0,
+            max_files: int = 200,
+            interval: float = 0.01,
+    ):
+        self.wsgi_app = wsgi_app
+        self.url_map = url_map
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.max_files = max_files
+        self.interval = interval
+        self._active = {}
+        self._sampler = None
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, environ: dict, start_response: Callable) -> Iterable:
+        if self.slow_threshold:
+            self._ensure_sampler()
+        thread_id = threading.get_ident()
+        samples = Counter()
+        self._active[thread_id] = samples
+        profile = cProfile.Profile() \
+            if random.random() < self.sample_rate else None
+        started = time.perf_counter()
+
+        def finish(save: bool = True) -> None:
+            if profile is not None:
+                profile.disable()
+            elapsed = time.perf_counter() - started
+            self._active.pop(thread_id, None)
+            if save and (profile is not None or (
+                    self.slow_threshold and elapsed >= self.slow_threshold
+            )):
+                self._save(environ, elapsed, profile, samples)
+
+        if profile is not None:
+            profile.enable()
+        try:
+            app_iter = self.wsgi_app(environ, start_response)
+        except BaseException:
+            finish(save=False)
+            raise
+        if profile is None:
+            finish()
+            return app_iter
+        return _ProfiledIterator(app_iter, finish)
+
+    def _ensure_sampler(self) -> None:
+        # Поток создается при первом запросе, а не при импорте: после fork
+        # (gunicorn с preload_app) потоки родительского процесса не живут.
+        if self._sampler is not None and self._sampler.is_alive():
+            return
+        with self._lock:
+            if self._sampler is None or not self._sampler.is_alive():
+                self._sampler = threading.Thread(
+                    target=self._sample, name='profile-sampler', daemon=True
+                )
+                self._sampler.start()
+
+    def _sample(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            if not self._active:
+                continue
+            frames = sys._current_frames()
+            for thread_id, samples in list(self._active.items()):
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                if stack:
+                    samples[';'.join(reversed(stack))] += 1
+
+    def _endpoint(self, environ: dict) -> str:
+        try:
+            endpoint, _ = self.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return 'unmatched'
+        return re.sub(r'[^\w.]', '_', endpoint)
+
+    def _save(
+            self,
+            environ: dict,
+            elapsed: float,
+            profile: cProfile.Profile | None,
+            samples: Counter,
+    ) -> None:
+        name = '_'.join((
+            datetime.utcnow().strftime('%Y%m%dT%H%M%S'),
+            self._endpoint(environ),
+            f'{round(elapsed * 1000)}ms',
+            str(os.getpid()),
+            str(next(self._counter)),
+        ))
+        path = os.path.join(self.directory, name)
+        try:
+            if profile is not None:
+                profile.dump_stats(f'{path}.prof')
+            if samples and elapsed >= self.slow_threshold:
+                with open(f'{path}.collapsed', 'w') as file:
+                    for stack, count in samples.most_common():
+                        file.write(f'{stack} {count}\n')
+            self._rotate()
+        except OSError:
+            app.logger.exception('Не удалось сохранить профиль запроса')
+
+    def _rotate(self) -> None:
+        files = sorted(
+            (entry for entry in os.scandir(self.directory)
+             if entry.is_file()),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in files[:max(0, len(files) - self.max_files)]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(directory: str, limit: int = 50) -> list[dict]:
+    """
+    Возвращает сохраненные профили, отсортированные по длительности
+    запроса, самые медленные первыми.
+
+    :param directory: каталог профилей
+    :type directory: str
+    :param limit: максимальное количество профилей
+    :type limit: int
+    :return: список словарей с полями file, kind, endpoint, duration_ms,
+             time
+    :rtype: list[dict]
+    """
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in os.listdir(directory):
+        match = PROFILE_NAME_RE.match(name)
+        if match is None:
+            continue
+        profiles.append({
+            'file': name,
+            'kind': match['kind'],
+            'endpoint': match['endpoint'],
+            'duration_ms': int(match['ms']),
+            'time': datetime.strptime(
+                match['time'], '%Y%m%dT%H%M%S'
+            ).isoformat(),
+        })
+    profiles.sort(key=lambda profile: profile['duration_ms'], reverse=True)
+    return profiles[:limit]
+
+
+if app.config['PROFILE_ENABLED']:
+    app.wsgi_app = ProfilerMiddleware(
+        app.wsgi_app,
+        app.url_map,
+        app.config['PROFILE_DIR'],
+        sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+        slow_threshold=app.config['PROFILE_SLOW_THRESHOLD'],
+        max_files=app.config['PROFILE_MAX_FILES'],
+        interval=app.config['PROFILE_SAMPLER_INTERVAL'],
+    )
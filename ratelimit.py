@@ -0,0 +1,228 @@
+"""
+Этот модуль содержит ограничение частоты запросов по алгоритму token
+bucket.
+
+Для каждого ключа (правило, адрес клиента или пользователь) хранится
+корзина: количество токенов и время последнего обновления. Токены
+восстанавливаются со скоростью limit / period в секунду, но не больше
+limit; каждый запрос забирает один токен, запрос без токена получает ответ
+429 Too Many Requests с заголовком Retry-After.
+
+Правила задаются настройкой RATELIMIT_POLICIES: для каждого имени
+представления (или '*' для всех представлений, кроме RATELIMIT_EXEMPT)
+список правил со ключами limit, period, scope ('ip' или 'user') и
+необязательным methods. Правило scope='user' для анонимного посетителя
+применяется к его адресу.
+
+Состояние корзин хранится в бэкенде RATELIMIT_BACKEND:
+
+* 'memory' - словарь в памяти процесса, для запуска в одном процессе;
+* 'sqlite' - отдельный файл SQLite RATELIMIT_SQLITE_PATH, общий для всех
+  процессов; проверка корзины - один запрос INSERT ... ON CONFLICT DO
+  UPDATE ... RETURNING без отдельной транзакции.
+
+Адрес клиента берется из request.remote_addr; за обратным прокси его нужно
+восстанавливать из X-Forwarded-For (werkzeug.middleware.proxy_fix).
+
+Классы модуля:
+
+MemoryBackend:
+Хранилище корзин в памяти процесса.
+
+SQLiteBackend:
+Хранилище корзин в файле SQLite, общее для процессов.
+
+Функции модуля:
+
+create_backend(config: dict) -> MemoryBackend | SQLiteBackend:
+Создает хранилище по настройке RATELIMIT_BACKEND.
+
+check_rate_limit() -> None:
+Проверяет правила текущего запроса и возбуждает TooManyRequests.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from flask import request
+from flask_login import current_user
+from werkzeug.exceptions import TooManyRequests
+
+from app import app
+
+PRUNE_EVERY = 10000
+
+
+class MemoryBackend:
+    """
+    Хранилище корзин в памяти процесса. Когда корзин становится больше
+    max_keys, удаляются корзины, которые уже полностью восстановились.
+
+    :param max_keys: количество корзин, после которого выполняется очистка
+    :type max_keys: int
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, capacity: float, rate: float) -> float:
+        """
+        Забирает токен из корзины key.
+
+        :param key: ключ корзины
+        :type key: str
+        :param capacity: емкость корзины
+        :type capacity: float
+        :param rate: скорость восстановления в токенах в секунду
+        :type rate: float
+        :return: 0, если токен получен, иначе время ожидания в секундах
+        :rtype: float
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at, _ = self._buckets.get(
+                key, (capacity, now, capacity / rate)
+            )
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, capacity / rate)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+        return 0.0 if allowed else (1 - tokens) / rate
+
+    def _prune(self, now: float) -> None:
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if now - bucket[1] < bucket[2]
+        }
+
+
+class SQLiteBackend:
+    """
+    Хранилище корзин в файле SQLite, общее для всех процессов приложения.
+    Каждый поток использует свое соединение в режиме автофиксации.
+
+    :param path: путь к файлу базы данных корзин
+    :type path: str
+    """
+
+    CONSUME_SQL = (
+        'INSERT INTO ratelimit_bucket (key, tokens, updated_at, allowed) '
+        'VALUES (:key, :capacity - 1, :now, 1) '
+        'ON CONFLICT (key) DO UPDATE SET '
+        'tokens = CASE WHEN {refill} >= 1 THEN {refill} - 1 '
+        'ELSE {refill} END, '
+        'allowed = {refill} >= 1, '
+        'updated_at = :now '
+        'RETURNING tokens, allowed'
+    ).format(
+        refill='min(:capacity, tokens + (:now - updated_at) * :rate)'
+    )
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._calls = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Соединение открывается в потоке при первом запросе, после fork
+        # процесс открывает свои соединения.
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path, isolation_level=None, check_same_thread=False
+            )
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = OFF')
+            connection.execute('PRAGMA busy_timeout = 1000')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS ratelimit_bucket ('
+                'key TEXT PRIMARY KEY, tokens REAL NOT NULL, '
+                'updated_at REAL NOT NULL, allowed INTEGER NOT NULL'
+                ') WITHOUT ROWID'
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def consume(self, key: str, capacity: float, rate: float) -> float:
+        """
+        Забирает токен из корзины key одним атомарным запросом.
+
+        :param key: ключ корзины
+        :type key: str
+        :param capacity: емкость корзины
+        :type capacity: float
+        :param rate: скорость восстановления в токенах в секунду
+        :type rate: float
+        :return: 0, если токен получен, иначе время ожидания в секундах
+        :rtype: float
+        """
+        connection = self._connection()
+        now = time.time()
+        tokens, allowed = connection.execute(self.CONSUME_SQL, {
+            'key': key, 'capacity': capacity, 'rate': rate, 'now': now,
+        }).fetchone()
+        self._calls += 1
+        if self._calls % PRUNE_EVERY == 0:
+            connection.execute(
+                'DELETE FROM ratelimit_bucket WHERE updated_at < ?',
+                (now - 24 * 3600,),
+            )
+        return 0.0 if allowed else (1 - tokens) / rate
+
+
+def create_backend(config: dict) -> MemoryBackend | SQLiteBackend:
+    """
+    Создает хранилище корзин по настройке RATELIMIT_BACKEND.
+
+    :param config: конфигурация приложения
+    :type config: dict
+    :return: хранилище корзин
+    :rtype: MemoryBackend | SQLiteBackend
+    """
+    if config['RATELIMIT_BACKEND'] == 'sqlite':
+        return SQLiteBackend(config['RATELIMIT_SQLITE_PATH'])
+    return MemoryBackend()
+
+
+backend = create_backend(app.config)
+
+
+@app.before_request
+def check_rate_limit() -> None:
+    """
+    Забирает токены по всем правилам текущего представления и правилам
+    '*' (кроме представлений из RATELIMIT_EXEMPT). Если хотя бы в одной
+    корзине нет токена, возбуждает TooManyRequests с временем ожидания.
+
+    :return: None
+    """
+    if not app.config['RATELIMIT_ENABLED'] or request.endpoint is None:
+        return
+    policies = app.config['RATELIMIT_POLICIES']
+    names = [request.endpoint]
+    if request.endpoint not in app.config['RATELIMIT_EXEMPT']:
+        names.append('*')
+    wait = 0.0
+    for name in names:
+        for number, rule in enumerate(policies.get(name, ())):
+            if 'methods' in rule and request.method not in rule['methods']:
+                continue
+            if rule.get('scope') == 'user' \
+                    and current_user.is_authenticated:
+                client = f'user:{current_user.get_id()}'
+            else:
+                client = f'ip:{request.remote_addr}'
+            wait = max(wait, backend.consume(
+                f'{name}:{number}:{client}',
+                rule['limit'], rule['limit'] / rule['period'],
+            ))
+    if wait:
+        raise TooManyRequests(retry_after=math.ceil(wait))
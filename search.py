@@ -0,0 +1,202 @@
+"""
+Этот модуль содержит полнотекстовый поиск рецептов на основе SQLite FTS5.
+
+Индекс recipe_fts хранит только токены (contentless-таблица) по столбцам
+dish_name, ingredients и recipe таблицы recipe и поддерживается в актуальном
+состоянии триггерами, поэтому любая запись рецепта, в том числе через
+Recipe.create и BaseModel.save, сразу попадает в поиск.
+
+Токенизатор unicode61 приводит кириллицу к нижнему регистру, а букву 'ё'
+триггеры и поисковый запрос заменяют на 'е'. Окончания русских слов
+отбрасываются, и основа ищется как префикс, так что запрос 'картошкой'
+находит 'картошка'.
+
+Функции модуля:
+
+ensure_search_index() -> bool:
+Создает таблицу индекса и триггеры, если их еще нет.
+
+rebuild_search_index() -> int:
+Полностью перестраивает индекс по таблице recipe.
+
+build_match_query(text: str) -> str | None:
+Преобразует пользовательский запрос в выражение MATCH.
+
+search_recipes(text: str, page: int, per_page: int) -> tuple[list, bool]:
+Возвращает страницу карточек рецептов, упорядоченных по BM25.
+"""
+import re
+
+from sqlalchemy import text as sql
+
+from app import db
+
+TOKEN_RE = re.compile(r'\w+')
+
+RUSSIAN_ENDINGS = (
+    'иями', 'ями', 'ами', 'его', 'ого', 'ему', 'ому', 'ыми', 'ими',
+    'ать', 'ять', 'ить', 'еть', 'ешь', 'ишь', 'ая', 'яя', 'ое', 'ее', 'ые',
+    'ие', 'ый', 'ий', 'ой', 'ей', 'ом', 'ем', 'ам', 'ям', 'ах', 'ях', 'ов',
+    'ев', 'ую', 'юю', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+)
+
+MIN_STEM_LENGTH = 3
+
+# Веса BM25 для столбцов dish_name, ingredients и recipe.
+BM25_WEIGHTS = (10.0, 4.0, 1.0)
+
+
+def _normalized(column: str) -> str:
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _values(prefix: str) -> str:
+    return ', '.join(
+        _normalized(f'{prefix}.{column}')
+        for column in ('dish_name', 'ingredients', 'recipe')
+    )
+
+
+SEARCH_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS recipe_fts USING fts5("
+    "dish_name, ingredients, recipe, content='', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    f"""CREATE TRIGGER IF NOT EXISTS recipe_fts_ai AFTER INSERT ON recipe
+    BEGIN
+        INSERT INTO recipe_fts(rowid, dish_name, ingredients, recipe)
+        VALUES (new.id, {_values('new')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS recipe_fts_ad AFTER DELETE ON recipe
+    BEGIN
+        INSERT INTO recipe_fts(recipe_fts, rowid, dish_name, ingredients,
+                               recipe)
+        VALUES ('delete', old.id, {_values('old')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS recipe_fts_au
+    AFTER UPDATE OF dish_name, ingredients, recipe ON recipe
+    BEGIN
+        INSERT INTO recipe_fts(recipe_fts, rowid, dish_name, ingredients,
+                               recipe)
+        VALUES ('delete', old.id, {_values('old')});
+        INSERT INTO recipe_fts(rowid, dish_name, ingredients, recipe)
+        VALUES (new.id, {_values('new')});
+    END""",
+)
+
+POPULATE_SQL = (
+    f'INSERT INTO recipe_fts(rowid, dish_name, ingredients, recipe) '
+    f'SELECT recipe.id, {_values("recipe")} FROM recipe'
+)
+
+SEARCH_SQL = sql(
+    f'SELECT recipe.id, recipe.dish_name, recipe.food_category, '
+    f'recipe.file_path, recipe.image_variants, recipe.created_at '
+    f'FROM recipe_fts JOIN recipe ON recipe.id = recipe_fts.rowid '
+    f'WHERE recipe_fts MATCH :query '
+    f'ORDER BY bm25(recipe_fts, {", ".join(map(str, BM25_WEIGHTS))}) '
+    f'LIMIT :limit OFFSET :offset'
+)
+
+
+def ensure_search_index() -> bool:
+    """
+    Создает таблицу recipe_fts и триггеры синхронизации, если их нет.
+    Если таблица создается впервые для уже заполненной базы, индекс сразу
+    заполняется существующими рецептами.
+
+    :return: True, если таблица индекса была создана
+    :rtype: bool
+    """
+    with db.engine.begin() as connection:
+        exists = connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE name = 'recipe_fts'"
+        ).first()
+        for statement in SEARCH_DDL:
+            connection.exec_driver_sql(statement)
+        if not exists:
+            connection.exec_driver_sql(POPULATE_SQL)
+    return not exists
+
+
+def rebuild_search_index() -> int:
+    """
+    Полностью перестраивает поисковый индекс по таблице recipe.
+
+    :return: количество проиндексированных рецептов
+    :rtype: int
+    """
+    ensure_search_index()
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO recipe_fts(recipe_fts) VALUES ('delete-all')"
+        )
+        connection.exec_driver_sql(POPULATE_SQL)
+        connection.exec_driver_sql(
+            "INSERT INTO recipe_fts(recipe_fts) VALUES ('optimize')"
+        )
+        return connection.exec_driver_sql(
+            'SELECT count(*) FROM recipe'
+        ).scalar()
+
+
+def stem(word: str) -> str:
+    """
+    Отбрасывает типичное окончание русского слова, оставляя основу
+    не короче MIN_STEM_LENGTH символов.
+
+    :param word: слово в нижнем регистре
+    :type word: str
+    :return: основа слова
+    :rtype: str
+    """
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and \
+                len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+def build_match_query(text: str) -> str | None:
+    """
+    Преобразует пользовательский запрос в выражение FTS5 MATCH: каждое
+    слово заменяется префиксным поиском по его основе, слова объединяются
+    через AND. Специальный синтаксис FTS5 из запроса не используется.
+
+    :param text: поисковый запрос пользователя
+    :type text: str
+    :return: выражение MATCH или None, если в запросе нет слов
+    :rtype: str | None
+    """
+    words = TOKEN_RE.findall(text.lower().replace('ё', 'е'))
+    terms = [f'"{stem(word)}"*' for word in words]
+    return ' '.join(terms) or None
+
+
+def search_recipes(
+        text: str, page: int = 1, per_page: int = 24
+) -> tuple[list, bool]:
+    """
+    Ищет рецепты по названию, ингредиентам и шагам приготовления.
+    Результаты упорядочены по BM25, совпадения в названии весят больше.
+
+    :param text: поисковый запрос пользователя
+    :type text: str
+    :param page: номер страницы, начиная с 1
+    :type page: int
+    :param per_page: размер страницы
+    :type per_page: int
+    :return: карточки рецептов страницы и признак наличия следующей страницы
+    :rtype: tuple[list, bool]
+    """
+    query = build_match_query(text)
+    if query is None:
+        return [], False
+    rows = db.session.execute(
+        SEARCH_SQL,
+        {
+            'query': query,
+            'limit': per_page + 1,
+            'offset': (max(page, 1) - 1) * per_page,
+        },
+    ).all()
+    return rows[:per_page], len(rows) > per_page
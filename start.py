@@ -1,4 +1,8 @@
 if __name__ == "__main__":
     from controller import *
+    from jobs import requeue_stale, start_workers
 
+    with app.app_context():
+        requeue_stale(app.config['JOB_STALE_TIMEOUT'])
+    start_workers(app.config['JOB_WORKERS'])
     app.run()
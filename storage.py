@@ -0,0 +1,321 @@
+"""
+Этот модуль содержит хранилище загружаемых фотографий с адресацией по
+содержимому.
+
+Файл сохраняется под именем, равным SHA-256 его содержимого, в
+подкаталогах по первым символам хэша: uploads/ab/cd/abcd....jpg. Одинаковые
+фотографии хранятся один раз, одновременные загрузки не могут перезаписать
+друг друга, а содержимое файла по одному адресу никогда не меняется, поэтому
+его можно отдавать с заголовком Cache-Control: immutable.
+
+Тело multipart-запроса записывается на диск частями по мере разбора:
+UploadRequest передает Werkzeug файл HashingFile, который считает хэш
+во время записи, так что после разбора запроса файл остается только
+переименовать.
+
+Классы модуля:
+
+HashingFile:
+Временный файл, считающий SHA-256 записываемых данных.
+
+UploadRequest:
+Класс запроса Flask, записывающий загружаемые файлы в HashingFile.
+
+UploadStorage:
+Интерфейс хранилища.
+
+LocalStorage:
+Хранилище в каталоге на диске.
+
+MemoryStorage:
+Хранилище в памяти для тестов.
+
+Функции модуля:
+
+create_storage(config: dict) -> UploadStorage:
+Создает хранилище по настройке UPLOAD_STORAGE.
+
+Переменные модуля:
+
+upload_storage:
+Хранилище приложения.
+"""
+import hashlib
+import io
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from typing import IO
+
+from flask import Request, request
+
+from app import app
+
+CHUNK_SIZE = 64 * 1024
+
+
+class HashingFile:
+    """
+    Временный файл на диске, который считает SHA-256 и размер данных по мере
+    их записи. Если файл не был перемещен в хранилище, он удаляется при
+    закрытии.
+
+    :param directory: каталог временного файла
+    :type directory: str | None
+    """
+
+    def __init__(self, directory: str | None = None):
+        self._file = tempfile.NamedTemporaryFile(
+            dir=directory, prefix='upload-', delete=False
+        )
+        self.name = self._file.name
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.sha256.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def read(self, size: int = -1) -> bytes:
+        return self._file.read(size)
+
+    def readline(self, size: int = -1) -> bytes:
+        return self._file.readline(size)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+        if os.path.exists(self.name):
+            os.remove(self.name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+
+class UploadRequest(Request):
+    """
+    Класс запроса, который записывает загружаемые файлы сразу во временные
+    файлы хранилища с подсчетом хэша вместо буферизации в памяти.
+    """
+
+    def _get_file_stream(
+            self,
+            total_content_length: int | None,
+            content_type: str | None,
+            filename: str | None = None,
+            content_length: int | None = None,
+    ) -> IO[bytes]:
+        return HashingFile(upload_storage.temp_dir)
+
+
+class UploadStorage(ABC):
+    """
+    Интерфейс хранилища загружаемых файлов с адресацией по содержимому.
+
+    :param temp_dir: каталог временных файлов загрузки
+    :type temp_dir: str | None
+    """
+
+    temp_dir = None
+
+    @staticmethod
+    def key(digest: str, extension: str) -> str:
+        """
+        Возвращает ключ файла по хэшу содержимого: ab/cd/abcd....ext.
+
+        :param digest: SHA-256 содержимого в шестнадцатеричном виде
+        :type digest: str
+        :param extension: расширение файла без точки
+        :type extension: str
+        :return: ключ файла
+        :rtype: str
+        """
+        return f'{digest[:2]}/{digest[2:4]}/{digest}.{extension.lower()}'
+
+    @abstractmethod
+    def save(self, stream: IO[bytes], extension: str) -> str:
+        """
+        Сохраняет файл, если файла с таким содержимым еще нет.
+
+        :param stream: поток с содержимым файла
+        :type stream: IO[bytes]
+        :param extension: расширение файла без точки
+        :type extension: str
+        :return: путь файла для Recipe.file_path
+        :rtype: str
+        """
+
+    def save_file(self, path: str, link: bool = False) -> str:
+        """
+        Сохраняет в хранилище файл с диска, например при импорте рецептов.
+
+        :param path: путь к файлу
+        :type path: str
+        :param link: создать жесткую ссылку вместо копии, если хранилище
+                     это поддерживает
+        :type link: bool
+        :return: путь файла для Recipe.file_path
+        :rtype: str
+        """
+        with open(path, 'rb') as file:
+            return self.save(file, os.path.splitext(path)[1].lstrip('.'))
+
+    @abstractmethod
+    def exists(self, file_path: str) -> bool:
+        """
+        Проверяет, есть ли файл в хранилище.
+
+        :param file_path: путь файла, возвращенный save
+        :type file_path: str
+        :return: результат проверки
+        :rtype: bool
+        """
+
+    @abstractmethod
+    def open(self, file_path: str) -> IO[bytes]:
+        """
+        Открывает файл хранилища для чтения.
+
+        :param file_path: путь файла, возвращенный save
+        :type file_path: str
+        :return: поток с содержимым файла
+        :rtype: IO[bytes]
+        """
+
+
+class LocalStorage(UploadStorage):
+    """
+    Хранилище в каталоге root на диске. Временные файлы загрузки
+    создаются в root/.tmp, на той же файловой системе, поэтому перемещение
+    файла в хранилище - атомарное переименование.
+
+    :param root: каталог хранилища, например static/uploads
+    :type root: str
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.temp_dir = os.path.join(root, '.tmp')
+        os.makedirs(self.temp_dir, exist_ok=True)
+
+    def save(self, stream: IO[bytes], extension: str) -> str:
+        temp = stream if isinstance(stream, HashingFile) \
+            else HashingFile(self.temp_dir)
+        try:
+            if temp is not stream:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    temp.write(chunk)
+            temp.flush()
+            file_path = os.path.join(
+                self.root, self.key(temp.sha256.hexdigest(), extension)
+            )
+            if not os.path.exists(file_path):
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                os.replace(temp.name, file_path)
+            return file_path
+        finally:
+            # Временный файл удаляется, если он не перемещен в хранилище
+            # (такой файл уже есть или произошла ошибка). Файл загрузки
+            # закрывает Werkzeug в конце запроса.
+            if temp is not stream:
+                temp.close()
+
+    def save_file(self, path: str, link: bool = False) -> str:
+        if not link:
+            return super().save_file(path, link)
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        file_path = os.path.join(self.root, self.key(
+            digest.hexdigest(), os.path.splitext(path)[1].lstrip('.')
+        ))
+        if not os.path.exists(file_path):
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            try:
+                os.link(path, file_path)
+            except FileExistsError:
+                pass
+            except OSError:
+                # Другая файловая система: жесткая ссылка невозможна.
+                return super().save_file(path, link)
+        return file_path
+
+    def exists(self, file_path: str) -> bool:
+        return os.path.isfile(file_path)
+
+    def open(self, file_path: str) -> IO[bytes]:
+        return open(file_path, 'rb')
+
+
+class MemoryStorage(UploadStorage):
+    """
+    Хранилище в памяти процесса для тестов.
+    """
+
+    def __init__(self):
+        self.files = {}
+
+    def save(self, stream: IO[bytes], extension: str) -> str:
+        stream.seek(0)
+        data = stream.read()
+        file_path = os.path.join(
+            'memory', self.key(hashlib.sha256(data).hexdigest(), extension)
+        )
+        self.files.setdefault(file_path, data)
+        return file_path
+
+    def exists(self, file_path: str) -> bool:
+        return file_path in self.files
+
+    def open(self, file_path: str) -> IO[bytes]:
+        return io.BytesIO(self.files[file_path])
+
+
+def create_storage(config: dict) -> UploadStorage:
+    """
+    Создает хранилище по настройке UPLOAD_STORAGE: 'local' (каталог
+    UPLOAD_FOLDER) или 'memory'.
+
+    :param config: конфигурация приложения
+    :type config: dict
+    :return: хранилище
+    :rtype: UploadStorage
+    """
+    if config['UPLOAD_STORAGE'] == 'memory':
+        return MemoryStorage()
+    return LocalStorage(config['UPLOAD_FOLDER'])
+
+
+upload_storage = create_storage(app.config)
+app.request_class = UploadRequest
+
+
+@app.after_request
+def immutable_uploads(response):
+    """
+    Добавляет к ответам с загруженными файлами заголовки бессрочного
+    кэширования: содержимое файла по одному адресу не меняется.
+
+    :param response: HTTP-ответ
+    :type response: flask.wrappers.Response
+    :return: HTTP-ответ
+    :rtype: flask.wrappers.Response
+    """
+    filename = (request.view_args or {}).get('filename', '')
+    if request.endpoint == 'static' and filename.startswith('uploads/') \
+            and response.status_code in (200, 304):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = 365 * 24 * 3600
+        response.cache_control.immutable = True
+    return response
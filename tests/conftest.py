@@ -0,0 +1,67 @@
+"""
+Общие фикстуры тестов.
+
+Приложение настраивается через переменные окружения FLASK_* до импорта
+модулей проекта: тесты работают с временной базой данных и хранят
+загруженные файлы в памяти.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+_temp_dir = tempfile.mkdtemp(prefix='recipes-tests-')
+os.environ.update({
+    'FLASK_SECRET_KEY': 'tests',
+    'FLASK_SQLALCHEMY_DATABASE_URI':
+        f'sqlite:///{os.path.join(_temp_dir, "database.db")}',
+    'FLASK_UPLOAD_STORAGE': 'memory',
+    'FLASK_RATELIMIT_ENABLED': 'false',
+    'FLASK_ASSETS_BUILD_ON_START': 'false',
+    'FLASK_TEMPLATE_BYTECODE_CACHE': 'false',
+    'FLASK_PAGE_CACHE_ENABLED': 'false',
+    # Строка через запятую, а не JSON: так проверяется разбор настройки.
+    'FLASK_PROFILE_ADMINS': 'root12,alice1',
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import controller  # noqa: E402,F401
+from app import app as flask_app, db  # noqa: E402
+from models import User, user_cache  # noqa: E402
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_temp_dir, ignore_errors=True)
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+        user_cache.clear()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    """
+    Создает пользователя и входит под ним в client.
+    """
+    def login(name: str) -> User:
+        user = User.create(
+            login=name, email=f'{name}@example.com', password='-'
+        )
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user.id)
+            session['_fresh'] = True
+        return user
+    return login
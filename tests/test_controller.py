@@ -0,0 +1,113 @@
+import pytest
+
+from app import db
+from categories import CATEGORIES
+from jobs import enqueue
+from models import Recipe
+
+LEGACY = CATEGORIES[0]
+
+
+def test_legacy_category_redirect(client):
+    response = client.get(f'/{LEGACY.legacy_path}/')
+    assert response.status_code == 301
+    assert response.location == f'/category/{LEGACY.slug}/'
+
+
+def test_legacy_category_keeps_slug_param(client):
+    response = client.get(f'/{LEGACY.legacy_path}/?slug=x')
+    assert response.status_code == 301
+    assert response.location == f'/category/{LEGACY.slug}/?slug=x'
+
+
+def test_legacy_category_keeps_repeated_params(client):
+    response = client.get(
+        f'/{LEGACY.legacy_path}/?tag=a&tag=b&_external=1'
+    )
+    assert response.status_code == 301
+    assert response.location == \
+        f'/category/{LEGACY.slug}/?tag=a&tag=b&_external=1'
+
+
+def test_profile_admins_is_set_of_logins(app):
+    assert app.config['PROFILE_ADMINS'] == frozenset({'root12', 'alice1'})
+
+
+@pytest.mark.parametrize('url', ['/admin/profiles/', '/jobs/stats'])
+def test_admin_login_substring_is_forbidden(client, login, url):
+    login('alice')
+    assert client.get(url).status_code == 403
+
+
+@pytest.mark.parametrize('url', ['/admin/profiles/', '/jobs/stats'])
+def test_admin_pages_allowed_for_admins(client, login, url):
+    login('alice1')
+    assert client.get(url).status_code == 200
+
+
+@pytest.fixture
+def recipes(app):
+    return [
+        Recipe.create(dish_name=f'Суп {number}', food_category=LEGACY.name)
+        for number in range(2)
+    ]
+
+
+@pytest.mark.parametrize('url, query', [
+    (f'/category/{LEGACY.slug}/', 'slug=x'),
+    ('/index/', '_method=x'),
+    ('/index/', '_anchor=x&_external=1&_scheme=javascript'),
+    ('/index/', 'tag=a&tag=b'),
+])
+def test_feed_page_url_keeps_query(client, recipes, url, query):
+    response = client.get(f'{url}?{query}&per_page=1')
+    assert response.status_code == 200
+    html = response.get_data(as_text=True)
+    assert f'href="{url}?{query.replace("&", "&amp;")}&amp;per_page=1' \
+        f'&amp;after=' in html
+
+
+@pytest.fixture
+def failed_job(app):
+    job = enqueue('image_variants', recipe_id=1)
+    job.error = 'Traceback: secret'
+    db.session.commit()
+    return job
+
+
+def test_job_status_forbidden_for_users(client, login, failed_job):
+    login('someone')
+    response = client.get(f'/jobs/{failed_job.id}')
+    assert response.status_code == 403
+    assert b'secret' not in response.data
+
+
+def test_job_status_for_admins(client, login, failed_job):
+    login('root12')
+    response = client.get(f'/jobs/{failed_job.id}')
+    assert response.status_code == 200
+    assert response.json['error'] == 'Traceback: secret'
+
+
+def test_metrics_forbidden_without_token(client, login):
+    assert client.get('/metrics').status_code == 403
+    login('someone')
+    assert client.get('/metrics').status_code == 403
+
+
+def test_metrics_with_token(app, client):
+    app.config['METRICS_TOKEN'] = 'scraper'
+    try:
+        wrong = client.get('/metrics', headers={'Authorization': 'Bearer x'})
+        assert wrong.status_code == 403
+        response = client.get(
+            '/metrics', headers={'Authorization': 'Bearer scraper'}
+        )
+        assert response.status_code == 200
+    finally:
+        app.config['METRICS_TOKEN'] = None
+
+
+def test_metrics_for_admins(client, login):
+    login('root12')
+    assert client.get('/metrics').status_code == 200
@@ -0,0 +1,64 @@
+import pytest
+from sqlalchemy import event
+
+from app import db
+from categories import CATEGORIES
+from models import Recipe
+
+BODY_COLUMNS = ('recipe.ingredients', 'recipe.recipe')
+
+
+@pytest.fixture
+def statements(app):
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, many):
+        captured.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    yield captured
+    event.remove(db.engine, 'before_cursor_execute', capture)
+
+
+@pytest.fixture
+def recipe(app):
+    return Recipe.create(
+        dish_name='Борщ',
+        food_category=CATEGORIES[0].name,
+        cooking_time='1 час',
+        ingredients='свекла - 1 шт.',
+        recipe='Варить',
+    )
+
+
+def _recipe_selects(statements):
+    selects = [statement for statement in statements
+               if statement.startswith('SELECT')
+               and 'FROM recipe' in statement]
+    assert selects
+    return selects
+
+
+def test_feed_skips_body_columns(recipe, statements):
+    db.session.expire_all()
+    page = Recipe.feed()
+    assert [row.id for row in page.items] == [recipe.id]
+    for statement in _recipe_selects(statements):
+        assert not any(column in statement for column in BODY_COLUMNS)
+
+
+def test_index_skips_body_columns(recipe, client, statements):
+    response = client.get('/')
+    assert response.status_code == 200
+    assert 'Борщ' in response.get_data(as_text=True)
+    for statement in _recipe_selects(statements):
+        assert not any(column in statement for column in BODY_COLUMNS)
+
+
+def test_body_columns_are_deferred(recipe, statements):
+    db.session.expire_all()
+    loaded = db.session.get(Recipe, recipe.id)
+    assert not any(column in _recipe_selects(statements)[-1]
+                   for column in BODY_COLUMNS)
+    assert loaded.recipe == 'Варить'
+    assert 'recipe.recipe' in statements[-1]
@@ -0,0 +1,31 @@
+import pytest
+
+from commands import explain_feed_queries
+
+FEED_INDEXES = {
+    'index': 'ix_recipe_created_at',
+    'index_after': 'ix_recipe_created_at',
+    'index_before': 'ix_recipe_created_at',
+    'category': 'ix_recipe_food_category_created_at',
+    'category_after': 'ix_recipe_food_category_created_at',
+    'account': 'ix_recipe_id_user_created_at',
+    'account_after': 'ix_recipe_id_user_created_at',
+}
+
+
+@pytest.fixture
+def plans(app):
+    return explain_feed_queries()
+
+
+def test_all_feeds_explained(plans):
+    assert set(plans) == set(FEED_INDEXES)
+
+
+@pytest.mark.parametrize('feed, index', FEED_INDEXES.items())
+def test_feed_uses_index(plans, feed, index):
+    plan = plans[feed]
+    assert any(f'USING INDEX {index}' in line for line in plan), plan
+    assert 'SCAN recipe' not in plan, plan
+    assert not any('USE TEMP B-TREE FOR ORDER BY' in line
+                   for line in plan), plan
@@ -0,0 +1,25 @@
+import pytest
+
+import ratelimit
+
+
+@pytest.fixture
+def limits(app, monkeypatch):
+    monkeypatch.setattr(ratelimit, 'backend', ratelimit.MemoryBackend())
+    monkeypatch.setitem(app.config, 'RATELIMIT_ENABLED', True)
+    monkeypatch.setitem(app.config, 'RATELIMIT_EXEMPT', ('assets',))
+    monkeypatch.setitem(app.config, 'RATELIMIT_POLICIES', {
+        '*': [{'limit': 1, 'period': 60, 'scope': 'ip'}],
+        'assets': [{'limit': 2, 'period': 60, 'scope': 'ip'}],
+    })
+
+
+def test_exempt_endpoint_keeps_own_policy(client, limits):
+    statuses = [client.get('/assets/missing.css').status_code
+                for _ in range(3)]
+    assert statuses == [404, 404, 429]
+
+
+def test_star_policy_applies_to_other_endpoints(client, limits):
+    statuses = [client.get('/register/').status_code for _ in range(2)]
+    assert statuses == [200, 429]
@@ -0,0 +1,15 @@
+"""
+Точка входа WSGI для запуска приложения в рабочем режиме, например:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Модуль импортирует представления, чтобы зарегистрировать маршруты
+приложения.
+
+Переменные модуля:
+
+app:
+Объект приложения Flask.
+"""
+import controller  # noqa: F401
+from app import app